@@ -1,30 +1,209 @@
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
+from pathlib import Path
+from urllib.parse import quote
 import logging
+from shared.config import get_config, database_slug
+from shared.instrumentation import stage
+from balance_matrix import BalanceMatrix, PORTFOLIO, CASH
 
-def process_investment_algorithm(running_balances):
+def process_investment_algorithm(running_balances, workers=None, asset_classes=None, horizon=None, executor=None):
     """
     Process the investment algorithm using running balances
+    The running balances are grouped by TransactionClass once and each asset class's series is
+        processed independently, in a process pool when more than one worker is configured.
+    Parameters:
+    -----------
+    running_balances : pandas.DataFrame or BalanceMatrix
+        Running balances from data_processor.load_and_process_data (long) or
+        data_processor.load_balance_matrix (wide)
+    workers : int, optional
+        Number of worker processes (defaults to the ALGORITHM_WORKERS setting). 1 runs serially.
+    asset_classes : list, optional
+        Asset class titles to process (see asset_universe; defaults to every class in the running
+        balances except Portfolio and Cash/Sweep)
+    horizon : tuple, optional
+        (after, until) dates of the run; windows are searched in (after, until] (defaults to
+        get_horizon())
+    executor : concurrent.futures.Executor, optional
+        A long-lived process pool to run the classes in (the service keeps one warm across runs)
+        instead of a pool started for this call
+    Returns:
+    --------
+    pandas.DataFrame
+        The low point windows of all asset classes
     """
-    windows = pd.DataFrame()
-    assets = ['Certificate of Deposit', 'Mutual Fund', 'Commercial Paper', 'Money Market', 'US Treasuries', 'US Agencies']
-    for asset_class in assets:
-        df = running_balances[
-            (running_balances['TransactionClass'] == asset_class) &
-            (running_balances['TransactionDate'] <= '2025-06-30') &
-            (running_balances['TransactionDate'] > '2025-01-21')
-        ][['TransactionDate', 'Available']].rename(
-            columns={'TransactionDate': 'Date', 'Available': 'Balance'}
-        )
-        result = identify_low_points(df)
-        result['Asset Class'] = asset_class
-        windows = pd.concat([windows,result], ignore_index=True)
-        result.sort_values('StartDate', ascending=True)
-    result.sort_values('StartDate', ascending=True).drop(columns=['EndDate'])
+    if workers is None:
+        workers = get_config()['algorithm_workers']
+    after, until = get_horizon() if horizon is None else (pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1]))
+    assets, frames = _class_frames(running_balances, asset_classes, after, until)
+    results = None
+    with stage('low_points', rows_in=sum(len(df) for df in frames)) as record:
+        if (executor is not None or workers > 1) and len(assets) > 1:
+            try:
+                if executor is not None:
+                    results = list(executor.map(_process_asset_class, assets, frames))
+                else:
+                    with ProcessPoolExecutor(max_workers=min(workers, len(assets))) as pool:
+                        results = list(pool.map(_process_asset_class, assets, frames))
+            except (OSError, BrokenProcessPool) as e:
+                logging.warning(f"Process pool unavailable ({e}), processing asset classes serially")
+        if results is None:
+            results = [_process_asset_class(asset_class, df) for asset_class, df in zip(assets, frames)]
+        record['rows_out'] = sum(len(result) for result in results)
+    if not results:
+        return pd.DataFrame(columns=['LowPointDate', 'LowPointBalance', 'StartDate', 'EndDate', 'TimeSpanDays', 'Asset Class'])
+    windows = pd.concat(results, ignore_index=True)
 
     return windows
 
+def update_investment_windows(running_balances, changed_from=None, changed_dates=None, asset_classes=None,
+                              horizon=None, state_dir=None, conn=None, db_config=None):
+    """
+    Incremental form of process_investment_algorithm for runs where only recent days changed
+        (appended forecast days, edited forecast transactions, a horizon rolled forward).
+    Each asset class's LowPointState is loaded from state_dir, updated from the first changed
+        date only and saved back, so the low point chain before that date is reused. The states
+        are kept per database: tenants with the same class titles don't share them.
+    Parameters:
+    -----------
+    running_balances : pandas.DataFrame or BalanceMatrix
+        Running balances as for process_investment_algorithm
+    changed_from : date-like, optional
+        Earliest date whose balance changed since the previous run
+    changed_dates : iterable, optional
+        The changed dates (changed_from is their minimum). Without either, the changes are
+            detected by comparing the balances with the persisted state.
+    asset_classes, horizon :
+        As for process_investment_algorithm
+    state_dir : str or Path, optional
+        Directory of the states (defaults to the LOW_POINT_STATE_DIR setting)
+    conn : connection, optional
+        Connection of the database the balances come from (the states are kept in a subdirectory
+        per host, port and database, see shared.config.database_key)
+    db_config : dict, optional
+        Connection params of that database when no connection is passed (see get_db_settings)
+    Returns:
+    --------
+    pandas.DataFrame
+        The low point windows of all asset classes, equal to process_investment_algorithm's
+    """
+    if changed_dates is not None and len(changed_dates):
+        changed_from = min(pd.Timestamp(changed_date) for changed_date in changed_dates)
+    state_dir = Path(state_dir or get_config()['low_point_state_dir']) / database_slug(conn, db_config)
+    after, until = get_horizon() if horizon is None else (pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1]))
+    assets, frames = _class_frames(running_balances, asset_classes, after, until)
+    results = []
+    with stage('low_points', rows_in=sum(len(df) for df in frames)) as record:
+        for asset_class, df in zip(assets, frames):
+            path = state_dir / f"{quote(asset_class, safe='')}.npz"
+            state = LowPointState.load(path)
+            result, state = identify_low_points_incremental(df, state, changed_from)
+            state.save(path)
+            result['Asset Class'] = asset_class
+            results.append(result)
+        record['rows_out'] = sum(len(result) for result in results)
+    if not results:
+        return pd.DataFrame(columns=['LowPointDate', 'LowPointBalance', 'StartDate', 'EndDate', 'TimeSpanDays', 'Asset Class'])
+    return pd.concat(results, ignore_index=True)
+
+def get_horizon(start=None, end=None, days=None, today=None):
+    """
+    The (after, until) dates of a run; windows are searched from the day after `after` to `until`.
+    Explicit bounds come from the arguments or the HORIZON_START/HORIZON_END settings. A missing
+        bound is `days` (HORIZON_DAYS) away from the other one, and without either bound the
+        horizon rolls forward from today.
+    Returns:
+        tuple: (after, until) as pandas.Timestamp
+    """
+    config = get_config()
+    start = start or config['horizon_start']
+    end = end or config['horizon_end']
+    days = timedelta(days=days or config['horizon_days'])
+    if start is None and end is None:
+        start = pd.Timestamp(today) if today is not None else pd.Timestamp.today()
+    if start is not None:
+        start = pd.Timestamp(start).normalize()
+    if end is not None:
+        end = pd.Timestamp(end).normalize()
+    return (start if start is not None else end - days), (end if end is not None else start + days)
+
+def asset_universe(asset_classes, only=None):
+    """
+    The asset class titles a run processes: the AssetClass table (from load_asset_classes) without
+        Portfolio and Cash/Sweep, limited to `only` (defaults to the ASSET_CLASSES setting)
+    """
+    only = only if only is not None else get_config()['asset_classes']
+    titles = [title for title in asset_classes['AssetClassTitle'] if title not in (PORTFOLIO, CASH)]
+    if only is not None:
+        unknown = set(only) - set(titles)
+        if unknown:
+            logging.warning(f"Unknown asset classes ignored: {', '.join(sorted(unknown))}")
+        titles = [title for title in titles if title in set(only)]
+    return titles
+
+def _class_frames(running_balances, asset_classes, after, until):
+    """
+    The asset classes to process and their Date/Balance frames within (after, until]; classes
+        without balances in the horizon are logged and left out
+    """
+    if isinstance(running_balances, BalanceMatrix):
+        classes = list(running_balances.classes)
+    else:
+        classes = list(pd.unique(running_balances['TransactionClass'].dropna()))
+    assets = [title for title in (classes if asset_classes is None else asset_classes) if title not in (PORTFOLIO, CASH)]
+    if isinstance(running_balances, BalanceMatrix):
+        frames = _matrix_frames(running_balances, assets, after, until)
+    else:
+        # Compare datetime64 values, not strings
+        dates = running_balances['TransactionDate'].to_numpy(dtype='datetime64[ns]')
+        in_horizon = running_balances[(dates > after.to_datetime64()) & (dates <= until.to_datetime64())]
+        groups = dict(tuple(in_horizon.groupby('TransactionClass', sort=False, observed=True)))
+        frames = [
+            groups.get(asset_class, in_horizon.iloc[:0])[['TransactionDate', 'Available']].rename(
+                columns={'TransactionDate': 'Date', 'Available': 'Balance'}
+            )
+            for asset_class in assets
+        ]
+    # Classes without balances in the horizon have no windows
+    missing = [asset_class for asset_class, df in zip(assets, frames) if df.empty]
+    if missing:
+        logging.info(f"No running balances between {after:%Y-%m-%d} and {until:%Y-%m-%d} for: {', '.join(missing)}")
+        assets = [asset_class for asset_class, df in zip(assets, frames) if not df.empty]
+        frames = [df for df in frames if not df.empty]
+    return assets, frames
+
+def _matrix_frames(matrix, assets, after, until):
+    """
+    Date/Balance frames of the asset classes within (after, until] read from a BalanceMatrix.
+    The horizon is a row range of the sorted dates, so each class's balances are a contiguous
+        slice of its Available column; only cells without a running balance row are dropped.
+    """
+    start, end = matrix.dates.searchsorted([after, until], side='right')
+    dates = matrix.dates[start:end]
+    frames = []
+    for asset_class in assets:
+        j = matrix.position(asset_class)
+        if j is None:
+            frames.append(pd.DataFrame({'Date': dates[:0], 'Balance': np.empty(0)}))
+            continue
+        balances = matrix.available[start:end, j]
+        present = matrix.present[start:end, j]
+        if present.all():
+            frames.append(pd.DataFrame({'Date': dates, 'Balance': balances}))
+        else:
+            frames.append(pd.DataFrame({'Date': dates[present], 'Balance': balances[present]}))
+    return frames
+
+def _process_asset_class(asset_class, df):
+    """Identify the low point windows of one asset class (runs in a worker process)."""
+    result = identify_low_points(df)
+    result['Asset Class'] = asset_class
+    return result
+
 def identify_low_points(df, asset_class ='Asset Class', min_days=2):
     """
     This function identifies low points in a time series df and creates time intervals from
@@ -51,76 +230,232 @@ def identify_low_points(df, asset_class ='Asset Class', min_days=2):
     # Get the maximum date in the dataset (end of all intervals)
     max_date = df['Date'].max()
     min_date = df['Date'].min()
-    # Find local minima (low points) in reverse chronological order
-    dates = df['Date'].tolist()
-    balances = df['Balance'].tolist()
-    local_minima = []
-    # Track unique balance values we've already seen to avoid duplicates
-    seen_balances = set()
-    for i in range(len(df) - 1, -1, -1):  # Iterate from end to start
-        current_date = dates[i]
-        current_balance = balances[i]
-        # Skip the maximum date (we'll always end there)
-        if current_date == max_date:
-            continue
-        # Check if this is a local minimum by looking at adjacent points
-        is_local_min = True
-        # Check if the current point is lower than all future points
-        for j in range(i + 1, len(df)):
-            if balances[j] < current_balance:
-                is_local_min = False
-                break
-        if is_local_min and current_balance not in seen_balances:
-            local_minima.append((current_date, current_balance))
-            seen_balances.add(current_balance)
-    # Sort local minima from latest to earliest
-    local_minima.sort(key=lambda x: x[0], reverse=True)
+    # Find local minima (low points) in a single backward pass over the balances
+    dates = df['Date'].to_numpy()
+    balances = df['Balance'].to_numpy()
+    # Rows on the maximum date are skipped (we'll always end there)
+    low_mask, span_min = find_low_points(balances, dates == max_date)
+    # Low points from latest to earliest
+    return _low_point_windows(dates, balances, np.flatnonzero(low_mask)[::-1], max_date, min_date, min_days)
+
+def _low_point_windows(dates, balances, low_idx, max_date, min_date, min_days):
+    """
+    The windows of identify_low_points from its low points (positions from latest to earliest):
+        one window per low point to the maximum date, plus the full span when the absolute
+        minimum isn't one of them
+    """
+    # Calculate time spans (+1 to include both start and end dates)
+    time_spans = (max_date.to_datetime64() - dates[low_idx]) // np.timedelta64(1, 'D') + 1
+    # Check if time span meets minimum requirement
+    low_idx = low_idx[time_spans >= min_days]
+    time_spans = time_spans[time_spans >= min_days]
+    # The minimum balance in each span is the suffix minimum at its low point
+    # span_min_balance = span_min[low_idx]
     # Find the absolute minimum for the entire period
-    absolute_min_idx = df['Balance'].idxmin()
-    absolute_min_date = df.loc[absolute_min_idx, 'Date']
-    absolute_min_balance = df.loc[absolute_min_idx, 'Balance']
-    # Process local minima to create time intervals
-    results = []
-    # Add intervals from each low point to max_date
-    for i, (low_date, low_balance) in enumerate(local_minima):
-        # Start date is the low point
-        start_date = low_date
-        # End date is always the maximum date
-        end_date = max_date
-        # Calculate time span
-        time_span = (end_date - start_date).days + 1  # +1 to include both start and end dates
-        # Check if time span meets minimum requirement
-        if time_span >= min_days:
-            # Find the minimum balance in this time span
-            span_min_balance = df[(df['Date'] >= start_date) &
-                                 (df['Date'] <= end_date)]['Balance'].min()
-            results.append({
-                'LowPointDate': low_date,
-                'LowPointBalance': low_balance,
-                'StartDate': start_date,
-                'EndDate': end_date,
-                'TimeSpanDays': time_span #,
-                # 'MinimumBalanceInSpan': span_min_balance
-            })
-    # Check if the absolute minimum is already in our results by balance value
-    absolute_min_already_included = absolute_min_balance in [res['LowPointBalance'] for res in results]
+    absolute_min_pos = np.nanargmin(balances)
+    absolute_min_balance = balances[absolute_min_pos]
     # Always add the full time interval (min_date to max_date)
     # containing the absolute minimum balance if not already captured
-    if not absolute_min_already_included:
+    if not (balances[low_idx] == absolute_min_balance).any():
         full_span = (max_date - min_date).days + 1
-        results.append({
-            'LowPointDate': absolute_min_date,
-            'LowPointBalance': absolute_min_balance,
-            'StartDate': min_date,
-            'EndDate': max_date,
-            'TimeSpanDays': full_span #,
-            # 'MinimumBalanceInSpan': absolute_min_balance
-        })
+        low_dates = dates[np.append(low_idx, absolute_min_pos)]
+        start_dates = np.append(dates[low_idx], dates[:1])
+        time_spans = np.append(time_spans, full_span)
+        low_idx = np.append(low_idx, absolute_min_pos)
+    else:
+        low_dates = start_dates = dates[low_idx]
+    results = {
+        'LowPointDate': low_dates,
+        'LowPointBalance': balances[low_idx],
+        'StartDate': start_dates,
+        'EndDate': max_date,
+        'TimeSpanDays': time_spans.astype(np.int64) #,
+        # 'MinimumBalanceInSpan': span_min[low_idx]
+    }
     # Convert results to DataFrame and sort by time span (ascending)
-    if results:
+    if len(low_idx):
         result_df = pd.DataFrame(results)
         result_df = result_df.sort_values('TimeSpanDays')
         return result_df
     else:
         return pd.DataFrame(columns=['LowPointDate', 'LowPointBalance',
-                                    'StartDate', 'EndDate', 'TimeSpanDays'])
\ No newline at end of file
+                                    'StartDate', 'EndDate', 'TimeSpanDays'])
+
+def find_low_points(balances, skip):
+    """
+    Flags the points that are lower than everything after them in O(n).
+    This is the vectorized form of the backward scan in identify_low_points: one reverse
+        cumulative minimum (suffix minimum) replaces the per-point look-ahead.
+    A point is a low point when its balance is <= every later balance and strictly below every
+        later balance that is not skipped. The strict part is the seen-balance de-duplication:
+        of several equal low balances only the latest one is kept.
+    NaN balances behave like the original comparisons: they never disqualify a point, and a NaN
+        point itself is always flagged.
+    Parameters:
+    -----------
+    balances : numpy.ndarray
+        Balances in chronological order
+    skip : numpy.ndarray
+        Boolean mask of trailing points that can't be low points themselves (the maximum date)
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        Boolean low point mask and the suffix minimum (minimum balance from each point to the end)
+    """
+    values = np.where(np.isnan(balances), np.inf, balances) if balances.dtype.kind == 'f' else balances
+    # Reverse cumulative minimum: suffix_min[i] = min(values[i:])
+    suffix_min = np.minimum.accumulate(values[::-1])[::-1]
+    n_body = len(values) - int(np.count_nonzero(skip))
+    # Minimum of the skipped tail and of the later non-skipped points
+    tail_min = suffix_min[n_body] if n_body < len(values) else np.inf
+    body_min = np.minimum.accumulate(values[n_body - 1::-1])[::-1] if n_body else values[:0]
+    next_body_min = np.append(body_min[1:], np.inf)
+    mask = np.zeros(len(values), dtype=bool)
+    mask[:n_body] = (values[:n_body] <= tail_min) & (values[:n_body] < next_body_min)
+    if balances.dtype.kind == 'f':
+        mask[:n_body] |= np.isnan(balances[:n_body])
+    return mask, suffix_min
+
+def identify_low_points_incremental(df, state=None, changed_from=None, min_days=2):
+    """
+    identify_low_points reusing the LowPointState of a previous run of the same series.
+    Rows dated before changed_from are taken as unchanged: their suffix minima and low point flags
+        come from the state and only the affected part of the chain is recomputed (see
+        LowPointState.update). Without a state the series is processed in full.
+    Returns:
+        tuple: (windows DataFrame as identify_low_points returns it, the updated LowPointState)
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'])
+    df = df.sort_values('Date')
+    dates = df['Date'].to_numpy()
+    balances = df['Balance'].to_numpy()
+    if state is None:
+        state = LowPointState.build(dates, balances)
+    else:
+        state = state.update(dates, balances, changed_from)
+    return _low_point_windows(dates, balances, state.low_points()[::-1],
+                              df['Date'].max(), df['Date'].min(), min_days), state
+
+class LowPointState:
+    """
+    The persisted suffix minimum state of one asset class's series, from which its low points are
+        updated when only a tail of the series changes.
+    The body is the series without the rows on the maximum date (find_low_points' skip). A body
+        point is a candidate when it is strictly below every later body point (or NaN); the low
+        points are the candidates not above the minimum of the maximum-date rows.
+    Attributes:
+        dates: Row dates (datetime64[ns], sorted)
+        balances: Row balances (float64)
+        body_min: Suffix minimum of the body (NaN as +inf), non-decreasing
+        candidates: Positions of the candidates, ascending
+    """
+    def __init__(self, dates, balances, body_min, candidates):
+        self.dates = dates
+        self.balances = balances
+        self.body_min = body_min
+        self.candidates = candidates
+
+    @property
+    def n_body(self):
+        return len(self.body_min)
+
+    @staticmethod
+    def _values(balances):
+        return np.where(np.isnan(balances), np.inf, balances)
+
+    @classmethod
+    def build(cls, dates, balances):
+        """The state of a series processed in full"""
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        balances = np.asarray(balances, dtype=np.float64)
+        empty = cls(dates[:0], balances[:0], balances[:0], np.empty(0, dtype=np.int64))
+        return empty.update(dates, balances, dates[0] if len(dates) else None)
+
+    def update(self, dates, balances, changed_from=None):
+        """
+        The state of the new series given the first changed date.
+        The new series may drop leading days of the old one (a horizon rolled forward), append days
+            and change balances from changed_from on. The old suffix minima stay valid before the
+            first changed (or appended, or previously maximum-date) row; of those only the tail
+            that equals the old boundary minimum (if the new one is higher) or exceeds the new one
+            (if lower) is rewritten, as are the candidate flags from there on.
+        Args:
+            dates: Sorted row dates of the new series
+            balances: Row balances of the new series
+            changed_from: Earliest changed date; None compares the balances with the state's
+        Returns:
+            LowPointState: A new state (self is left unchanged)
+        """
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        balances = np.asarray(balances, dtype=np.float64)
+        n = len(dates)
+        n_body = n - int(np.count_nonzero(dates == dates[-1])) if n else 0
+        # Position of the new first day in the old series (leading days dropped)
+        offset = int(np.searchsorted(self.dates, dates[0])) if n else 0
+        if not n or offset >= len(self.dates) or self.dates[offset] != dates[0]:
+            offset, reusable = 0, 0
+        else:
+            old_dates = self.dates[offset:]
+            reusable = max(min(len(old_dates), n, self.n_body - offset), 0)
+            same = old_dates[:reusable] == dates[:reusable]
+            if changed_from is None:
+                old_balances = self.balances[offset:offset + reusable]
+                same &= (old_balances == balances[:reusable]) | (np.isnan(old_balances) & np.isnan(balances[:reusable]))
+            else:
+                reusable = min(reusable, int(np.searchsorted(dates, np.datetime64(pd.Timestamp(changed_from), 'ns'))))
+                same = same[:reusable]
+            if not same.all():
+                reusable = int(np.argmin(same))
+        start = min(reusable, n_body)
+        values = self._values(balances[start:n_body])
+        # Suffix minimum of the changed part of the body
+        changed_min = np.minimum.accumulate(values[::-1])[::-1]
+        new_boundary = changed_min[0] if len(changed_min) else np.inf
+        body_min = self.body_min[offset:offset + start].copy()
+        old_boundary = self.body_min[offset + start] if offset + start < self.n_body else np.inf
+        first = start
+        if new_boundary < old_boundary:
+            # Every suffix minimum above the new boundary drops to it
+            first = int(np.searchsorted(body_min, new_boundary, side='right'))
+            body_min[first:] = new_boundary
+        elif new_boundary > old_boundary:
+            # The suffix minima that were the old boundary are recomputed up to the new one
+            first = int(np.searchsorted(body_min, old_boundary, side='left'))
+            tail = np.append(self._values(balances[first:start]), new_boundary)
+            body_min[first:] = np.minimum.accumulate(tail[::-1])[::-1][:-1]
+        body_min = np.concatenate([body_min, changed_min])
+        # A candidate flag depends on its balance and the next suffix minimum
+        first = max(first - 1, 0)
+        kept = self.candidates - offset
+        kept = kept[(kept >= 0) & (kept < first)]
+        next_min = np.append(body_min[first + 1:], np.inf)
+        flags = (self._values(balances[first:n_body]) < next_min) | np.isnan(balances[first:n_body])
+        candidates = np.concatenate([kept, first + np.flatnonzero(flags)])
+        return LowPointState(dates, balances, body_min, candidates)
+
+    def low_points(self):
+        """Positions of the low points, ascending (find_low_points' mask)"""
+        tail = self._values(self.balances[self.n_body:])
+        tail_min = tail.min() if len(tail) else np.inf
+        balances = self.balances[self.candidates]
+        return self.candidates[(balances <= tail_min) | np.isnan(balances)]
+
+    @classmethod
+    def load(cls, path):
+        """Load a persisted state, None if missing"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as arrays:
+            return cls(arrays['dates'], arrays['balances'], arrays['body_min'], arrays['candidates'])
+
+    def save(self, path):
+        """Persist the state (written to a temporary file first, like the balance checkpoint)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(path.name + '.tmp')
+        with open(temporary, 'wb') as state_file:
+            np.savez(state_file, dates=self.dates, balances=self.balances, body_min=self.body_min,
+                     candidates=self.candidates)
+        temporary.replace(path)
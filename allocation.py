@@ -0,0 +1,149 @@
+"""
+Joint allocation of the investment windows of all asset classes under the shared cash.
+Each class's windows are found independently, and their LowPointBalance is the class's Available:
+    min(Cash/Sweep, PolicyMax - RunningTotal) at its low point. Every class is capped by the same
+    Cash/Sweep balance, so the windows of several classes can add up to more than the cash.
+    The allocation assigns each window the amount its class can actually take from its start date
+    to the end of the horizon, with every class within its own windows (and so its PercentMax
+    policy) and all classes together within the lowest cash balance ahead.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from algorithm_processor import get_horizon
+from balance_matrix import BalanceMatrix, CASH
+from shared.instrumentation import instrumented
+
+@instrumented('allocate', rows_in=lambda windows, *args, **kwargs: len(windows))
+def allocate_investment_windows(windows, running_balances, horizon=None, min_days=2):
+    """
+    Assign the windows the amounts their classes invest, jointly across classes.
+    A class's amounts are cumulative like its LowPointBalance: the window starting on date t holds
+        what the class has invested from t to the end of the horizon. A class can add to its
+        holdings on any date a window of any class starts; between two of its low points its
+        Available never falls below the earlier one, so the LowPointBalance of its latest window
+        caps it there. The amounts maximize amount × days over all windows subject to:
+            - a class never holds more than the LowPointBalance of its latest window (its lowest
+              Available, i.e. cash and PercentMax headroom, ahead)
+            - the classes together never hold more than the lowest Cash/Sweep balance ahead
+            - a class never takes back what it invested on an earlier date
+        A class that grows on a date it has no window of its own gets a window starting then, with
+        the LowPointDate and LowPointBalance of the window that caps it. See allocate for the sweep.
+    Args:
+        windows: process_investment_algorithm's windows
+        running_balances: The running balances the windows come from (long frame or BalanceMatrix)
+        horizon: (after, until) dates of the run (defaults to get_horizon())
+        min_days: Minimum number of days of an added window
+    Returns:
+        pandas.DataFrame: The windows and the added ones, by asset class and time span, with an
+            Allocated column
+    """
+    after, until = get_horizon() if horizon is None else (pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1]))
+    if windows.empty:
+        return windows.assign(Allocated=np.empty(0))
+    windows = windows.reset_index(drop=True)
+    cash_dates, cash = _cash_series(running_balances, after, until)
+    class_codes, classes = pd.factorize(windows['Asset Class'])
+    starts = pd.to_datetime(windows['StartDate']).to_numpy(dtype='datetime64[ns]')
+    event_dates, events = np.unique(starts, return_inverse=True)
+    # Lowest cash from each start date to the end of the horizon; no cash known ahead is no cash
+    cash_ahead = np.minimum.accumulate(np.where(np.isnan(cash), np.inf, cash)[::-1])[::-1]
+    cash_ahead = np.append(cash_ahead, 0.0)[cash_dates.searchsorted(event_dates)]
+    cash_ahead[np.isinf(cash_ahead)] = 0.0
+    # Class caps on each start date: the LowPointBalance of the class's latest window started by
+    # then (0 before its first window), NaN balances count as nothing available
+    balances = np.nan_to_num(windows['LowPointBalance'].to_numpy(dtype=np.float64), nan=0.0)
+    source = np.full((len(event_dates), len(classes)), -1)
+    # Of two windows of a class on the same date, the lower balance caps it
+    by_balance = np.argsort(-balances, kind='stable')
+    source[events[by_balance], class_codes[by_balance]] = by_balance
+    latest = np.where(source >= 0, np.arange(len(event_dates))[:, None], -1)
+    np.maximum.accumulate(latest, axis=0, out=latest)
+    source = np.take_along_axis(source, np.maximum(latest, 0), axis=0)
+    caps = np.where(latest >= 0, np.maximum(balances, 0)[source], 0.0)
+    # A class only grows while an added window would still span min_days before its end date
+    ends = pd.to_datetime(windows['EndDate']).to_numpy(dtype='datetime64[ns]')
+    last_start = ends[source] - np.timedelta64(min_days - 1, 'D')
+    grow = (latest >= 0) & (event_dates[:, None] <= last_start)
+    amounts = allocate(caps, cash_ahead, grow)
+    allocated = windows.assign(Allocated=amounts[events, class_codes])
+    # Windows added where a class grows without a window of its own
+    increments = np.diff(amounts, axis=0, prepend=0.0)
+    own = np.zeros(amounts.shape, dtype=bool)
+    own[events, class_codes] = True
+    added_events, added_classes = np.nonzero((increments > 0) & ~own)
+    if len(added_events):
+        added = windows.iloc[source[added_events, added_classes]].reset_index(drop=True)
+        added['StartDate'] = event_dates[added_events]
+        added['TimeSpanDays'] = ((ends[source[added_events, added_classes]] - event_dates[added_events])
+                                 // np.timedelta64(1, 'D') + 1).astype(windows['TimeSpanDays'].dtype)
+        added['Allocated'] = amounts[added_events, added_classes]
+        allocated = pd.concat([allocated, added], ignore_index=True)
+    order = np.lexsort((allocated['TimeSpanDays'].to_numpy(), pd.Categorical(allocated['Asset Class'], categories=classes).codes))
+    allocated = allocated.iloc[order].reset_index(drop=True)
+    logging.info(f"Allocated {amounts[-1].sum():,.2f} of {caps[-1].sum():,.2f} available across {len(classes)} "
+                 f"asset classes ({len(added_events)} windows added, amount × days "
+                 f"{_score(allocated, 'Allocated'):,.0f} of {_score(windows, 'LowPointBalance'):,.0f})")
+    return allocated
+
+def allocate(caps, cash, grow=None):
+    """
+    Sweep-line greedy of the allocation, over the dates a window starts on.
+    Every unit invested on a date earns the days left to the end of the horizon, so the best
+        allocation invests as much as possible as early as possible. On each date the classes
+        together can hold at most min(cash ahead, sum of their caps); both grow from date to date
+        (they are minima over what is ahead), and the headroom the classes keep above what they
+        already hold always covers the growth. Investing that total on every date is therefore
+        feasible and optimal, whatever the split: the growth is shared in proportion to each
+        class's headroom. Each step is one vector operation over the classes.
+    Args:
+        caps: (dates, classes) caps of each class
+        cash: (dates,) nondecreasing cash ahead
+        grow: Optional (dates, classes) mask of the dates a class can add to its holdings on (the
+            optimality above holds when a class can grow on every date up to the last)
+    Returns:
+        numpy.ndarray: (dates, classes) cumulative amount of each class on each date
+    """
+    caps = np.asarray(caps, dtype=np.float64)
+    # A cap never falls later on, what a class holds can't exceed its later caps
+    caps = np.minimum.accumulate(caps[::-1], axis=0)[::-1]
+    cash = np.asarray(cash, dtype=np.float64)
+    amounts = np.empty(caps.shape)
+    held = np.zeros(caps.shape[1])
+    headroom = np.empty(caps.shape[1])
+    for e in range(len(caps)):
+        np.subtract(caps[e], held, out=headroom)
+        np.maximum(headroom, 0, out=headroom)
+        if grow is not None:
+            headroom[~grow[e]] = 0
+        room = headroom.sum()
+        free = cash[e] - held.sum()
+        if room > 0 and free > 0:
+            held = held + headroom * min(free / room, 1.0)
+        amounts[e] = held
+    return amounts
+
+def _cash_series(running_balances, after, until):
+    """The horizon's dates and Cash/Sweep balances (floored at 0, NaN on days without a balance)"""
+    if isinstance(running_balances, BalanceMatrix):
+        start, end = running_balances.dates.searchsorted([after, until], side='right')
+        j = running_balances.position(CASH)
+        if j is None or not running_balances.present[start:end, j].any():
+            raise ValueError(f'No {CASH} running balances between {after:%Y-%m-%d} and {until:%Y-%m-%d}')
+        cash = np.where(running_balances.present[start:end, j], running_balances.running_total[start:end, j], np.nan)
+        return running_balances.dates[start:end].to_numpy(dtype='datetime64[ns]'), np.maximum(cash, 0)
+    dates = running_balances['TransactionDate'].to_numpy(dtype='datetime64[ns]')
+    rows = ((running_balances['TransactionClass'] == CASH).to_numpy()
+            & (dates > after.to_datetime64()) & (dates <= until.to_datetime64()))
+    if not rows.any():
+        raise ValueError(f'No {CASH} running balances between {after:%Y-%m-%d} and {until:%Y-%m-%d}')
+    cash = pd.Series(running_balances['RunningTotal'].to_numpy(dtype=np.float64)[rows], index=dates[rows])
+    cash = cash.groupby(level=0).min()
+    return cash.index.to_numpy(dtype='datetime64[ns]'), np.maximum(cash.to_numpy(), 0)
+
+def _score(windows, column):
+    """Amount × days of cumulative per-class amounts (each window adds to its class's earlier windows)"""
+    ordered = windows.sort_values(['Asset Class', 'StartDate'], kind='stable')
+    amounts = ordered[column].astype(float).fillna(0).clip(lower=0)
+    increments = amounts.groupby(ordered['Asset Class'], sort=False).diff().fillna(amounts)
+    return float((increments * ordered['TimeSpanDays']).sum())
@@ -0,0 +1,132 @@
+import pandas as pd
+import numpy as np
+
+# Classes whose Investable and Available are their own running total
+PORTFOLIO = 'Portfolio'
+CASH = 'Cash/Sweep'
+
+class BalanceMatrix:
+    """
+    Running balances as a date × asset class float64 matrix.
+    This is the wide form of the long running balance frame of load_and_process_data: one row per
+        date, one column per TransactionClass (a categorical index). The matrices are stored in
+        column-major (Fortran) order, so the series of one class is a contiguous column slice that
+        the algorithm reads without copying.
+    compute() derives PolicyMax, Investable and Available for every cell with broadcast array
+        operations against the Portfolio and Cash/Sweep columns, replacing the filter-and-merge
+        passes of the long frame. to_long() converts back to the long layout.
+    Attributes:
+        dates: pandas.DatetimeIndex of the rows (sorted)
+        classes: pandas.CategoricalIndex of the columns
+        running_total, policy_max, investable, available: float64 matrices (dates × classes)
+        percent_max: float64 PercentMax per class
+        present: Boolean matrix of the cells that have a running balance row
+    """
+    def __init__(self, dates, classes, running_total, present=None):
+        self.dates = pd.DatetimeIndex(dates)
+        titles = list(classes)
+        # Column j is category code j
+        self.classes = pd.CategoricalIndex(titles, categories=titles)
+        self.running_total = np.asfortranarray(running_total, dtype=np.float64)
+        if present is None:
+            present = ~np.isnan(self.running_total)
+        self.present = np.asfortranarray(present, dtype=bool)
+        self.percent_max = self.policy_max = self.investable = self.available = None
+
+    @classmethod
+    def from_long(cls, running_balances, date_column='TransactionDate', class_column='TransactionClass',
+                  value_column='RunningTotal'):
+        """Pivot a long running balance frame (one row per date and class) into a BalanceMatrix"""
+        date_codes, dates = pd.factorize(pd.to_datetime(running_balances[date_column]), sort=True)
+        class_codes, classes = pd.factorize(running_balances[class_column])
+        values = pd.to_numeric(running_balances[value_column]).to_numpy(dtype=np.float64)
+        # Rows without a date or class (code -1) have no cell
+        keep = (date_codes >= 0) & (class_codes >= 0)
+        date_codes, class_codes, values = date_codes[keep], class_codes[keep], values[keep]
+        running_total = np.full((len(dates), len(classes)), np.nan, order='F')
+        running_total[date_codes, class_codes] = values
+        present = np.zeros(running_total.shape, dtype=bool, order='F')
+        present[date_codes, class_codes] = True
+        return cls(dates, classes, running_total, present)
+
+    @property
+    def shape(self):
+        return self.running_total.shape
+
+    @property
+    def nbytes(self):
+        """Memory held by the matrices"""
+        arrays = (self.running_total, self.present, self.policy_max, self.investable, self.available)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def position(self, asset_class):
+        """Column of an asset class, None if it has no running balances"""
+        positions = self.classes.get_indexer([asset_class])
+        return None if positions[0] < 0 else int(positions[0])
+
+    def _class_column(self, asset_class):
+        """Running total of a class (NaN when it has no rows)"""
+        j = self.position(asset_class)
+        if j is None:
+            return np.full(len(self.dates), np.nan)
+        return np.where(self.present[:, j], self.running_total[:, j], np.nan)
+
+    def compute(self, percent_max=None):
+        """
+        Compute PolicyMax, Investable and Available for every date and class.
+            PolicyMax = Portfolio × PercentMax
+            Investable = max(0, PolicyMax - RunningTotal) (max(0, RunningTotal) for Portfolio and Cash/Sweep)
+            Available = max(0, min(Cash/Sweep, Investable)) (max(0, RunningTotal) for Portfolio and Cash/Sweep)
+        Args:
+            percent_max: Dict of PercentMax by asset class title (classes missing from it or with a
+                NaN PercentMax get 1.0)
+        Returns:
+            BalanceMatrix: self
+        """
+        percent_max = percent_max or {}
+        self.percent_max = np.array([percent_max.get(title, np.nan) for title in self.classes], dtype=np.float64)
+        # Classes without a policy (unknown or NULL PercentMax) get 1.0
+        self.percent_max[np.isnan(self.percent_max)] = 1.0
+        portfolio = self._class_column(PORTFOLIO)
+        cash = self._class_column(CASH)
+        self.policy_max = np.empty(self.shape, order='F')
+        np.multiply(portfolio[:, None], self.percent_max[None, :], out=self.policy_max)
+        self.investable = np.empty(self.shape, order='F')
+        np.subtract(self.policy_max, self.running_total, out=self.investable)
+        self.available = np.empty(self.shape, order='F')
+        np.minimum(cash[:, None], self.investable, out=self.available)
+        for title in (PORTFOLIO, CASH):
+            j = self.position(title)
+            if j is not None:
+                self.investable[:, j] = self.available[:, j] = self.running_total[:, j]
+        # Nothing is investable or available below zero
+        np.maximum(self.investable, 0, out=self.investable)
+        np.maximum(self.available, 0, out=self.available)
+        return self
+
+    def column(self, asset_class, field='available'):
+        """The series of one class (a contiguous view of the field's matrix), None if the class is unknown"""
+        j = self.position(asset_class)
+        return None if j is None else getattr(self, field)[:, j]
+
+    def to_long(self):
+        """
+        The matrix in the long layout of load_and_process_data (one row per date and class, in date
+            order), for code that still expects it
+        """
+        rows, columns = np.nonzero(self.present)
+        long = {
+            'TransactionDate': self.dates[rows],
+            'TransactionClass': pd.Categorical.from_codes(columns, dtype=self.classes.dtype),
+            'RunningTotal': self.running_total[rows, columns],
+        }
+        if self.available is not None:
+            long.update({
+                'Portfolio': self._class_column(PORTFOLIO)[rows],
+                'PercentMax': self.percent_max[columns],
+                'PolicyMax': self.policy_max[rows, columns],
+                'CashSweep': self._class_column(CASH)[rows],
+                'Investable': self.investable[rows, columns],
+                'Available': self.available[rows, columns],
+            })
+        return pd.DataFrame(long)
@@ -0,0 +1,141 @@
+import json
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+import pandas as pd
+import numpy as np
+from shared.config import get_config, with_db_session, database_slug
+from data_processor import fetch_data
+
+def build_running_balances(transactions, opening_balances=None, start_date=None, end_date=None):
+    """
+    Build daily running balances per transaction class from raw transaction rows.
+    This is the pandas replacement of the RunningBalanceDayView SQL view: amounts are summed
+        per class and day, laid out on a full daily calendar and accumulated with one cumsum.
+    Parameters:
+    -----------
+    transactions : pandas.DataFrame
+        Transaction rows with 'TransactionDate', 'TransactionClass' and 'Amount' columns
+    opening_balances : dict, optional
+        Balance per TransactionClass before start_date (defaults to 0)
+    start_date, end_date : date-like, optional
+        First and last day of the calendar (default to the transactions' date range)
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per day and class with 'TransactionDate', 'TransactionClass' and 'RunningTotal',
+            in the layout of RunningBalanceDayView
+    """
+    opening_balances = opening_balances or {}
+    dates = pd.to_datetime(transactions['TransactionDate']).dt.normalize()
+    amounts = pd.to_numeric(transactions['Amount']).astype(float)
+    if start_date is None:
+        start_date = dates.min()
+    if end_date is None:
+        end_date = dates.max()
+    classes = sorted(set(transactions['TransactionClass']) | set(opening_balances))
+    calendar = pd.date_range(start_date, end_date, freq='D')
+    # Net amount per day (rows) and class (columns), zero on days without transactions
+    daily = (
+        amounts.groupby([dates, transactions['TransactionClass']]).sum()
+        .unstack(fill_value=0.0)
+        .reindex(index=calendar, columns=classes, fill_value=0.0)
+    )
+    opening = np.array([float(opening_balances.get(transaction_class, 0.0)) for transaction_class in classes])
+    balances = np.cumsum(daily.to_numpy(), axis=0) + opening
+    return pd.DataFrame({
+        'TransactionDate': np.repeat(calendar.to_numpy(), len(classes)),
+        'TransactionClass': np.tile(np.array(classes, dtype=object), len(calendar)),
+        'RunningTotal': balances.ravel(),
+    })
+
+@with_db_session
+def refresh_running_balances(conn=None, checkpoint_path=None, settle_date=None, start_date=None, end_date=None):
+    """
+    Build the running balances of a date range, from the transactions newer than the persisted
+        checkpoint when the range starts after it.
+    The checkpoint holds a watermark date and each class's balance at the end of that day. For a
+        range starting after the watermark only transactions after it are fetched and folded into
+        those balances, so the history before it is never re-read. The checkpoint then moves
+        forward to settle_date: transactions up to that day are treated as final, later (forecast)
+        ones are re-read on every run. Rebuild from scratch (delete the checkpoint) when settled rows are edited.
+    Every class of the checkpoint is carried forward over the whole range, also on days (or
+        runs) without new transactions. A range starting on or before the watermark, or without a
+        start_date (the whole series, as RunningBalanceDayView returns it), needs the history the
+        checkpoint folded away: the balances are then rebuilt from all transactions.
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        checkpoint_path: Checkpoint JSON file (defaults to the BALANCE_CHECKPOINT_DIR setting and
+            the connection's host, port and database)
+        settle_date: Last day treated as final (defaults to yesterday)
+        start_date: First day to return (defaults to the first transaction; a day after the
+            watermark reads only the new transactions)
+        end_date: Last day to return (defaults to the last transaction or settle_date, whichever
+            is later)
+    Returns:
+        pandas.DataFrame: Running balances of the range, in the layout of RunningBalanceDayView
+    """
+    logging.info('Executing balance_processor/refresh_running_balances().')
+    if checkpoint_path is None:
+        checkpoint_path = Path(get_config()['balance_checkpoint_dir']) / f'running_balances_{database_slug(conn)}.json'
+    if settle_date is None:
+        settle_date = date.today() - timedelta(days=1)
+    settle_date = pd.Timestamp(settle_date)
+    start_date = None if start_date is None else pd.Timestamp(start_date)
+    end_date = None if end_date is None else pd.Timestamp(end_date)
+    checkpoint = saved = load_checkpoint(checkpoint_path)
+    if checkpoint and (start_date is None or start_date <= pd.Timestamp(checkpoint['watermark'])):
+        first = 'the first transaction' if start_date is None else f'{start_date:%Y-%m-%d}'
+        logging.info(f"Rebuilding the running balances: {first} is not after the watermark {checkpoint['watermark']}")
+        checkpoint = None
+    table_name = get_config()['transaction_table']
+    columns = '`TransactionDate`, `TransactionClass`, `Amount`'
+    conditions, params = [], []
+    watermark = pd.Timestamp(checkpoint['watermark']) if checkpoint else None
+    if watermark is not None:
+        conditions.append('`TransactionDate` > %s')
+        params.append(watermark.date())
+    if end_date is not None:
+        conditions.append('`TransactionDate` <= %s')
+        params.append(end_date.date())
+    transactions = fetch_data(table_name, columns, ' AND '.join(conditions) or '1', conn=conn, params=params or None)
+    logging.info(f"Fetched {len(transactions)} transactions after {checkpoint['watermark'] if checkpoint else 'the beginning'}")
+    if transactions.empty and watermark is None:
+        return pd.DataFrame(columns=['TransactionDate', 'TransactionClass', 'RunningTotal'])
+    first_day = watermark + timedelta(days=1) if watermark is not None else None
+    if end_date is None:
+        end_date = max(pd.to_datetime(transactions['TransactionDate']).max(), settle_date) if not transactions.empty else settle_date
+    running_balances = build_running_balances(
+        transactions, checkpoint['balances'] if checkpoint else None, start_date=first_day, end_date=end_date
+    )
+    # Move the checkpoint forward to the settled balances (a rebuild ending earlier keeps it)
+    settled = running_balances[running_balances['TransactionDate'] <= settle_date]
+    if not settled.empty and (saved is None or settled['TransactionDate'].max() > pd.Timestamp(saved['watermark'])):
+        last_day = settled['TransactionDate'].max()
+        balances = settled[settled['TransactionDate'] == last_day]
+        save_checkpoint(checkpoint_path, last_day, dict(zip(balances['TransactionClass'], balances['RunningTotal'])))
+    if start_date is not None:
+        running_balances = running_balances[running_balances['TransactionDate'] >= start_date].reset_index(drop=True)
+    return running_balances
+
+def load_checkpoint(path):
+    """Load a running balance checkpoint ({'watermark': 'YYYY-MM-DD', 'balances': {...}}), None if missing"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as checkpoint_file:
+        return json.load(checkpoint_file)
+
+def save_checkpoint(path, watermark, balances):
+    """Persist the balance of each class at the end of the watermark day"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint = {
+        'watermark': pd.Timestamp(watermark).strftime('%Y-%m-%d'),
+        'balances': {transaction_class: float(balance) for transaction_class, balance in balances.items()},
+    }
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w', encoding='utf-8') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    temporary.replace(path)
@@ -0,0 +1,68 @@
+"""
+Memory and time of the Available/Investable transform of the long running balances: the previous
+merge / repeated string mask / np.where version against data_processor.compute_available.
+    python benchmarks/bench_available_transform.py [years] [classes]
+"""
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import data_processor
+from generators import make_running_balances, make_asset_classes
+from reference_data import ReferenceData
+
+def previous_transform(running_balances, percent_max):
+    """The transform as load_and_process_data did it before compute_available (without the zero floor)"""
+    running_balances['TransactionDate'] = pd.to_datetime(running_balances['TransactionDate'])
+    portfolio_balances = running_balances[running_balances['TransactionClass'] == 'Portfolio'].copy()
+    portfolio_balances['RunningTotal'] = pd.to_numeric(portfolio_balances['RunningTotal'])
+    daily_portfolio = portfolio_balances.set_index('TransactionDate')['RunningTotal']
+    running_balances = running_balances.merge(daily_portfolio.reset_index().rename(columns={'RunningTotal': 'Portfolio'}),
+                                              on='TransactionDate', how='left')
+    percent = running_balances['TransactionClass'].map(percent_max)
+    running_balances['PercentMax'] = np.nan_to_num(np.asarray(percent, dtype=np.float64), nan=1.0)
+    running_balances['PolicyMax'] = running_balances['Portfolio'] * running_balances['PercentMax']
+    cash_balances = running_balances[running_balances['TransactionClass'] == 'Cash/Sweep'].copy()
+    cash_balances['RunningTotal'] = pd.to_numeric(cash_balances['RunningTotal'])
+    daily_cash = cash_balances.set_index('TransactionDate')['RunningTotal']
+    running_balances = running_balances.merge(daily_cash.reset_index().rename(columns={'RunningTotal': 'CashSweep'}),
+                                              on='TransactionDate', how='left')
+    running_balances['RunningTotal'] = pd.to_numeric(running_balances['RunningTotal'])
+    running_balances['Investable'] = np.where(
+        (running_balances['TransactionClass'] != 'Portfolio') & (running_balances['TransactionClass'] != 'Cash/Sweep'),
+        running_balances['PolicyMax'] - running_balances['RunningTotal'], running_balances['RunningTotal'])
+    running_balances['Available'] = np.where(
+        (running_balances['TransactionClass'] != 'Portfolio') & (running_balances['TransactionClass'] != 'Cash/Sweep'),
+        np.minimum(running_balances['CashSweep'], running_balances['Investable']), running_balances['RunningTotal'])
+    running_balances[running_balances['TransactionClass'] == 'US Agencies']
+    return running_balances
+
+def measure(transform, running_balances, percent_max):
+    """Wall time and peak traced memory (beyond the input frame) of one call on a fresh copy"""
+    frame = running_balances.copy()
+    tracemalloc.start()
+    start = time.perf_counter()
+    transform(frame, percent_max)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+def main(years=10, classes=100):
+    typed = make_running_balances(years, classes)
+    percent_max = ReferenceData(make_asset_classes(classes)).title_to_percent_max
+    print(f'{years} years × {classes} classes ({len(typed):,} rows, {len(typed) * 6 * 8 / 2 ** 20:.0f} MiB of computed columns)')
+    print(f"{'input':>12} {'transform':>18} {'s':>7} {'peak MiB':>9}")
+    # As the streaming fetch returns them (categorical) and as the untyped fetch did (object titles)
+    for kind, running_balances in (('categorical', typed), ('object', typed.astype({'TransactionClass': object}))):
+        for name, transform in (('previous', previous_transform), ('compute_available', data_processor.compute_available)):
+            elapsed, peak = measure(transform, running_balances, percent_max)
+            print(f'{kind:>12} {name:>18} {elapsed:>7.3f} {peak:>9.0f}')
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,65 @@
+"""
+Memory and time comparison of the long running balance frame (load_and_process_data) and the
+date × asset class BalanceMatrix (load_balance_matrix), from the fetched rows to the windows.
+The database reads are replaced by a synthetic RunningBalanceDayView of years × classes.
+    python benchmarks/bench_balance_matrix.py [years] [classes]
+"""
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import data_processor
+from algorithm_processor import process_investment_algorithm
+from reference_data import ReferenceData
+
+ASSETS = ['Certificate of Deposit', 'Mutual Fund', 'Commercial Paper', 'Money Market', 'US Treasuries', 'US Agencies']
+
+def make_running_balances(years=10, classes=50, seed=0):
+    """Typed view rows (as fetch_running_balances returns them) and the asset classes (as load_asset_classes does)."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-01', periods=365 * years)
+    titles = ['Portfolio', 'Cash/Sweep'] + ASSETS + [f'Asset Class {i}' for i in range(classes - 2 - len(ASSETS))]
+    totals = rng.normal(0, 1e5, (len(dates), len(titles))).cumsum(axis=0) + 5e6
+    running_balances = pd.DataFrame({
+        'TransactionDate': np.repeat(dates.to_numpy(), len(titles)),
+        'TransactionClass': pd.Categorical.from_codes(np.tile(np.arange(len(titles)), len(dates)), categories=titles),
+        'RunningTotal': totals.ravel(),
+    })
+    asset_classes = pd.DataFrame({
+        'AssetClassID': np.arange(1, len(titles) - 1),
+        'AssetClassTitle': titles[2:],
+        'AssetClassPercentMax': np.round(rng.uniform(0.05, 0.5, len(titles) - 2), 2),
+    })
+    return running_balances, asset_classes
+
+def measure(stage):
+    """Wall time and peak traced memory of one call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = stage()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+def main(years=10, classes=50):
+    running_balances, asset_classes = make_running_balances(years, classes)
+    dates = running_balances['TransactionDate'].iloc[[0, -1]].tolist()
+    data_processor.fetch_running_balances = lambda conn=None, **filters: running_balances.copy()
+    reference = ReferenceData(asset_classes)
+    print(f'{years} years × {classes} classes ({len(running_balances):,} rows)')
+    print(f"{'layout':>8} {'load s':>8} {'peak MiB':>9} {'size MiB':>9} {'algo s':>8}")
+    for layout, load in (('long', data_processor.load_and_process_data), ('matrix', data_processor.load_balance_matrix)):
+        balances, elapsed, peak = measure(lambda: load(conn=object(), reference=reference))
+        size = (balances.memory_usage(deep=True).sum() if layout == 'long' else balances.nbytes) / 2 ** 20
+        start = time.perf_counter()
+        process_investment_algorithm(balances, workers=1, horizon=(dates[0], dates[-1]))
+        algorithm = time.perf_counter() - start
+        print(f'{layout:>8} {elapsed:>8.3f} {peak:>9.0f} {size:>9.1f} {algorithm:>8.3f}')
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,79 @@
+"""
+Memory and time benchmark of data_processor.fetch_data: fetchall() into object columns followed by
+the to_datetime/to_numeric fix-ups, against the typed fetchmany stream (stream_frame).
+A synthetic RunningBalanceDayView of n rows (default 10M) is served by a local cursor stand-in
+that builds the connector's row tuples (date, str, Decimal) on demand. Each mode runs in its own
+process so the peak RSS is its own.
+    python benchmarks/bench_fetch_stream.py [rows] [chunk_size]
+"""
+import sys
+import time
+import resource
+import multiprocessing
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data_processor import stream_frame
+
+CLASSES = [f'Asset Class {i}' for i in range(50)]
+DTYPES = {'TransactionDate': 'datetime64[ns]', 'TransactionClass': 'category', 'RunningTotal': 'float64'}
+
+class SyntheticCursor:
+    """Unbuffered cursor stand-in over n synthetic running balance rows."""
+    description = [('TransactionDate',), ('TransactionClass',), ('RunningTotal',)]
+
+    def __init__(self, n):
+        self.n = n
+        self.position = 0
+        self.dates = [date(2000, 1, 1) + timedelta(days=day) for day in range(n // len(CLASSES) + 1)]
+
+    def _rows(self, count):
+        end = min(self.position + count, self.n)
+        rows = [
+            (self.dates[i // len(CLASSES)], CLASSES[i % len(CLASSES)], Decimal(i * 7919 % 100000000).scaleb(-2))
+            for i in range(self.position, end)
+        ]
+        self.position = end
+        return rows
+
+    def fetchmany(self, size):
+        return self._rows(size)
+
+    def fetchall(self):
+        return self._rows(self.n)
+
+def fetch_buffered(cursor, chunk_size):
+    """The former fetch_data path plus the conversions load_and_process_data had to make."""
+    df = pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+    df['TransactionDate'] = pd.to_datetime(df['TransactionDate'])
+    df['RunningTotal'] = pd.to_numeric(df['RunningTotal'])
+    return df
+
+def fetch_streamed(cursor, chunk_size):
+    return stream_frame(cursor, DTYPES, chunk_size)
+
+def run(mode, n, chunk_size, results):
+    cursor = SyntheticCursor(n)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = {'fetchall': fetch_buffered, 'stream': fetch_streamed}[mode](cursor, chunk_size)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((mode, elapsed, (peak - baseline) / 1024, df.memory_usage(deep=True).sum() / 2 ** 20))
+
+def main(n=10_000_000, chunk_size=50000):
+    print(f'{n:,} rows, chunks of {chunk_size:,}')
+    print(f"{'mode':>10} {'seconds':>10} {'peak MiB':>10} {'frame MiB':>10}")
+    results = multiprocessing.Queue()
+    for mode in ('fetchall', 'stream'):
+        process = multiprocessing.Process(target=run, args=(mode, n, chunk_size, results))
+        process.start()
+        mode, elapsed, peak, frame = results.get()
+        process.join()
+        print(f'{mode:>10} {elapsed:>10.2f} {peak:>10.0f} {frame:>10.0f}')
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,46 @@
+"""
+Import time of an entry point from python -X importtime, with an optional budget that fails the
+run (exit status 1) when the median cumulative import time exceeds it or a forbidden module loads.
+    python benchmarks/bench_import_time.py [module] [--runs 5] [--budget-ms 150] [--forbid pandas,numpy]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def import_times(module):
+    """Cumulative import time (µs) by module of one cold import in a fresh interpreter"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.setdefault(name.strip(), int(cumulative))
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('module', nargs='?', default='opportuneIQ')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None)
+    parser.add_argument('--forbid', default='pandas,numpy,mysql.connector,pyarrow')
+    args = parser.parse_args(argv)
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    total = statistics.median(times[args.module] for times in runs) / 1000
+    print(f'import {args.module}: {total:.1f} ms (median of {args.runs}), {len(runs[-1])} modules')
+    for name, cumulative in sorted(runs[-1].items(), key=lambda item: -item[1])[:10]:
+        print(f'  {cumulative / 1000:>8.1f} ms  {name}')
+    failures = [f'{name} is imported' for name in filter(None, args.forbid.split(',')) if name in runs[-1]]
+    if args.budget_ms is not None and total > args.budget_ms:
+        failures.append(f'{total:.1f} ms is over the {args.budget_ms:.0f} ms budget')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
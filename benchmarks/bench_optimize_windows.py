@@ -0,0 +1,38 @@
+"""
+Scaling benchmark for investment_windows.optimize_non_overlapping_windows.
+Times the optimizer on 10³ to 10⁶ random candidate windows over a 10 year horizon.
+    python benchmarks/bench_optimize_windows.py [max_exponent]
+"""
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from investment_windows import optimize_non_overlapping_windows
+
+def make_windows(m, horizon_days=3650, seed=0):
+    """Random candidate windows with the same keys as find_investment_windows output."""
+    rng = np.random.default_rng(seed)
+    starts = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, horizon_days, m), unit='D')
+    days = rng.integers(2, 366, m)
+    ends = starts + pd.to_timedelta(days - 1, unit='D')
+    amounts = np.round(rng.lognormal(13, 1, m), 2)
+    return [
+        {'start_date': start, 'end_date': end, 'amount': amount, 'days': day, 'score': amount * day}
+        for start, end, amount, day in zip(starts, ends, amounts.tolist(), days.tolist())
+    ]
+
+def main(max_exponent=6):
+    print(f"{'candidates':>12} {'seconds':>10} {'us/window':>10} {'chosen':>8}")
+    for exponent in range(3, max_exponent + 1):
+        m = 10 ** exponent
+        windows = make_windows(m)
+        start = time.perf_counter()
+        chosen, total = optimize_non_overlapping_windows(windows)
+        elapsed = time.perf_counter() - start
+        print(f"{m:>12,} {elapsed:>10.3f} {elapsed / m * 1e6:>10.2f} {len(chosen):>8}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 6)
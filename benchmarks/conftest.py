@@ -0,0 +1,33 @@
+import math
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+# The writer benchmarks use the MySQL stand-in of the tests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tests'))
+
+def pytest_terminal_summary(terminalreporter, config):
+    """
+    Print the scaling curve of each benchmark group: mean time per size and the growth exponent
+        (slope of log time over log size, 1.0 = linear) between consecutive sizes
+    """
+    session = getattr(config, '_benchmarksession', None)
+    if session is None or not session.benchmarks:
+        return
+    curves = defaultdict(list)
+    for bench in session.benchmarks:
+        if 'size' in bench.extra_info:
+            curves[bench.group or bench.name].append((bench.extra_info['size'], bench.stats.mean))
+    if not curves:
+        return
+    terminalreporter.section('scaling curves')
+    for group, points in sorted(curves.items()):
+        points.sort()
+        terminalreporter.write_line(group)
+        previous = None
+        for size, mean in points:
+            exponent = ''
+            if previous and size != previous[0]:
+                exponent = f'  exponent {math.log(mean / previous[1]) / math.log(size / previous[0]):.2f}'
+            terminalreporter.write_line(f'  {size:>12,}  {mean * 1000:>10.2f} ms{exponent}')
+            previous = (size, mean)
@@ -0,0 +1,83 @@
+"""
+Seeded generators of realistic treasury data for the benchmark suite.
+The running balances follow a portfolio with a yearly seasonal cycle, payroll dips on the 1st and
+15th of each month, random receipts and a per-class mix: the same seed always gives the same data.
+"""
+import numpy as np
+import pandas as pd
+
+INVESTABLE = ['Certificate of Deposit', 'Mutual Fund', 'Commercial Paper', 'Money Market', 'US Treasuries', 'US Agencies']
+
+def asset_class_titles(classes):
+    """Titles of `classes` investable asset classes (the six real ones first)"""
+    return (INVESTABLE + [f'Asset Class {i}' for i in range(max(classes - len(INVESTABLE), 0))])[:classes]
+
+def make_cash_series(days, start='2025-01-01', seed=0, level=5e6):
+    """
+    Daily cash balance: level × seasonal cycle, payroll dips on the 1st and 15th, lognormal
+        receipts and normal noise, accumulated from the start date
+    Returns:
+        tuple: (pandas.DatetimeIndex, numpy.ndarray of balances)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days, freq='D')
+    day_of_year = dates.dayofyear.to_numpy()
+    seasonal = level * (1 + 0.25 * np.sin(2 * np.pi * (day_of_year - 80) / 365.25))
+    payroll = np.where(np.isin(dates.day.to_numpy(), (1, 15)), -0.08 * level, 0.0)
+    receipts = np.where(rng.random(days) < 0.2, rng.lognormal(np.log(0.02 * level), 0.5, days), 0.0)
+    flows = payroll + receipts - receipts.mean() - payroll.mean() + rng.normal(0, 0.01 * level, days)
+    return dates, np.round(seasonal + np.cumsum(flows), 2)
+
+def make_series(days, seed=0, date_column='Date', balance_column='Balance'):
+    """One class's Date/Balance frame (the input of identify_low_points and find_investment_windows)"""
+    dates, balances = make_cash_series(days, seed=seed)
+    return pd.DataFrame({date_column: dates, balance_column: balances})
+
+def make_running_balances(years=1, classes=6, seed=0, start='2025-01-01'):
+    """
+    RunningBalanceDayView rows as data_processor.fetch_running_balances returns them: one row per
+        day for Portfolio, Cash/Sweep and `classes` investable classes holding a random share of
+        the portfolio (a Dirichlet mix) that drifts over time
+    """
+    rng = np.random.default_rng(seed)
+    days = int(round(365.25 * years))
+    dates, cash = make_cash_series(days, start=start, seed=seed)
+    titles = asset_class_titles(classes)
+    mix = rng.dirichlet(np.ones(classes) * 2)
+    drift = np.cumsum(rng.normal(0, 0.002, (days, classes)), axis=0)
+    holdings = np.maximum(mix * (1 + drift), 0) * cash.mean() * 3
+    portfolio = cash + holdings.sum(axis=1)
+    totals = np.column_stack([portfolio, cash, np.round(holdings, 2)])
+    all_titles = ['Portfolio', 'Cash/Sweep'] + titles
+    return pd.DataFrame({
+        'TransactionDate': np.repeat(dates.to_numpy(), len(all_titles)),
+        'TransactionClass': pd.Categorical.from_codes(np.tile(np.arange(len(all_titles)), days), categories=all_titles),
+        'RunningTotal': totals.ravel(),
+    })
+
+def make_asset_classes(classes=6, seed=0):
+    """The asset classes as data_processor.load_asset_classes returns them"""
+    rng = np.random.default_rng(seed)
+    titles = asset_class_titles(classes)
+    return pd.DataFrame({
+        'AssetClassID': np.arange(1, classes + 1),
+        'AssetClassTitle': titles,
+        'AssetClassGroup': 'Fixed Income',
+        'AssetClassIssuer': None,
+        'AssetClassPercentMax': np.round(rng.uniform(0.05, 0.5, classes), 2),
+        'AssetClassCombined': titles,
+    })
+
+def make_windows(count, classes=6, seed=0):
+    """process_investment_algorithm output with `count` windows spread over the classes"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp('2025-06-30')
+    days = rng.integers(2, 365, count)
+    return pd.DataFrame({
+        'LowPointDate': end - pd.to_timedelta(days - 1, unit='D'),
+        'LowPointBalance': np.round(rng.lognormal(13, 1, count), 2),
+        'StartDate': end - pd.to_timedelta(days - 1, unit='D'),
+        'EndDate': end,
+        'TimeSpanDays': days,
+        'Asset Class': rng.choice(asset_class_titles(classes), count),
+    })
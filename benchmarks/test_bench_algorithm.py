@@ -0,0 +1,32 @@
+import pytest
+from generators import make_series, make_running_balances, make_asset_classes
+from algorithm_processor import identify_low_points, process_investment_algorithm
+from investment_windows import find_investment_windows
+from balance_matrix import BalanceMatrix
+from reference_data import ReferenceData
+
+pytest.importorskip('pytest_benchmark')
+
+@pytest.mark.parametrize('days', [365, 1826, 3652])
+def test_identify_low_points(benchmark, days):
+    df = make_series(days)
+    benchmark.group = 'identify_low_points'
+    benchmark.extra_info['size'] = days
+    benchmark(identify_low_points, df)
+
+@pytest.mark.parametrize('days', [365, 1826, 3652])
+def test_find_investment_windows(benchmark, days):
+    df = make_series(days, date_column='date', balance_column='balance')
+    benchmark.group = 'find_investment_windows top_k=100'
+    benchmark.extra_info['size'] = days
+    benchmark(find_investment_windows, df, top_k=100)
+
+@pytest.mark.parametrize('years, classes', [(1, 6), (5, 25), (10, 100)])
+def test_process_investment_algorithm(benchmark, years, classes):
+    running_balances = make_running_balances(years, classes)
+    reference = ReferenceData(make_asset_classes(classes))
+    matrix = BalanceMatrix.from_long(running_balances).compute(reference.title_to_percent_max)
+    horizon = (matrix.dates[0], matrix.dates[-1])
+    benchmark.group = 'process_investment_algorithm (matrix)'
+    benchmark.extra_info['size'] = matrix.shape[0] * matrix.shape[1]
+    benchmark(process_investment_algorithm, matrix, workers=1, horizon=horizon)
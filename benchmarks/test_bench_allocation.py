@@ -0,0 +1,33 @@
+import functools
+import pytest
+from generators import make_running_balances, make_asset_classes
+from algorithm_processor import process_investment_algorithm
+from allocation import allocate_investment_windows
+from balance_matrix import BalanceMatrix
+from reference_data import ReferenceData
+
+pytest.importorskip('pytest_benchmark')
+
+@functools.lru_cache(maxsize=None)
+def windows_of(years, classes):
+    """The matrix, horizon and windows of years × classes of generated balances (built once per size)"""
+    reference = ReferenceData(make_asset_classes(classes))
+    matrix = BalanceMatrix.from_long(make_running_balances(years, classes)).compute(reference.title_to_percent_max)
+    horizon = (matrix.dates[0], matrix.dates[-1])
+    return matrix, horizon, process_investment_algorithm(matrix, workers=1, horizon=horizon)
+
+@pytest.mark.parametrize('years', [1, 5, 10])
+def test_allocate_by_days(benchmark, years):
+    matrix, horizon, windows = windows_of(years, 100)
+    benchmark.group = 'allocate_investment_windows (100 classes, by days)'
+    benchmark.extra_info['size'] = matrix.shape[0]
+    benchmark.extra_info['windows'] = len(windows)
+    benchmark(allocate_investment_windows, windows, matrix, horizon)
+
+@pytest.mark.parametrize('classes', [10, 100, 1000])
+def test_allocate_by_classes(benchmark, classes):
+    matrix, horizon, windows = windows_of(10, classes)
+    benchmark.group = 'allocate_investment_windows (10 years, by classes)'
+    benchmark.extra_info['size'] = classes
+    benchmark.extra_info['windows'] = len(windows)
+    benchmark.pedantic(allocate_investment_windows, (windows, matrix, horizon), rounds=3)
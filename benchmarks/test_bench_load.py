@@ -0,0 +1,38 @@
+import pytest
+import data_processor
+from generators import make_running_balances, make_asset_classes
+from reference_data import ReferenceData
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [(1, 6), (5, 25), (10, 100)]
+
+@pytest.fixture
+def fetched(monkeypatch, request):
+    """Serves synthetic view rows in place of the database fetch."""
+    years, classes = request.param
+    running_balances = make_running_balances(years, classes)
+    monkeypatch.setattr(data_processor, 'fetch_running_balances', lambda conn=None, **filters: running_balances.copy())
+    return len(running_balances), ReferenceData(make_asset_classes(classes))
+
+@pytest.mark.parametrize('fetched', SIZES, indirect=True)
+def test_load_and_process_data_transform(benchmark, fetched):
+    rows, reference = fetched
+    benchmark.group = 'load_and_process_data post-fetch (long)'
+    benchmark.extra_info['size'] = rows
+    benchmark(data_processor.load_and_process_data, conn=object(), reference=reference)
+
+@pytest.mark.parametrize('fetched', SIZES, indirect=True)
+def test_load_balance_matrix_transform(benchmark, fetched):
+    rows, reference = fetched
+    benchmark.group = 'load_balance_matrix post-fetch (wide)'
+    benchmark.extra_info['size'] = rows
+    benchmark(data_processor.load_balance_matrix, conn=object(), reference=reference)
+
+@pytest.mark.parametrize('years, classes', SIZES)
+def test_compute_available(benchmark, years, classes):
+    running_balances = make_running_balances(years, classes)
+    percent_max = ReferenceData(make_asset_classes(classes)).title_to_percent_max
+    benchmark.group = 'compute_available'
+    benchmark.extra_info['size'] = len(running_balances)
+    benchmark.pedantic(data_processor.compute_available, setup=lambda: ((running_balances.copy(), percent_max), {}), rounds=10)
@@ -0,0 +1,41 @@
+import functools
+import pandas as pd
+import pytest
+import opportuneIQ
+from generators import make_running_balances, make_asset_classes
+from snapshot import write_snapshot
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [(1, 6), (5, 25), (10, 100)]
+
+@functools.lru_cache(maxsize=None)
+def snapshot_of(directory, engine, years, classes):
+    """An embedded database of years × classes of generated balances (built once per size and engine)"""
+    asset_classes = make_asset_classes(classes)
+    running_balances = make_running_balances(years, classes)
+    path = f'{directory}/treasury-{years}y-{classes}c.{engine}'
+    write_snapshot(path, {
+        'RunningBalanceDayView': running_balances,
+        'AssetClass': pd.DataFrame({
+            'ID': asset_classes['AssetClassID'], 'Title': asset_classes['AssetClassTitle'],
+            'Group': asset_classes['AssetClassGroup'], 'Issuer': asset_classes['AssetClassIssuer'],
+            'PercentMax': asset_classes['AssetClassPercentMax'], 'AssetClassParentID': 0,
+        }),
+    }, engine)
+    horizon = (running_balances['TransactionDate'].min(), running_balances['TransactionDate'].max())
+    return path, horizon, len(running_balances)
+
+@pytest.mark.parametrize('engine', ['sqlite', 'duckdb'])
+@pytest.mark.parametrize('years, classes', SIZES)
+def test_offline_pipeline(benchmark, tmp_path_factory, monkeypatch, engine, years, classes):
+    """The whole run (load, algorithm, publish) against an embedded snapshot, no database server needed."""
+    if engine == 'duckdb':
+        pytest.importorskip('duckdb')
+    path, horizon, rows = snapshot_of(str(tmp_path_factory.getbasetemp()), engine, years, classes)
+    monkeypatch.setenv('STORAGE_BACKEND', engine)
+    monkeypatch.setenv('STORAGE_PATH', path)
+    monkeypatch.setenv('RUN_REPORT_DIR', '')
+    benchmark.group = f'run_treasury_forecast offline ({engine})'
+    benchmark.extra_info['size'] = rows
+    benchmark.pedantic(opportuneIQ.run_treasury_forecast, kwargs={'horizon': horizon}, rounds=3)
@@ -0,0 +1,22 @@
+import pytest
+from generators import make_running_balances, make_asset_classes
+from balance_matrix import BalanceMatrix
+from reference_data import ReferenceData
+from scenarios import run_scenarios, horizon_cash_flows, random_scenarios
+
+pytest.importorskip('pytest_benchmark')
+
+@pytest.fixture(scope='module')
+def matrix():
+    reference = ReferenceData(make_asset_classes(6))
+    return BalanceMatrix.from_long(make_running_balances(1, 6)).compute(reference.title_to_percent_max)
+
+@pytest.mark.parametrize('count', [100, 1000, 5000])
+def test_run_scenarios(benchmark, matrix, count):
+    """A 160-day horizon of six asset classes under count random stresses"""
+    horizon = (matrix.dates[0], matrix.dates[160])
+    dates, flows = horizon_cash_flows(matrix, horizon)
+    offsets = random_scenarios(flows, dates, count)
+    benchmark.group = 'run_scenarios (160 days × 6 classes)'
+    benchmark.extra_info['size'] = count
+    benchmark.pedantic(run_scenarios, (matrix, offsets), {'horizon': horizon}, rounds=3)
@@ -0,0 +1,25 @@
+import pytest
+from generators import make_windows, make_asset_classes
+from database_writer import prepare_investment_window_rows, write_results_to_database
+from fake_mysql import FakeMySQL
+from reference_data import ReferenceData
+
+pytest.importorskip('pytest_benchmark')
+
+REFERENCE = ReferenceData(make_asset_classes(6))
+
+@pytest.mark.parametrize('count', [1000, 10000, 100000])
+def test_prepare_investment_window_rows(benchmark, count):
+    windows = make_windows(count)
+    benchmark.group = 'prepare_investment_window_rows'
+    benchmark.extra_info['size'] = count
+    benchmark(prepare_investment_window_rows, windows, REFERENCE)
+
+@pytest.mark.parametrize('count', [1000, 10000])
+def test_write_results_to_database(benchmark, count):
+    """executemany batches against the local MySQL stand-in (a fresh table per round)."""
+    windows = make_windows(count)
+    benchmark.group = 'write_results_to_database (stand-in)'
+    benchmark.extra_info['size'] = count
+    benchmark.pedantic(lambda conn: write_results_to_database(windows, REFERENCE, conn=conn),
+                       setup=lambda: ((FakeMySQL(),), {}), rounds=5)
@@ -1,14 +1,20 @@
-import mysql.connector
-from mysql.connector import Error
 import logging
 import pandas as pd
 import numpy as np
-from shared.config import get_db_connection
+from shared.config import get_config, with_db_session, database_key
+from shared.cache import get_query_cache, query_fingerprint
+from shared.instrumentation import stage, instrumented, count_rows
+from shared.storage import get_backend
+from balance_matrix import BalanceMatrix, PORTFOLIO, CASH
 
-def load_asset_classes():
+@with_db_session
+def load_asset_classes(conn=None, use_cache=True):
     logging.info('Executing data_processor/load_asset_classes().')
     """
     Load asset classes from the database
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        use_cache: Read through the local query cache (see fetch_data)
     Returns:
         pandas.DataFrame: DataFrame containing asset classes
     """
@@ -21,116 +27,260 @@ def load_asset_classes():
     WHERE AssetClassParentID = 0 ) p ON p.ID = a.AssetClassParentID
     WHERE AssetClassParentID = 0 AND a.Title != 'Not Assigned'
     """
-    asset_classes = fetch_data(table_name, '',1,sql)
+    asset_classes = fetch_data(table_name, '',1,sql, conn=conn, use_cache=use_cache)
     asset_classes = asset_classes.rename(columns={'ID': 'AssetClassID', 'Title': 'AssetClassTitle', 'Group': 'AssetClassGroup', 'Issuer': 'AssetClassIssuer', 'PercentMax': 'AssetClassPercentMax'})
+    # PercentMax arrives as Decimal objects (NULL as None), store it as float64 (NULL as NaN)
+    asset_classes['AssetClassPercentMax'] = pd.to_numeric(asset_classes['AssetClassPercentMax']).astype(np.float64)
     return asset_classes
 
-def load_and_process_data():
+@with_db_session
+def load_and_process_data(conn=None, horizon=None, asset_classes=None, reference=None):
     logging.info('Executing data_processor/load_and_process_data().')
     running_balances = pd.DataFrame()
     """
     Load and process data to generate running balances
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        horizon: Optional (after, until) dates to load (see fetch_running_balances)
+        asset_classes: Optional asset class titles to load (see fetch_running_balances)
+        reference: The run's ReferenceData (defaults to reference_data.get_reference_data())
     Returns:
         pandas.DataFrame: DataFrame containing running balances
     """
     # STEP 2(4): Running balance day view taken from the SQL views
     #           Q: Do we want to replace the SQL views with pandas dataframes?
-    table_name = 'RunningBalanceDayView'
-    running_balances = fetch_data(table_name)
+    #           A: RUNNING_BALANCE_SOURCE=transactions builds them with pandas (balance_processor)
+    running_balances = fetch_running_balances(conn=conn, horizon=horizon, asset_classes=asset_classes)
 
-    # Add the daily total portfolio balance to the running balances DataFrame
-    # Convert TransactionDate to datetime if not already
-    running_balances['TransactionDate'] = pd.to_datetime(running_balances['TransactionDate'])
-    # Filter and pivot Portfolio balances
-    portfolio_balances = running_balances[running_balances['TransactionClass'] == 'Portfolio'].copy()
-    portfolio_balances['RunningTotal'] = pd.to_numeric(portfolio_balances['RunningTotal'])
-    # Create a series with daily portfolio balances
-    daily_portfolio = portfolio_balances.set_index('TransactionDate')['RunningTotal']
-    # Add portfolio balance to runningBalances DataFrame
-    running_balances = running_balances.merge(
-        daily_portfolio.reset_index().rename(columns={'RunningTotal': 'Portfolio'}),
-        on='TransactionDate',
-        how='left'
-    )
-    asset_classes = load_asset_classes()
-    # Add the asset class PercentMax column to the running balances DataFrame matching the on TransactionClass column
-    # Create a mapping dictionary from Title to PercentMax
-    percentmax_mapping = dict(zip(asset_classes['AssetClassTitle'], asset_classes['AssetClassPercentMax']))
-    # Update PercentMax in running_balances using the mapping
-    running_balances['PercentMax'] = running_balances['TransactionClass'].map(percentmax_mapping).fillna(1.0)
-    # Convert PercentMax to float
-    # running_balances['PercentMax'] = pd.to_numeric(running_balances['PercentMax'])
-    # Check the PercentMax mapping
-    # percentmax_mapping
-    # running_balances #.info()
-    # Compute the asset class's maximum based on the policy
-    #       NOTE: The PercentMax map() inserts an object instead of a float. The object->float conversion resets the value to 0.0. TODO: Fix this.
-                   # running_balances['PolicyMax'] = 0
-    running_balances['PolicyMax'] = running_balances['Portfolio'] * running_balances['PercentMax'].astype(float)
-    # running_balances.info()
-    # Add the daily available cash balance to the running balances DataFrame
-    # Filter and pivot cash balances
-    cash_balances = running_balances[running_balances['TransactionClass'] == 'Cash/Sweep'].copy()
-    cash_balances['RunningTotal'] = pd.to_numeric(cash_balances['RunningTotal'])
-    # Create a series with daily portfolio balances
-    daily_cash = cash_balances.set_index('TransactionDate')['RunningTotal']
-    # Add portfolio balance to runningBalances DataFrame
-    running_balances = running_balances.merge(
-        daily_cash.reset_index().rename(columns={'RunningTotal': 'CashSweep'}),
-        on='TransactionDate',
-        how='left'
-    )
-    # Add the amount investable column
-    #       if [TransactionClass] <> "Portfolio" && [TransactionClass] <> "Cash/Sweep",
-    #       then [PolicyMax]-[RunningTotal] else [RunningTotal]
-    # Convert RunningTotal to numeric if it's not already
-    running_balances['RunningTotal'] = pd.to_numeric(running_balances['RunningTotal'])
-    # Add Investable column based on the condition
-    running_balances['Investable'] = np.where(
-        (running_balances['TransactionClass'] != 'Portfolio') &
-        (running_balances['TransactionClass'] != 'Cash/Sweep'),
-        running_balances['PolicyMax'] - running_balances['RunningTotal'],
-        running_balances['RunningTotal']
-    )
-    # Add the final available column
-    #       if ([TransactionClass] <> "Portfolio" && [TransactionClass] <> "Cash/Sweep",
-    #       then MIN([CashSweep],[Investable]) else [RunningTotal])
-    running_balances['Available'] = np.where(
-        (running_balances['TransactionClass'] != 'Portfolio') &
-        (running_balances['TransactionClass'] != 'Cash/Sweep'),
-        np.minimum(running_balances['CashSweep'], running_balances['Investable']),
-        running_balances['RunningTotal']
-    )
-    # Test output the final dataframe
+    # Asset classes of the run's reference data (loaded once per process)
+    if reference is None:
+        from reference_data import get_reference_data
+        reference = get_reference_data(conn=conn)
+    running_balances = compute_available(running_balances, reference.title_to_percent_max)
     # Suppress scientific notation by setting float_format
     pd.options.display.float_format = '{:,.0f}'.format
-    # Display the dataframe without scientific notation
-    running_balances[running_balances['TransactionClass'] == 'US Agencies']
     return running_balances
 
+@instrumented('transform', rows_in=lambda running_balances, percent_max: len(running_balances))
+def compute_available(running_balances, percent_max):
+    """
+    The transform stage of the long running balances: adds the daily Portfolio and CashSweep
+        balances and PercentMax, PolicyMax, Investable and Available to every row.
+            PolicyMax = Portfolio × PercentMax
+            Investable = max(0, PolicyMax - RunningTotal) (max(0, RunningTotal) for Portfolio and Cash/Sweep)
+            Available = max(0, min(CashSweep, Investable)) (max(0, RunningTotal) for Portfolio and Cash/Sweep)
+    TransactionClass is made categorical and RunningTotal float64 once (columns already typed by
+        the streaming fetch are not converted). The asset class mask and the per-class PercentMax
+        come from the category codes, and the six computed columns are one float64 block filled in
+        place (ufuncs with out=) and handed to pandas without a copy, instead of merged frames and
+        np.where temporaries. Portfolio and Cash/Sweep are looked up by date (one row per date and
+        class, as the view has).
+    Args:
+        running_balances: DataFrame with TransactionDate, TransactionClass and RunningTotal
+        percent_max: Dict of PercentMax by asset class title (classes missing from it or with a NaN
+            PercentMax get 1.0)
+    Returns:
+        pandas.DataFrame: The running balances with the computed columns
+    """
+    if not pd.api.types.is_datetime64_any_dtype(running_balances['TransactionDate']):
+        running_balances['TransactionDate'] = pd.to_datetime(running_balances['TransactionDate'])
+    if not isinstance(running_balances['TransactionClass'].dtype, pd.CategoricalDtype):
+        running_balances['TransactionClass'] = running_balances['TransactionClass'].astype('category')
+    if running_balances['RunningTotal'].dtype != np.float64:
+        running_balances['RunningTotal'] = pd.to_numeric(running_balances['RunningTotal']).astype(np.float64)
+    total = running_balances['RunningTotal'].to_numpy()
+    codes = running_balances['TransactionClass'].cat.codes.to_numpy()
+    titles = list(running_balances['TransactionClass'].cat.categories)
+    # Rows of Portfolio and Cash/Sweep (all other rows, NULL classes included, are asset classes)
+    fixed = np.isin(codes, [titles.index(title) for title in (PORTFOLIO, CASH) if title in titles])
+    # Day of each row, for the daily Portfolio and Cash/Sweep balances (a NaT day picks the trailing NaN)
+    day, days = pd.factorize(running_balances['TransactionDate'])
+    block = np.empty((6, len(codes)))
+    portfolio, percent, policy_max, cash, investable, available = block
+    for title, column in ((PORTFOLIO, portfolio), (CASH, cash)):
+        daily = np.full(len(days) + 1, np.nan)
+        if title in titles:
+            rows = codes == titles.index(title)
+            daily[day[rows]] = total[rows]
+        np.take(daily, day, out=column)
+    # PercentMax per category, NULL classes (code -1) pick the trailing 1.0
+    class_percent_max = np.array([percent_max.get(title, np.nan) for title in titles] + [1.0], dtype=np.float64)
+    np.nan_to_num(class_percent_max, copy=False, nan=1.0)
+    np.take(class_percent_max, codes, out=percent)
+    np.multiply(portfolio, percent, out=policy_max)
+    np.subtract(policy_max, total, out=investable)
+    np.copyto(investable, total, where=fixed)
+    np.maximum(investable, 0, out=investable)
+    np.minimum(cash, investable, out=available)
+    np.copyto(available, total, where=fixed)
+    np.maximum(available, 0, out=available)
+    computed = pd.DataFrame(block.T, index=running_balances.index, copy=False,
+                            columns=['Portfolio', 'PercentMax', 'PolicyMax', 'CashSweep', 'Investable', 'Available'])
+    return pd.concat([running_balances, computed], axis=1)
+
+@with_db_session
+def load_balance_matrix(conn=None, horizon=None, asset_classes=None, reference=None):
+    """
+    Load the running balances as a date × asset class BalanceMatrix with PolicyMax, Investable
+        and Available computed (the wide form of load_and_process_data)
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        horizon: Optional (after, until) dates to load (see fetch_running_balances)
+        asset_classes: Optional asset class titles to load (see fetch_running_balances)
+        reference: The run's ReferenceData (defaults to reference_data.get_reference_data())
+    Returns:
+        BalanceMatrix: The running balances of every loaded date and class
+    """
+    logging.info('Executing data_processor/load_balance_matrix().')
+    running_balances = fetch_running_balances(conn=conn, horizon=horizon, asset_classes=asset_classes)
+    if reference is None:
+        from reference_data import get_reference_data
+        reference = get_reference_data(conn=conn)
+    with stage('transform', rows_in=len(running_balances)) as record:
+        matrix = BalanceMatrix.from_long(running_balances).compute(reference.title_to_percent_max)
+        record['rows_out'] = count_rows(matrix)
+    return matrix
+
+@with_db_session
+def fetch_running_balances(conn=None, horizon=None, asset_classes=None):
+    """
+    Fetch the daily running balance of every TransactionClass (TransactionDate, TransactionClass,
+        RunningTotal) from the source set by RUNNING_BALANCE_SOURCE
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        horizon: Optional (after, until) dates; only the days in (after, until] are loaded
+        asset_classes: Optional asset class titles; only these classes plus Portfolio and
+            Cash/Sweep (needed for PolicyMax and Available) are loaded
+    With the view both filters are part of the SQL WHERE clause, so the other rows never leave
+        the database. Balances built from transactions are carried forward from the checkpoint over
+        the horizon (see balance_processor.refresh_running_balances) and filtered by class after
+        the build.
+    """
+    classes = None if asset_classes is None else list(dict.fromkeys([PORTFOLIO, CASH, *asset_classes]))
+    if horizon is not None:
+        after, until = pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1])
+    if get_config()['running_balance_source'] == 'transactions':
+        # Fold the new transactions into the checkpointed balances instead of reading the view
+        from balance_processor import refresh_running_balances
+        if horizon is None:
+            running_balances = refresh_running_balances(conn=conn)
+        else:
+            running_balances = refresh_running_balances(conn=conn, start_date=after + pd.Timedelta(days=1), end_date=until)
+        if classes is not None:
+            running_balances = running_balances[running_balances['TransactionClass'].isin(classes)]
+        return running_balances.reset_index(drop=True)
+    table_name = 'RunningBalanceDayView'
+    conditions, params = [], []
+    if horizon is not None:
+        conditions.append('`TransactionDate` > %s AND `TransactionDate` <= %s')
+        params += [after.date(), until.date()]
+    if classes is not None:
+        conditions.append(f"`TransactionClass` IN ({', '.join(['%s'] * len(classes))})")
+        params += classes
+    # Streamed straight into float64 / datetime64 / categorical columns
+    return fetch_data(table_name, condition=' AND '.join(conditions) or '1', conn=conn, params=params or None, dtypes={
+        'TransactionDate': 'datetime64[ns]', 'TransactionClass': 'category', 'RunningTotal': 'float64'
+    })
+
 # Fetch data from database and return as a DataFrame
-def fetch_data(table_name, column_names='*', condition='1', sql=False):
+@instrumented('fetch')
+@with_db_session
+def fetch_data(table_name, column_names='*', condition='1', sql=False, conn=None, use_cache=True,
+               dtypes=None, chunk_size=None, params=None):
+    """
+    Fetch a table (or the result of the sql query) as a DataFrame.
+    The condition (or sql) may hold %s placeholders for the values in params.
+    Results are kept in the local query cache (shared/cache.py), keyed by the database (host,
+        port and name), the query, its params and dtypes, and a fingerprint of table_name, so an unchanged table is read from disk instead of MySQL.
+        Pass use_cache=False (or set QUERY_CACHE_BYPASS) to always query the database. Embedded
+        databases (shared/storage.py) are local files and are always queried.
+    With dtypes ({column: 'float64' | 'datetime64[ns]' | 'category' | 'object'}) the rows are
+        streamed through an unbuffered cursor in fetchmany chunks of chunk_size rows (defaults to
+        the FETCH_CHUNK_SIZE setting), each converted straight into typed arrays (see stream_frame),
+        or fetched as one typed frame where the backend reads columnar (DuckDB).
+    """
     logging.info(f'Fetching data from {table_name}')
+    backend = get_backend(conn)
     try:
-        # Get a connection to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Use the run's shared connection (unbuffered when streaming)
+        cursor = conn.cursor(buffered=False) if dtypes else conn.cursor()
+        query = sql if sql else f"SELECT {column_names} FROM {table_name} WHERE {condition}"
+        cache = get_query_cache() if use_cache and not backend.embedded else None
+        if cache is not None:
+            # The database's server and the column types are part of the key, not only the query
+            cache_key = f"{database_key(conn)!r}\n{query}\n{params!r}\n{dtypes!r}"
+            fingerprint = query_fingerprint(cursor, table_name, get_config()['transaction_table'])
+            if fingerprint is None:
+                cache = None
+            elif (df := cache.get(cache_key, fingerprint)) is not None:
+                logging.info(f'Read {len(df)} rows of {table_name} from the query cache')
+                return df
         # Fetch
-        if sql:
-            cursor.execute(sql)
+        if params:
+            cursor.execute(query, params)
         else:
-            query = f"SELECT {column_names} FROM {table_name} WHERE {condition}"
             cursor.execute(query)
-        # Fetch column names
-        columns = [col[0] for col in cursor.description]
-        # Fetch data
-        data = cursor.fetchall()
-        df = pd.DataFrame(data, columns=columns)
+        if dtypes:
+            df = backend.fetch_frame(cursor, dtypes)
+            if df is None:
+                df = stream_frame(cursor, dtypes, chunk_size or get_config()['fetch_chunk_size'])
+        else:
+            # Fetch column names
+            columns = [col[0] for col in cursor.description]
+            # Fetch data
+            data = cursor.fetchall()
+            df = pd.DataFrame(data, columns=columns)
+        if cache is not None:
+            cache.put(cache_key, fingerprint, df)
         return df
-    except mysql.connector.Error as err:
+    except backend.errors() as err:
         print(f"Error: {err}")
         return None
     finally:
-        if 'conn' in locals() and conn.is_connected():
+        if 'cursor' in locals():
             cursor.close()
-            conn.close()
\ No newline at end of file
+
+def stream_frame(cursor, dtypes, chunk_size=50000):
+    """
+    Build a typed DataFrame from an executed cursor, reading fetchmany chunks.
+    Each chunk is converted into NumPy arrays right away, so only one chunk of row tuples (and
+        Decimals) is alive at a time: float64 columns become float64 (NULL as NaN), datetime64
+        columns datetime64[ns] and category columns int32 codes into a growing category list.
+        The chunk arrays are concatenated once at the end.
+    Args:
+        cursor: Cursor on which the query was executed
+        dtypes: Type per column name ('float64', 'datetime64[ns]', 'category'); columns not listed
+            stay object
+        chunk_size: Rows per fetchmany() call
+    Returns:
+        pandas.DataFrame: The rows of the query with the requested column types
+    """
+    columns = [col[0] for col in cursor.description]
+    kinds = [dtypes.get(column, 'object') for column in columns]
+    chunks = [[] for _ in columns]
+    categories = [{} for _ in columns]
+    while rows := cursor.fetchmany(chunk_size):
+        for i, (kind, values) in enumerate(zip(kinds, zip(*rows))):
+            if kind == 'category':
+                codes = categories[i]
+                # NULL gets code -1 (a missing value)
+                chunks[i].append(np.fromiter(
+                    (-1 if value is None else codes.setdefault(value, len(codes)) for value in values),
+                    dtype=np.int32, count=len(values)
+                ))
+            elif kind == 'float64':
+                chunks[i].append(np.array(values, dtype=np.float64))
+            elif kind.startswith('datetime64'):
+                # pandas parses date/datetime objects far faster than np.array(..., 'datetime64')
+                chunks[i].append(pd.to_datetime(np.array(values, dtype=object)).to_numpy().astype('datetime64[ns]'))
+            else:
+                chunks[i].append(np.array(values, dtype=object))
+    data = {}
+    for i, (column, kind) in enumerate(zip(columns, kinds)):
+        values = np.concatenate(chunks[i]) if chunks[i] else np.array([], dtype=np.int32 if kind == 'category' else kind)
+        chunks[i] = None
+        if kind == 'category':
+            data[column] = pd.Categorical.from_codes(values, categories=list(categories[i]))
+        else:
+            data[column] = values
+    return pd.DataFrame(data, columns=columns)
@@ -1,90 +1,351 @@
-import mysql.connector
-from mysql.connector import Error
 import logging
+import io
+import os
+import tempfile
 import pandas as pd
 from datetime import datetime
-from shared.config import get_db_connection
+from pathlib import Path
+from shared.config import get_config, with_db_session
+from reference_data import title_to_id
+from shared.instrumentation import stage, instrumented
+from shared.storage import get_backend
 
-def write_results_to_database(windows_df, asset_classes_df):
+# Tables used by the swap publish mode
+STAGING_TABLE = 'InvestmentWindow_staging'
+PREVIOUS_TABLE = 'InvestmentWindow_previous'
+# Columns of the InvestmentWindow rows, in insert order
+INVESTMENT_WINDOW_COLUMNS = ['ClassName', 'LastEdited', 'Created', 'FromDate', 'EndDate', 'Available', 'Days', 'AssetClassID']
+
+@with_db_session
+def write_results_to_database(windows_df, asset_classes_df, conn=None, batch_size=None, load_data=False,
+                              table='InvestmentWindow', commit=True):
     """
     Insert data from windows dataframe into the InvestmentWindow MySQL table,
     looking up AssetClassID from asset_classes dataframe.
+    The rows are converted once (see prepare_investment_window_rows) and inserted with
+    executemany in batches of batch_size rows, or in one LOAD DATA LOCAL INFILE for large runs
+    (one bulk insert of the whole frame on the embedded backends, see shared/storage.py).
     Args:
         windows_df: DataFrame containing window data
         asset_classes_df: DataFrame containing asset class mappings
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        batch_size: Rows per executemany batch (defaults to the DB_WRITE_BATCH_SIZE setting)
+        load_data: Load the rows from a CSV file with LOAD DATA LOCAL INFILE instead of inserts
+            (the connection needs DB_ALLOW_LOCAL_INFILE enabled)
+        table: Table to insert into (publish_investment_windows loads a staging table)
+        commit: Commit the inserts (False leaves the transaction open for the caller)
+    Windows of asset classes without an AssetClassID are skipped (logged by
+    prepare_investment_window_rows, as the original writer did) and don't count as failures.
     Returns:
-        bool: True if successful
+        bool: True if every mapped window was inserted
     """
     logging.info('Executing database_writer/write_results_to_database().')
     # try:
-    conn = get_db_connection()
+    backend = get_backend(conn)
     if conn.is_connected():
-        logging.info("Connected to MySQL database")
+        logging.info(f"Connected to {backend.name} database")
     else:
-        logging.error("Failed to connect to MySQL database")
+        logging.error(f"Failed to connect to {backend.name} database")
         return False
+    if batch_size is None:
+        batch_size = get_config()['db_write_batch_size']
+    rows = prepare_investment_window_rows(windows_df, asset_classes_df)
+    # Unmapped asset classes are dropped by prepare_investment_window_rows
+    skipped = len(windows_df) - len(rows)
+    failed = 0
+    successful = 0
     # Create a cursor
     cursor = conn.cursor()
-    # Create a mapping dictionary from asset class title to ID
-    asset_class_mapping = dict(zip(asset_classes_df['AssetClassTitle'], asset_classes_df['AssetClassID']))
-    # Get current datetime for LastEdited and Created fields
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # Prepare insert statement
-    insert_query = """
-    INSERT INTO InvestmentWindow
-    (ClassName, LastEdited, Created, FromDate, EndDate, Available, Days, AssetClassID)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    # Counter for successful and failed inserts
-    successful = 0
-    failed = 0
-    # Process each row in the windows dataframe
-    for _, row in windows_df.iterrows():
-        try:
-            # Look up AssetClassID from the asset_classes dataframe
-            asset_class_title = row['Asset Class']
-            asset_class_id = asset_class_mapping.get(asset_class_title)
-
-            if asset_class_id is None:
-                print(f"Warning: Asset class '{asset_class_title}' not found in asset_classes dataframe")
-                failed += 1
-                continue
-
-            # Prepare data for insert
-            data = (
-                'App\\Model\\InvestmentWindow',  # ClassName
-                current_datetime,                # LastEdited
-                current_datetime,                # Created
-                row['StartDate'].strftime('%Y-%m-%d'),  # FromDate
-                row['EndDate'].strftime('%Y-%m-%d'),    # EndDate
-                float(row['LowPointBalance']),   # Available
-                int(row['TimeSpanDays']),        # Days
-                int(asset_class_id)              # AssetClassID
-            )
-            # Execute insert
-            cursor.execute(insert_query, data)
-            successful += 1
-        except Exception as e:
-            print(f"Error inserting row: {e}")
-            failed += 1
+    with stage('insert', rows_in=len(rows)) as record:
+        if load_data:
+            try:
+                if backend.embedded:
+                    backend.insert_frame(cursor, table, rows)
+                else:
+                    _load_data_infile(cursor, rows, table)
+                successful = len(rows)
+            except Exception as e:
+                print(f"Error loading rows: {e}")
+                failed += len(rows)
+        else:
+            # Prepare insert statement
+            insert_query = f"""
+            INSERT INTO {table}
+            (ClassName, LastEdited, Created, FromDate, EndDate, Available, Days, AssetClassID)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            data = list(rows.itertuples(index=False, name=None))
+            for start in range(0, len(data), batch_size):
+                batch = data[start:start + batch_size]
+                try:
+                    cursor.executemany(insert_query, batch)
+                    successful += len(batch)
+                except Exception as e:
+                    print(f"Error inserting rows {start}-{start + len(batch) - 1}: {e}")
+                    failed += len(batch)
+        record['rows_out'] = successful
     # Commit the transaction
-    conn.commit()
+    if commit:
+        conn.commit()
     cursor.close()
-    print(f"Data import complete. {successful} rows inserted successfully, {failed} rows failed.")
+    print(f"Data import complete. {successful} rows inserted successfully, {failed} rows failed, "
+          f"{skipped} rows skipped (asset class not found).")
+    return failed == 0
 
-def truncate_investment_window_table():
+@instrumented('prepare', rows_in=lambda windows_df, *args, **kwargs: len(windows_df))
+def prepare_investment_window_rows(windows_df, asset_classes_df, current_datetime=None):
+    """
+    Convert the windows dataframe to InvestmentWindow rows in one vectorized pass.
+    Windows whose asset class isn't in asset_classes_df are dropped and reported in one warning.
+    Args:
+        windows_df: DataFrame containing window data
+        asset_classes_df: DataFrame containing asset class mappings (or the run's ReferenceData)
+        current_datetime: LastEdited/Created timestamp string (defaults to now)
+    Returns:
+        pandas.DataFrame: Rows with the INVESTMENT_WINDOW_COLUMNS columns, as Python-typed values
+    """
+    # Mapping dictionary from asset class title to ID (prebuilt by the run's ReferenceData)
+    asset_class_mapping = title_to_id(asset_classes_df)
+    # Look up AssetClassID from the asset_classes dataframe
+    asset_class_ids = windows_df['Asset Class'].map(asset_class_mapping)
+    unmapped = asset_class_ids.isna()
+    if unmapped.any():
+        counts = windows_df.loc[unmapped, 'Asset Class'].value_counts().to_dict()
+        logging.warning(f"Skipping {int(unmapped.sum())} windows of asset classes not found in asset_classes dataframe: {counts}")
+        windows_df = windows_df[~unmapped]
+        asset_class_ids = asset_class_ids[~unmapped]
+    # Get current datetime for LastEdited and Created fields
+    if current_datetime is None:
+        current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = pd.DataFrame({
+        'ClassName': 'App\\Model\\InvestmentWindow',
+        'LastEdited': current_datetime,
+        'Created': current_datetime,
+        'FromDate': pd.to_datetime(windows_df['StartDate']).dt.strftime('%Y-%m-%d'),
+        'EndDate': pd.to_datetime(windows_df['EndDate']).dt.strftime('%Y-%m-%d'),
+        # The amount allocated under the shared cash when the windows went through allocation.py
+        'Available': windows_df['Allocated' if 'Allocated' in windows_df else 'LowPointBalance'].astype(float),
+        'Days': windows_df['TimeSpanDays'].astype(int),
+        'AssetClassID': asset_class_ids.astype(int),
+    }, columns=INVESTMENT_WINDOW_COLUMNS)
+    # Object columns so the rows hold Python floats/ints for the connector
+    return rows.astype(object).reset_index(drop=True)
+
+def _load_data_infile(cursor, rows, table='InvestmentWindow'):
+    """
+    Load the rows with LOAD DATA LOCAL INFILE. The CSV is built in memory and handed to the
+    server through a temporary file (the connector only reads local infiles from a path).
+    """
+    buffer = io.StringIO()
+    rows.to_csv(buffer, index=False, header=False, lineterminator='\n')
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as csv_file:
+        csv_file.write(buffer.getvalue())
+    try:
+        cursor.execute(f"""
+        LOAD DATA LOCAL INFILE '{Path(csv_file.name).as_posix()}'
+        INTO TABLE {table}
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\n'
+        ({', '.join(INVESTMENT_WINDOW_COLUMNS)})
+        """)
+    finally:
+        os.remove(csv_file.name)
+
+@with_db_session
+def truncate_investment_window_table(conn=None):
     """
     Truncate the InvestmentWindow table to remove all existing data.
 
     Args:
-        None
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
     """
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("TRUNCATE TABLE InvestmentWindow")
+        get_backend(conn).truncate(cursor, 'InvestmentWindow')
         print("InvestmentWindow table truncated successfully")
     except Exception as e:
         print(f"Error truncating InvestmentWindow table: {e}")
     finally:
-        cursor.close()
\ No newline at end of file
+        if 'cursor' in locals():
+            cursor.close()
+
+@with_db_session
+def publish_investment_windows(windows_df, asset_classes_df, conn=None, mode=None, load_data=False):
+    """
+    Replace the contents of the InvestmentWindow table without readers ever seeing it empty or
+    half-written.
+    Modes:
+        swap: Load the rows into a staging copy of the table, then swap it in with one atomic
+            RENAME TABLE. The previous contents are kept as InvestmentWindow_previous
+            (see rollback_investment_windows).
+        transaction: DELETE and insert in a single transaction; readers see the old rows until
+            the commit.
+        diff: Only write the rows that changed, in one transaction (see
+            write_investment_window_changes).
+        truncate: The original TRUNCATE-then-insert (readers see a partial table meanwhile).
+    If any row fails to load, nothing is published: the staging table is dropped (swap) or the
+    transaction rolled back, and the live table keeps its current contents.
+    Args:
+        windows_df: DataFrame containing window data
+        asset_classes_df: DataFrame containing asset class mappings
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        mode: 'swap', 'transaction', 'diff' or 'truncate' (defaults to the INVESTMENT_WINDOW_PUBLISH_MODE setting)
+        load_data: Load the rows with LOAD DATA LOCAL INFILE (see write_results_to_database)
+    Returns:
+        bool: True if the new windows were published
+    """
+    if mode is None:
+        mode = get_config()['publish_mode']
+    logging.info(f'Publishing investment windows ({mode}).')
+    if mode == 'truncate':
+        truncate_investment_window_table(conn=conn)
+        return write_results_to_database(windows_df, asset_classes_df, conn=conn, load_data=load_data)
+    if mode == 'diff':
+        try:
+            write_investment_window_changes(windows_df, asset_classes_df, conn=conn)
+            return True
+        except Exception as e:
+            logging.error(f"Writing investment window changes failed, keeping the current InvestmentWindow table: {e}")
+            return False
+    backend = get_backend(conn)
+    cursor = conn.cursor()
+    try:
+        if mode == 'swap':
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            backend.create_like(cursor, STAGING_TABLE, 'InvestmentWindow')
+            if not write_results_to_database(windows_df, asset_classes_df, conn=conn, load_data=load_data, table=STAGING_TABLE):
+                raise Exception("not all windows could be written to the staging table")
+            cursor.execute(f"DROP TABLE IF EXISTS {PREVIOUS_TABLE}")
+            # One metadata operation: readers see either the old or the new table
+            backend.rename_tables(cursor, [('InvestmentWindow', PREVIOUS_TABLE), (STAGING_TABLE, 'InvestmentWindow')])
+        elif mode == 'transaction':
+            # End any open read snapshot, so the delete and inserts form one transaction
+            conn.commit()
+            conn.start_transaction()
+            cursor.execute("DELETE FROM InvestmentWindow")
+            if not write_results_to_database(windows_df, asset_classes_df, conn=conn, load_data=load_data, commit=False):
+                raise Exception("not all windows could be written")
+            conn.commit()
+        else:
+            raise ValueError(f"Unknown publish mode: {mode}")
+    except Exception as e:
+        logging.error(f"Publishing investment windows failed, keeping the current InvestmentWindow table: {e}")
+        conn.rollback()
+        if mode == 'swap':
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        return False
+    finally:
+        cursor.close()
+    logging.info('Investment windows published.')
+    return True
+
+@with_db_session
+def rollback_investment_windows(conn=None):
+    """
+    Swap the previously published windows (kept by the swap publish mode) back into the
+    InvestmentWindow table, in one atomic RENAME TABLE.
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+    """
+    cursor = conn.cursor()
+    try:
+        get_backend(conn).rename_tables(cursor, [
+            ('InvestmentWindow', STAGING_TABLE), (PREVIOUS_TABLE, 'InvestmentWindow'), (STAGING_TABLE, PREVIOUS_TABLE)
+        ])
+        logging.info('Rolled InvestmentWindow back to the previously published windows.')
+    finally:
+        cursor.close()
+
+@with_db_session
+def write_investment_window_changes(windows_df, asset_classes_df, conn=None, batch_size=None):
+    """
+    Bring the InvestmentWindow table up to date by writing only the rows that changed.
+    The current rows are loaded and matched to the new windows on (AssetClassID, FromDate,
+    EndDate) (see diff_investment_windows); only the needed DELETE, UPDATE and INSERT batches
+    are sent, in one transaction. Unchanged rows keep their Created and LastEdited timestamps.
+    Args:
+        windows_df: DataFrame containing window data
+        asset_classes_df: DataFrame containing asset class mappings
+        conn: Database connection of the run's db_session (a new session is opened if omitted)
+        batch_size: Rows per executemany batch (defaults to the DB_WRITE_BATCH_SIZE setting)
+    Returns:
+        dict: Number of inserted, updated, deleted and unchanged rows
+    """
+    logging.info('Executing database_writer/write_investment_window_changes().')
+    if batch_size is None:
+        batch_size = get_config()['db_write_batch_size']
+    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    new_rows = prepare_investment_window_rows(windows_df, asset_classes_df, current_datetime)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT ID, AssetClassID, FromDate, EndDate, Available, Days FROM InvestmentWindow")
+        current_rows = pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+        inserts, updates, deletes = diff_investment_windows(current_rows, new_rows)
+        counts = {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes),
+                  'unchanged': len(current_rows) - len(updates) - len(deletes)}
+        for start in range(0, len(deletes), batch_size):
+            batch = deletes[start:start + batch_size]
+            cursor.execute(f"DELETE FROM InvestmentWindow WHERE ID IN ({', '.join(['%s'] * len(batch))})", batch)
+        update_query = """
+        UPDATE InvestmentWindow SET Available = %s, Days = %s, LastEdited = %s WHERE ID = %s
+        """
+        data = [(available, days, current_datetime, row_id) for row_id, available, days in updates.itertuples(index=False, name=None)]
+        for start in range(0, len(data), batch_size):
+            cursor.executemany(update_query, data[start:start + batch_size])
+        insert_query = """
+        INSERT INTO InvestmentWindow
+        (ClassName, LastEdited, Created, FromDate, EndDate, Available, Days, AssetClassID)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        data = list(inserts.itertuples(index=False, name=None))
+        for start in range(0, len(data), batch_size):
+            cursor.executemany(insert_query, data[start:start + batch_size])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logging.info(f"InvestmentWindow changes written: {counts}")
+    return counts
+
+def diff_investment_windows(current_rows, new_rows):
+    """
+    Compare the current InvestmentWindow rows with newly computed ones.
+    Rows are matched on (AssetClassID, FromDate, EndDate); a row whose Available (to the cent)
+    or Days differ is an update, unmatched new rows are inserts and unmatched current rows deletes.
+    Args:
+        current_rows: DataFrame with ID, AssetClassID, FromDate, EndDate, Available, Days
+        new_rows: Rows from prepare_investment_window_rows
+    Returns:
+        tuple: (rows to insert as in new_rows, DataFrame of ID/Available/Days to update,
+            list of IDs to delete)
+    """
+    key = ['AssetClassID', 'FromDate', 'EndDate', 'Occurrence']
+    current = _diff_keys(current_rows)
+    new = _diff_keys(new_rows)
+    merged = current[key + ['ID', 'Available', 'Days']].merge(
+        new[key + ['Available', 'Days']].reset_index(), on=key, how='outer', suffixes=('Current', ''), indicator=True
+    )
+    matched = merged[merged['_merge'] == 'both']
+    changed = (
+        (matched['AvailableCurrent'].astype(float).round(2) != matched['Available'].astype(float).round(2)) |
+        (matched['DaysCurrent'].astype(int) != matched['Days'].astype(int))
+    )
+    updates = pd.DataFrame({
+        'ID': matched.loc[changed, 'ID'].astype(int),
+        'Available': matched.loc[changed, 'Available'].astype(float),
+        'Days': matched.loc[changed, 'Days'].astype(int),
+    }).astype(object)
+    inserts = new_rows.loc[merged.loc[merged['_merge'] == 'right_only', 'index'].astype(int)]
+    deletes = merged.loc[merged['_merge'] == 'left_only', 'ID'].astype(int).tolist()
+    return inserts, updates.reset_index(drop=True), deletes
+
+def _diff_keys(rows):
+    """Normalizes the diff key columns (dates as strings) and numbers repeated keys."""
+    rows = rows.copy()
+    rows['AssetClassID'] = rows['AssetClassID'].astype(int)
+    for column in ('FromDate', 'EndDate'):
+        rows[column] = pd.to_datetime(rows[column]).dt.strftime('%Y-%m-%d')
+    rows['Occurrence'] = rows.groupby(['AssetClassID', 'FromDate', 'EndDate']).cumcount()
+    return rows
@@ -0,0 +1,288 @@
+import heapq
+from itertools import islice
+import pandas as pd
+import numpy as np
+
+class RangeMinimum:
+    """
+    Sparse table over a balance array answering inclusive range-minimum queries in O(1).
+    Level k holds the minimum of every run of 2**k consecutive balances, so any range [start, end]
+        is covered by two (possibly overlapping) runs of the largest power of two that fits.
+    Building the table is O(n log n); queries take NumPy arrays of start and end positions and
+        are answered in one batch.
+    NaN balances are skipped the way pandas' min() skips them: a range holding only NaN balances
+        returns NaN.
+    """
+    def __init__(self, balances):
+        balances = np.asarray(balances)
+        self._has_nan = balances.dtype.kind == 'f' and bool(np.isnan(balances).any())
+        values = np.where(np.isnan(balances), np.inf, balances) if self._has_nan else balances
+        self.levels = [values]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append(np.minimum(previous[:-width], previous[width:]))
+            width *= 2
+
+    def query(self, starts, ends):
+        """
+        Minimum balance of each inclusive range [starts[i], ends[i]].
+        Parameters:
+        -----------
+        starts : numpy.ndarray
+            Start positions of the ranges
+        ends : numpy.ndarray
+            End positions of the ranges (inclusive, >= starts)
+        Returns:
+        --------
+        numpy.ndarray
+            Minimum balance of each range
+        """
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        level = np.log2(ends - starts + 1).astype(np.int64)
+        minimums = np.empty(len(starts), dtype=self.levels[0].dtype)
+        # Group the queries by level so each level is read with one fancy-index
+        for k in np.unique(level):
+            rows = level == k
+            table = self.levels[k]
+            minimums[rows] = np.minimum(table[starts[rows]], table[ends[rows] - (1 << int(k)) + 1])
+        if self._has_nan:
+            minimums[np.isinf(minimums) & (minimums > 0)] = np.nan
+        return minimums
+
+def find_investment_windows(df, date_column='date', balance_column='balance', min_days=2, top_k=None):
+    """
+    Find optimal investment windows based on account balance data.
+    Every (start, end) pair of at least min_days rows is scored with the minimum balance of the
+        window times its length in days. The window minimums come from a RangeMinimum sparse table
+        and are computed in NumPy batches of start rows instead of one DataFrame slice per window.
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        DataFrame containing date and balance columns
+    date_column : str
+        Name of the date column
+    balance_column : str
+        Name of the balance column
+    min_days : int
+        Minimum number of days for an investment window
+    top_k : int, optional
+        Only return the top_k best-scoring windows, without holding the full O(n²) list of windows
+            in memory. With one row per date they are taken from iter_investment_windows;
+            otherwise the batches are reduced to the running top_k as they are produced.
+    Returns:
+    --------
+    list of dict
+        Each dict contains details about an investment window (start_date, end_date, amount,
+            days, score), sorted by score in descending order. Windows with the same score keep
+            their start/end date order.
+    """
+    # Ensure the dataframe is sorted by date
+    df = df.sort_values(by=date_column).reset_index(drop=True)
+    n = len(df)
+    if n < max(min_days, 1) or top_k == 0:
+        return []
+    dates = pd.to_datetime(df[date_column]).to_numpy()
+    balances = df[balance_column].to_numpy()
+    if top_k is not None and (np.diff(dates) > np.timedelta64(0)).all():
+        # With one row per date the ranked stream is in exactly this order, so only
+        # the top_k windows are ever produced
+        return list(islice(_ranked_window_records(dates, balances, min_days), top_k))
+    rmq = RangeMinimum(balances)
+
+    kept = None
+    batches = []
+    for starts, ends in _window_batches(n, min_days):
+        amounts = rmq.query(starts, ends)
+        # Only consider windows where we have a positive balance to invest
+        positive = amounts > 0
+        starts, ends, amounts = starts[positive], ends[positive], amounts[positive]
+        days = (dates[ends] - dates[starts]) // np.timedelta64(1, 'D') + 1
+        # Calculate a score that values both amount and duration
+        scores = amounts * days
+        batch = (starts, ends, amounts, days, scores)
+        if top_k is None:
+            batches.append(batch)
+        else:
+            kept = batch if kept is None else tuple(np.concatenate(pair) for pair in zip(kept, batch))
+            kept = _top_windows(*kept, top_k)
+    if top_k is None:
+        if not batches:
+            return []
+        starts, ends, amounts, days, scores = (np.concatenate(column) for column in zip(*batches))
+        # Sort investment windows by score in descending order (stable on the start/end order)
+        order = np.argsort(-scores, kind='stable')
+        starts, ends, amounts, days, scores = (column[order] for column in (starts, ends, amounts, days, scores))
+    else:
+        starts, ends, amounts, days, scores = kept
+    return _window_records(dates, starts, ends, amounts, days, scores)
+
+def iter_investment_windows(df, date_column='date', balance_column='balance', min_days=2):
+    """
+    Yield investment windows one at a time, best score first.
+    Takes the same parameters as find_investment_windows and yields the same window dicts, but
+        never builds the full list: peak memory is O(n + K) for the first K windows consumed, so
+        callers can stop after the windows they need (e.g. with itertools.islice).
+    Every window has a single owner, the leftmost day holding its minimum balance. A monotonic
+        stack finds the widest window each day owns; narrowing it from either side only lowers
+        the score, so a heap of one frontier window per owner yields all windows in score order.
+    Windows with the same score come out in start/end date order when there is one row per date.
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        DataFrame containing date and balance columns
+    date_column : str
+        Name of the date column
+    balance_column : str
+        Name of the balance column
+    min_days : int
+        Minimum number of days for an investment window
+    Yields:
+    -------
+    dict
+        Details about an investment window (start_date, end_date, amount, days, score)
+    """
+    df = df.sort_values(by=date_column).reset_index(drop=True)
+    if len(df) < max(min_days, 1):
+        return
+    dates = pd.to_datetime(df[date_column]).to_numpy()
+    yield from _ranked_window_records(dates, df[balance_column].to_numpy(), min_days)
+
+def _ranked_window_records(dates, balances, min_days):
+    """Converts the ranked window stream of _iter_ranked_windows to window dicts."""
+    timestamps = pd.DatetimeIndex(dates)
+    for start, end, amount, days, score in _iter_ranked_windows(dates, balances, min_days):
+        yield {'start_date': timestamps[start], 'end_date': timestamps[end],
+               'amount': amount, 'days': days, 'score': score}
+
+def _iter_ranked_windows(dates, balances, min_days):
+    """
+    Yields (start, end, amount, days, score) for every window of at least min_days rows with a
+        positive minimum balance, by score in descending order.
+    """
+    min_days = max(min_days, 1)
+    n = len(balances)
+    ticks = dates.astype('datetime64[ns]').view(np.int64).tolist()
+    day = 86400 * 10**9
+    values = balances.tolist()
+    # NaN balances never hold a window minimum (pandas' min() skips them)
+    keys = [np.inf if value != value else value for value in values]
+    # Owned range of each day: left up to the previous day with a balance <= its own,
+    # right up to the next day with a lower balance
+    left = [0] * n
+    right = [n - 1] * n
+    stack = []
+    for i in range(n):
+        while stack and keys[stack[-1]] > keys[i]:
+            right[stack.pop()] = i - 1
+        left[i] = stack[-1] + 1 if stack else 0
+        stack.append(i)
+
+    def entry(owner, start, end):
+        days = (ticks[end] - ticks[start]) // day + 1
+        score = values[owner] * days
+        return (-score, start, end, owner, days, score)
+
+    heap = [
+        entry(k, left[k], right[k]) for k in range(n)
+        if keys[k] > 0 and keys[k] != np.inf and right[k] - left[k] + 1 >= min_days
+    ]
+    heapq.heapify(heap)
+    while heap:
+        _, start, end, owner, days, score = heapq.heappop(heap)
+        yield start, end, values[owner], days, score
+        # Narrow from the left; only the owner's widest-start row also narrows from the right,
+        # so every window is pushed exactly once
+        if start < owner and end - start >= min_days:
+            heapq.heappush(heap, entry(owner, start + 1, end))
+        if start == left[owner] and end > owner and end - start >= min_days:
+            heapq.heappush(heap, entry(owner, start, end - 1))
+
+def optimize_non_overlapping_windows(windows, top_n=None):
+    """
+    Find the optimal set of non-overlapping investment windows
+    Weighted interval scheduling: the windows are sorted by end date and each window's latest
+        compatible predecessor (ending before it starts) is found by binary search, so the dynamic
+        program runs in O(m log m) over all m candidate windows.
+    Parameters:
+    -----------
+    windows : list of dict
+        List of investment windows from find_investment_windows
+    top_n : int, optional
+        Number of top windows to consider. By default the full candidate set is used.
+    Returns:
+    --------
+    tuple of (list of dict, float)
+        Optimal set of non-overlapping investment windows in chronological order, and their total
+            value (the sum of their scores)
+    """
+    candidate_windows = windows if top_n is None else windows[:top_n]
+    m = len(candidate_windows)
+    if m == 0:
+        return [], 0
+    starts = pd.DatetimeIndex([w['start_date'] for w in candidate_windows]).to_numpy()
+    ends = pd.DatetimeIndex([w['end_date'] for w in candidate_windows]).to_numpy()
+    scores = [w['score'] for w in candidate_windows]
+    # Sort by end date
+    order = np.argsort(ends, kind='stable')
+    sorted_ends = ends[order]
+    # Last window (in end order) that ends strictly before each window starts, -1 if none
+    predecessors = (np.searchsorted(sorted_ends, starts[order], side='left') - 1).tolist()
+    order = order.tolist()
+    # best[i] is the maximum total score using the first i windows in end order
+    best = [0] * (m + 1)
+    for i in range(m):
+        include = scores[order[i]] + best[predecessors[i] + 1]
+        best[i + 1] = include if include > best[i] else best[i]
+    # Reconstruct the solution
+    optimal_windows = []
+    i = m - 1
+    while i >= 0:
+        if best[i + 1] == best[i]:
+            i -= 1
+        else:
+            optimal_windows.append(candidate_windows[order[i]])
+            i = predecessors[i]
+    # Reverse to get chronological order
+    optimal_windows.reverse()
+    return optimal_windows, best[m]
+
+def _window_batches(n, min_days, max_pairs=1 << 20):
+    """
+    Yields (starts, ends) position arrays for every window of at least min_days rows, in
+        (start, end) order, grouped into batches of about max_pairs windows.
+    """
+    min_days = max(min_days, 1)
+    first = 0
+    last_start = n - min_days
+    while first <= last_start:
+        # Number of end positions for each start in this batch
+        lengths = n - np.arange(first, last_start + 1) - min_days + 1
+        count = max(1, int(np.searchsorted(np.cumsum(lengths), max_pairs, side='right')))
+        lengths = lengths[:count]
+        starts = np.repeat(np.arange(first, first + count), lengths)
+        offsets = np.arange(len(starts)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        ends = starts + min_days - 1 + offsets
+        yield starts, ends
+        first += count
+
+def _top_windows(starts, ends, amounts, days, scores, top_k):
+    """Keeps the top_k windows by score, breaking ties by start and end position."""
+    if len(scores) > top_k:
+        # Cheap partition first, so only the candidates that can make the cut get sorted
+        threshold = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        candidates = scores >= threshold
+        starts, ends, amounts, days, scores = (column[candidates] for column in (starts, ends, amounts, days, scores))
+    order = np.lexsort((ends, starts, -scores))[:top_k]
+    return tuple(column[order] for column in (starts, ends, amounts, days, scores))
+
+def _window_records(dates, starts, ends, amounts, days, scores):
+    """Converts window position arrays to the list of dicts returned by find_investment_windows."""
+    start_dates = pd.DatetimeIndex(dates[starts]).tolist()
+    end_dates = pd.DatetimeIndex(dates[ends]).tolist()
+    return [
+        {'start_date': start_date, 'end_date': end_date, 'amount': amount, 'days': day, 'score': score}
+        for start_date, end_date, amount, day, score in zip(
+            start_dates, end_dates, amounts.tolist(), days.tolist(), scores.tolist())
+    ]
@@ -1,45 +1,196 @@
 import logging
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Import modularized code
-from data_processor import load_and_process_data
-from data_processor import load_asset_classes
-from algorithm_processor import process_investment_algorithm
-from database_writer import write_results_to_database
-from database_writer import truncate_investment_window_table
+# The stage modules (pandas, numpy, mysql.connector) are imported by the stages that use them, so
+# importing this module and HealthCheck() stay cheap on a cold function host
+from shared.config import db_session, count_connections, get_db_settings, get_config
+from shared.instrumentation import run_report, stage, instrumented, count_rows
 
-def ProcessTreasuryForecastingData():
+def ProcessTreasuryForecastingData(db_config=None):
     logging.info('Python HTTP trigger function processed a request.')
     logging.info('Treasury forecasting function processing request.')
 
     # try:
-    investment_windows = []
+    run_treasury_forecast(db_config)
+    return 'Success'
+
+    # except Exception as e:
+    #     logging.error(f"Error processing treasury forecast: {str(e)}")
+    #     return 'Failure'
+
+def run_treasury_forecast(db_config=None, horizon=None, executor=None):
+    """
+    Run the pipeline once for one database: load, algorithm and write.
+    Args:
+        db_config: Optional connection params overriding the environment (see get_db_settings)
+        horizon: (after, until) dates of the run (defaults to get_horizon())
+        executor: Optional long-lived process pool for the algorithm (see process_investment_algorithm)
+    Returns:
+        tuple: (investment windows DataFrame, the finished RunReport)
+    """
+    # Fixed once so every stage works on the same dates
+    if horizon is None:
+        from algorithm_processor import get_horizon
+        horizon = get_horizon()
+
+    # One pooled connection shared by every reader and writer of the run, timed stage by stage
+    # (the JSON run report is logged and written to RUN_REPORT_DIR)
+    with run_report('treasury-forecast') as report, db_session(db_config) as conn:
+        # # Part 1: Data loading and processing
+        running_balances, reference = load_stage(conn, horizon)
+
+        # # Part 2: Algorithm processing
+        investment_windows = algorithm_stage(running_balances, reference, horizon, executor)
+
+        # # Part 3: Database writing
+        write_stage(investment_windows, reference, conn)
+    return investment_windows, report
 
-    # # Part 1: Data loading and processing
+@instrumented('load')
+def load_stage(conn, horizon):
+    """Load the reference data and the running balances of its asset universe and the horizon of one database."""
+    from data_processor import load_balance_matrix
+    from reference_data import get_reference_data
+    from algorithm_processor import asset_universe
     logging.info("Starting data loading and initial processing")
-    running_balances = load_and_process_data() # Pass parameters if needed: req_body)
-    asset_classes = load_asset_classes()  # Load asset classes
-    logging.info(f"Data loading and processing complete. Running Balances shape: {running_balances.shape}, Asset Classes shape: {asset_classes.shape}")
+    # Asset classes, loaded once per process and shared with the algorithm and writer stages
+    with stage('reference') as record:
+        reference = get_reference_data(conn=conn)
+        record['rows_out'] = len(reference.asset_classes)
+    # Date × asset class matrix (load_and_process_data returns the same data in long format)
+    running_balances = load_balance_matrix(
+        conn=conn, horizon=horizon, asset_classes=asset_universe(reference.asset_classes), reference=reference
+    )
+    logging.info(f"Data loading and processing complete. Running Balances shape: {running_balances.shape}, Asset Classes shape: {reference.asset_classes.shape}")
+    return running_balances, reference
 
-    # # Part 2: Algorithm processing
-    logging.info("Starting algorithm processing")
-    investment_windows = process_investment_algorithm(running_balances)
+@instrumented('algorithm', rows_in=lambda running_balances, *args: count_rows(running_balances))
+def algorithm_stage(running_balances, reference, horizon, executor=None):
+    """Find the investment windows of the asset universe in the running balances and share the cash between them."""
+    from algorithm_processor import process_investment_algorithm, asset_universe
+    logging.info(f"Starting algorithm processing ({horizon[0]:%Y-%m-%d} to {horizon[1]:%Y-%m-%d})")
+    investment_windows = process_investment_algorithm(
+        running_balances, asset_classes=asset_universe(reference.asset_classes), horizon=horizon, executor=executor
+    )
+    if get_config()['allocate_windows']:
+        from allocation import allocate_investment_windows
+        investment_windows = allocate_investment_windows(investment_windows, running_balances, horizon)
     logging.info(f"Algorithm processing complete. Found {len(investment_windows)} investment windows")
+    return investment_windows
 
-    # # Part 3: Database writing
+@instrumented('write', rows_in=lambda investment_windows, *args: len(investment_windows), rows_out=lambda result: None)
+def write_stage(investment_windows, reference, conn):
+    """Replace the InvestmentWindow rows of one database."""
+    from database_writer import publish_investment_windows
     logging.info("Starting database write operation")
-    truncate_investment_window_table()
-    write_results_to_database(investment_windows, asset_classes)
+    if not publish_investment_windows(investment_windows, reference, conn=conn):
+        raise Exception("Investment windows were not published")
     logging.info("Database write operation complete")
-    return 'Success'
 
-    # except Exception as e:
-    #     logging.error(f"Error processing treasury forecast: {str(e)}")
-    #     return 'Failure'
+def HealthCheck(check_database=False, db_config=None):
+    """
+    Health check / no-op invocation: answers without loading the pipeline (no pandas or numpy).
+    Args:
+        check_database: Also check out a pooled connection and ping the database
+        db_config: Optional connection params overriding the environment (see get_db_settings)
+    Returns:
+        dict: {'status': 'Healthy' or 'Unhealthy', 'database': name or None, 'error': message or None}
+    """
+    result = {'status': 'Healthy', 'database': None, 'error': None}
+    if check_database:
+        result['database'] = get_db_settings(db_config)['database']
+        try:
+            with db_session(db_config) as conn:
+                conn.ping(reconnect=False)
+                # Embedded databases (shared/storage.py) are named after their file
+                if getattr(conn, 'backend', None) is not None:
+                    result['database'] = conn.database
+        except Exception as e:
+            logging.error(f"Health check failed: {e}")
+            result.update(status='Unhealthy', error=str(e))
+    return result
+
+def ProcessTreasuryForecastingBatch(portfolios, max_workers=2):
+    """
+    Run the treasury forecasting pipeline for many portfolios (tenant databases).
+    Loading is pipelined with compute: while portfolio N runs the algorithm and is written back,
+        the databases of the next portfolios are already being read by a bounded thread pool.
+    A failing portfolio is reported and skipped; the rest of the batch still runs.
+    Args:
+        portfolios: List of dicts with a 'name' and optional 'db_config' connection params
+            overriding the environment (see get_db_settings)
+        max_workers: Maximum number of portfolios loading from their databases at the same time
+            (each db_config gets its own pool of DB_OVERRIDE_POOL_SIZE connections; keep it below
+            DB_MAX_POOLS so the pools still in use are not the ones closed as least recently used)
+    Returns:
+        list: One report dict per portfolio, in input order, with its name, status
+            ('Success' or 'Failure'), error message, number of windows and stage timings (seconds)
+    """
+    logging.info(f'Treasury forecasting batch processing {len(portfolios)} portfolios.')
+    from algorithm_processor import get_horizon
+    reports = []
+    horizon = get_horizon()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Keep up to max_workers loads in flight ahead of the portfolio being computed
+        loads = [executor.submit(_timed, _load_portfolio, portfolio.get('db_config'), horizon)
+                 for portfolio in portfolios[:max_workers]]
+        for i, portfolio in enumerate(portfolios):
+            report = {'name': portfolio.get('name', f'portfolio-{i}'), 'status': 'Success',
+                      'error': None, 'windows': 0, 'timings': {}}
+            try:
+                (running_balances, reference), report['timings']['load'] = loads[i].result()
+            except Exception as e:
+                _fail(report, 'load', e)
+            finally:
+                if i + max_workers < len(portfolios):
+                    loads.append(executor.submit(_timed, _load_portfolio, portfolios[i + max_workers].get('db_config'), horizon))
+            if report['status'] == 'Success':
+                try:
+                    investment_windows, report['timings']['algorithm'] = _timed(algorithm_stage, running_balances, reference, horizon)
+                    report['windows'] = len(investment_windows)
+                    _, report['timings']['write'] = _timed(_write_portfolio, investment_windows, reference, portfolio.get('db_config'))
+                except Exception as e:
+                    _fail(report, 'algorithm' if 'algorithm' not in report['timings'] else 'write', e)
+            # Release the finished load so only in-flight portfolios stay in memory
+            loads[i] = None
+            logging.info(f"Portfolio {report['name']}: {report['status']} {json.dumps(report['timings'])}")
+            reports.append(report)
+    failed = sum(report['status'] != 'Success' for report in reports)
+    logging.info(f'Treasury forecasting batch complete. {len(reports) - failed} succeeded, {failed} failed.')
+    return reports
+
+def _load_portfolio(db_config, horizon):
+    """Load one portfolio in its own session (runs in a loader thread, counting its own connections)."""
+    with count_connections(), db_session(db_config) as conn:
+        return load_stage(conn, horizon)
+
+def _write_portfolio(investment_windows, reference, db_config):
+    """Write one portfolio's windows in its own session."""
+    with count_connections(), db_session(db_config) as conn:
+        write_stage(investment_windows, reference, conn)
+
+def _timed(stage, *args):
+    """Run a stage and return its result with its wall time in seconds."""
+    start = time.perf_counter()
+    result = stage(*args)
+    return result, round(time.perf_counter() - start, 3)
+
+def _fail(report, stage, error):
+    """Record a failed stage in a portfolio report."""
+    logging.error(f"Portfolio {report['name']} failed in the {stage} stage: {error}")
+    report['status'] = 'Failure'
+    report['error'] = f'{stage}: {error}'
 
 if __name__ == "__main__":
     # This is for local testing
     logging.basicConfig(level=logging.INFO)
-    ProcessTreasuryForecastingData()
\ No newline at end of file
+    if sys.argv[1:] == ['health']:
+        print(json.dumps(HealthCheck(check_database=True)))
+    else:
+        ProcessTreasuryForecastingData()
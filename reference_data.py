@@ -0,0 +1,82 @@
+import time
+import logging
+import threading
+import data_processor
+from shared.config import get_config, database_key
+
+# Reference data by (host, port, database), loaded once per process
+_memo = {}
+_memo_lock = threading.Lock()
+# One lock per database held during its load, so a cold load only blocks the loaders of that database
+_loading = {}
+
+class ReferenceData:
+    """
+    The asset class reference data of one database, shared by the load, algorithm and write stages.
+    Attributes:
+        asset_classes: DataFrame from data_processor.load_asset_classes (float64 AssetClassPercentMax)
+        title_to_id: Dict of AssetClassID by asset class title
+        title_to_percent_max: Dict of PercentMax by asset class title (NULL PercentMax as 1.0)
+        loaded_at: time.time() of the load
+    """
+    def __init__(self, asset_classes):
+        self.asset_classes = asset_classes
+        self.title_to_id = dict(zip(asset_classes['AssetClassTitle'], asset_classes['AssetClassID']))
+        self.title_to_percent_max = dict(zip(asset_classes['AssetClassTitle'],
+                                             asset_classes['AssetClassPercentMax'].fillna(1.0)))
+        self.loaded_at = time.time()
+
+def get_reference_data(conn=None, refresh=False):
+    """
+    Get the reference data of the connection's database from the in-process memo, loading it on
+        first use, after invalidate_reference_data() and once it is older than REFERENCE_DATA_TTL.
+        The memo is keyed by host, port and database (see shared.config.database_key), so tenants
+        with the same schema name on different servers never share asset class IDs. The load runs
+        outside the memo lock: concurrent callers of the same database wait for it, the others don't.
+    Args:
+        conn: Database connection of the run's db_session (a new session is opened only on a load)
+        refresh: Reload even if memoized
+    Returns:
+        ReferenceData: The asset classes and their lookup dicts
+    """
+    key = database_key(conn)
+    requested = time.time()
+    with _memo_lock:
+        reference = _memo.get(key)
+        if not refresh and _is_fresh(reference):
+            return reference
+        loading = _loading.setdefault(key, threading.Lock())
+    with loading:
+        with _memo_lock:
+            reference = _memo.get(key)
+        # Loaded by another caller while this one waited
+        if reference is not None and reference.loaded_at >= requested:
+            return reference
+        logging.info(f'Loading the reference data of database {key[2]} on {key[0]}')
+        reference = ReferenceData(data_processor.load_asset_classes(conn=conn))
+        with _memo_lock:
+            _memo[key] = reference
+    return reference
+
+def _is_fresh(reference):
+    return reference is not None and time.time() - reference.loaded_at <= get_config()['reference_data_ttl']
+
+def invalidate_reference_data(database=None):
+    """
+    Forget the memoized reference data of one database (all databases if omitted), e.g. after
+        editing AssetClass
+    Args:
+        database: A database name (forgotten on every host) or a database_key() tuple
+    """
+    with _memo_lock:
+        if database is None:
+            _memo.clear()
+        else:
+            for key in [key for key in _memo if database in (key, key[2])]:
+                del _memo[key]
+
+def title_to_id(asset_classes):
+    """Dict of AssetClassID by title from ReferenceData or an asset classes DataFrame"""
+    if isinstance(asset_classes, ReferenceData):
+        return asset_classes.title_to_id
+    return dict(zip(asset_classes['AssetClassTitle'], asset_classes['AssetClassID']))
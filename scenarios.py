@@ -0,0 +1,194 @@
+"""
+What-if evaluation of the investment windows over perturbed balance forecasts.
+A scenario is a (dates,) offset added to the Cash/Sweep and Portfolio running totals: S scenarios
+    are an (S, dates) array built from changes of the daily cash flows (scale_inflows,
+    shift_flows, delay_payroll, random_scenarios; sum arrays to combine stresses, concatenate them
+    to evaluate several sets). Every scenario's Available balances and low points are computed in
+    one batch along the date axis instead of re-running the pipeline per scenario.
+"""
+import numpy as np
+import pandas as pd
+from algorithm_processor import get_horizon
+from balance_matrix import PORTFOLIO, CASH
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+class ScenarioResult:
+    """
+    Windows and distributions of a scenario batch.
+    Attributes:
+        windows: The low point windows of every scenario (identify_low_points' columns plus
+            Scenario, and Asset Class from run_scenarios)
+        summary: One row per scenario: Windows, MinimumBalance, MinimumDate
+        distribution: Quantiles over the scenarios of the amount investable from each start date to
+            the end of the horizon (the suffix minimum), by TimeSpanDays
+    """
+    def __init__(self, windows, summary, distribution):
+        self.windows = windows
+        self.summary = summary
+        self.distribution = distribution
+
+def evaluate_scenarios(dates, balances, min_days=2, names=None):
+    """
+    The low point windows of S balance series over the same dates, in one batch: a 2-D suffix
+        minimum along the date axis replaces S runs of identify_low_points, whose windows (and
+        order) each scenario's rows equal.
+    Args:
+        dates: Sorted, unique dates of the series
+        balances: (S, dates) array of balances, one row per scenario
+        min_days: Minimum number of days for a valid time span
+        names: Optional scenario names (default 0..S-1)
+    Returns:
+        ScenarioResult: Windows, per-scenario summary and the investable amount distribution
+    """
+    dates = pd.DatetimeIndex(dates).to_numpy()
+    balances = np.atleast_2d(np.asarray(balances, dtype=np.float64))
+    count, n = balances.shape
+    names = np.arange(count) if names is None else np.asarray(names)
+    max_date = dates[-1]
+    # The last date can't be a low point itself (every span ends there), as in find_low_points
+    n_body = n - 1
+    values = np.where(np.isnan(balances), np.inf, balances)
+    body = values[:, :n_body]
+    body_min = np.minimum.accumulate(body[:, ::-1], axis=1)[:, ::-1]
+    next_min = np.concatenate([body_min[:, 1:], np.full((count, 1), np.inf)], axis=1)[:, :n_body]
+    low = (body <= values[:, n_body:]) & (body < next_min) | np.isnan(balances[:, :n_body])
+    spans = (max_date - dates[:n_body]) // np.timedelta64(1, 'D') + 1
+    low &= spans >= min_days
+    scenario, position = np.nonzero(low)
+    # The full span of the absolute minimum is added when it isn't one of the low points
+    absolute_pos = np.nanargmin(balances, axis=1)
+    absolute_min = balances[np.arange(count), absolute_pos]
+    captured = np.zeros(count, dtype=bool)
+    captured[scenario[balances[scenario, position] == absolute_min[scenario]]] = True
+    full = np.flatnonzero(~captured)
+    full_span = (max_date - dates[0]) // np.timedelta64(1, 'D') + 1
+    scenario = np.concatenate([scenario, full])
+    low_pos = np.concatenate([position, absolute_pos[full]])
+    start_pos = np.concatenate([position, np.zeros(len(full), dtype=np.int64)])
+    time_spans = np.concatenate([spans[position], np.full(len(full), full_span)]).astype(np.int64)
+    # identify_low_points' order within a scenario: by time span, a low point before the full span
+    order = np.lexsort((np.arange(len(scenario)) >= len(position), time_spans, scenario))
+    scenario, low_pos, start_pos, time_spans = scenario[order], low_pos[order], start_pos[order], time_spans[order]
+    windows = pd.DataFrame({
+        'Scenario': names[scenario],
+        'LowPointDate': dates[low_pos],
+        'LowPointBalance': balances[scenario, low_pos],
+        'StartDate': dates[start_pos],
+        'EndDate': max_date,
+        'TimeSpanDays': time_spans,
+    })
+    summary = pd.DataFrame({
+        'Scenario': names,
+        'Windows': np.bincount(scenario, minlength=count),
+        'MinimumBalance': absolute_min,
+        'MinimumDate': dates[absolute_pos],
+    })
+    # Amount investable from each start date to the end of the horizon: the suffix minimum
+    investable = np.minimum(body_min, values[:, n_body:])
+    investable[np.isinf(investable)] = np.nan
+    distribution = pd.DataFrame(
+        np.nanquantile(investable, QUANTILES, axis=0).T if count and n_body else np.empty((n_body, len(QUANTILES))),
+        columns=[f'p{round(q * 100)}' for q in QUANTILES],
+    )
+    distribution.insert(0, 'TimeSpanDays', spans.astype(np.int64))
+    return ScenarioResult(windows, summary, distribution[::-1].reset_index(drop=True))
+
+def run_scenarios(matrix, offsets, asset_classes=None, horizon=None, min_days=2, names=None):
+    """
+    Evaluate S scenarios for every asset class of a computed BalanceMatrix.
+    Each scenario's offset moves the Cash/Sweep and the Portfolio running totals, and the class's
+        Available is recomputed from them for all scenarios at once:
+            Available = max(0, min(Cash/Sweep + offset, (Portfolio + offset) × PercentMax - RunningTotal))
+        The zero offset gives the windows of process_investment_algorithm.
+    Args:
+        matrix: BalanceMatrix after compute()
+        offsets: (S, dates in the horizon) balance offsets (see horizon_cash_flows)
+        asset_classes: Asset class titles (defaults to the matrix's classes except Portfolio and Cash/Sweep)
+        horizon: (after, until) dates (defaults to get_horizon())
+        min_days, names: As for evaluate_scenarios
+    Returns:
+        ScenarioResult: With an Asset Class column in the windows, summary and distribution
+    """
+    after, until = get_horizon() if horizon is None else (pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1]))
+    start, end = matrix.dates.searchsorted([after, until], side='right')
+    offsets = np.atleast_2d(np.asarray(offsets, dtype=np.float64))
+    if offsets.shape[1] != end - start:
+        raise ValueError(f'Offsets cover {offsets.shape[1]} days, the horizon has {end - start}')
+    cash = matrix.running_total[start:end, matrix.position(CASH)] + offsets
+    portfolio = matrix.running_total[start:end, matrix.position(PORTFOLIO)] + offsets
+    if asset_classes is None:
+        asset_classes = [title for title in matrix.classes if title not in (PORTFOLIO, CASH)]
+    results = []
+    for asset_class in asset_classes:
+        j = matrix.position(asset_class)
+        if j is None:
+            continue
+        rows = matrix.present[start:end, j]
+        if not rows.any():
+            continue
+        available = np.multiply(portfolio[:, rows], matrix.percent_max[j])
+        np.subtract(available, matrix.running_total[start:end, j][rows], out=available)
+        np.maximum(available, 0, out=available)
+        np.minimum(cash[:, rows], available, out=available)
+        np.maximum(available, 0, out=available)
+        result = evaluate_scenarios(matrix.dates[start:end][rows], available, min_days, names)
+        for frame in (result.windows, result.summary, result.distribution):
+            frame.insert(0, 'Asset Class', asset_class)
+        results.append(result)
+    if not results:
+        raise ValueError('No asset class has running balances in the horizon')
+    return ScenarioResult(*(pd.concat([getattr(result, name) for result in results], ignore_index=True)
+                            for name in ('windows', 'summary', 'distribution')))
+
+def horizon_cash_flows(matrix, horizon=None):
+    """
+    The daily Cash/Sweep flows of the horizon, the base the perturbations change
+    Returns:
+        tuple: (dates, flows) where flows[0] is the change from the day before the horizon
+    """
+    after, until = get_horizon() if horizon is None else (pd.Timestamp(horizon[0]), pd.Timestamp(horizon[1]))
+    start, end = matrix.dates.searchsorted([after, until], side='right')
+    cash = matrix.running_total[max(start - 1, 0):end, matrix.position(CASH)]
+    flows = np.diff(cash) if start > 0 else np.concatenate([[0.0], np.diff(cash)])
+    return matrix.dates[start:end], np.nan_to_num(flows)
+
+def scale_inflows(flows, percents):
+    """Offsets of inflows changed by each percent (+10 is 10% more receipts, -10 10% less)"""
+    inflows = np.maximum(flows, 0)
+    return np.cumsum(inflows[None, :] * (np.asarray(percents, dtype=np.float64)[:, None] / 100), axis=1)
+
+def shift_flows(flows, lags, select=None):
+    """
+    Offsets of the selected flows moved by each lag in days (positive: later). Flows moved past
+        the last day leave the horizon; flows moved before the first day land on it.
+    Args:
+        flows: Daily flows
+        lags: Lag of each scenario
+        select: Boolean mask of the flows that move (default all)
+    """
+    moving = np.where(select, flows, 0.0) if select is not None else np.asarray(flows, dtype=np.float64)
+    lags = np.asarray(lags, dtype=np.int64)
+    n = len(moving)
+    offsets = np.empty((len(lags), n))
+    for lag in np.unique(lags):
+        target = np.clip(np.arange(n) + lag, 0, n)
+        moved = np.bincount(target, weights=moving, minlength=n + 1)[:n]
+        offsets[lags == lag] = np.cumsum(moved - moving)
+    return offsets
+
+def delay_payroll(flows, dates, lags, days=(1, 15)):
+    """Offsets of the outflows on payroll days (day of month in days) paid lags days later"""
+    payroll = (np.asarray(flows) < 0) & np.isin(pd.DatetimeIndex(dates).day, days)
+    return shift_flows(flows, lags, payroll)
+
+def random_scenarios(flows, dates, count, seed=0, inflow_percent=10, max_lag=5):
+    """
+    Offsets of count random stresses: inflows scaled by up to ±inflow_percent, receipts shifted by
+        up to ±max_lag days and payroll delayed by up to max_lag days
+    """
+    rng = np.random.default_rng(seed)
+    flows = np.asarray(flows, dtype=np.float64)
+    return (scale_inflows(flows, rng.uniform(-inflow_percent, inflow_percent, count))
+            + shift_flows(flows, rng.integers(-max_lag, max_lag + 1, count), flows > 0)
+            + delay_payroll(flows, dates, rng.integers(0, max_lag + 1, count)))
@@ -0,0 +1,239 @@
+import json
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+import opportuneIQ
+from algorithm_processor import get_horizon
+from reference_data import get_reference_data
+from shared.config import get_config, database_key, db_session, load_env
+
+class Run:
+    """
+    One pipeline run of the service and the state its status and result endpoints report.
+    Attributes:
+        run_id: Identifier of the run
+        key: (host, port, database, after, until) of the run; triggers with the same key share it
+        status: 'running', 'succeeded' or 'failed'
+        triggers: Number of trigger requests merged into the run
+        windows: Investment windows DataFrame once succeeded
+        report: RunReport dict once finished
+    """
+    def __init__(self, key, db_config, horizon):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.db_config = db_config
+        self.horizon = horizon
+        self.status = 'running'
+        self.triggers = 1
+        self.started = datetime.now()
+        self.finished = None
+        self.error = None
+        self.windows = None
+        self.report = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'database': self.key[2],
+            'horizon': [f'{self.horizon[0]:%Y-%m-%d}', f'{self.horizon[1]:%Y-%m-%d}'],
+            'status': self.status,
+            'triggers': self.triggers,
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': self.finished.isoformat(timespec='seconds') if self.finished else None,
+            'error': self.error,
+            'windows': None if self.windows is None else len(self.windows),
+            'report': self.report,
+        }
+
+class TreasuryService:
+    """
+    Long-lived form of ProcessTreasuryForecastingData. The process keeps its imports, settings,
+        connection pools, reference data memo and algorithm worker processes warm between runs.
+    Runs execute in a thread pool (SERVICE_RUNS at a time) so the event loop keeps answering;
+        the algorithm fans out to a process pool created once. A trigger for a database and
+        horizon that already has a run in flight joins that run instead of starting another.
+    """
+    def __init__(self, runs=None, history=None, algorithm_workers=None):
+        config = get_config()
+        self.history = history or config['service_history']
+        self.runs = OrderedDict()
+        self.in_flight = {}
+        self.run_executor = ThreadPoolExecutor(max_workers=runs or config['service_runs'],
+                                               thread_name_prefix='treasury-run')
+        workers = algorithm_workers or config['algorithm_workers']
+        self.algorithm_executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    async def warm_up(self, db_config=None):
+        """Load the settings, open the connection pool and memoize the reference data (failures are only logged)"""
+        load_env()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.run_executor, self._warm_up, db_config)
+        except Exception as e:
+            logging.warning(f'Service warm-up failed, the first run will load cold: {e}')
+
+    @staticmethod
+    def _warm_up(db_config):
+        with db_session(db_config) as conn:
+            get_reference_data(conn=conn)
+
+    def trigger(self, db_config=None):
+        """
+        Start a run for the database, or join the run in flight for the same database and horizon
+        Returns:
+            tuple: (Run, True if a new run was started)
+        """
+        horizon = get_horizon()
+        # The same schema name on another host or port is another tenant (see database_key)
+        key = database_key(db_config=db_config) + horizon
+        run = self.in_flight.get(key)
+        if run is not None:
+            run.triggers += 1
+            logging.info(f'Trigger merged into run {run.run_id} ({run.triggers} triggers)')
+            return run, False
+        run = Run(key, db_config, horizon)
+        self.in_flight[key] = run
+        self.runs[run.run_id] = run
+        self._forget_finished()
+        asyncio.get_running_loop().create_task(self._execute(run))
+        logging.info(f'Run {run.run_id} started for database {run.key[2]}')
+        return run, True
+
+    async def _execute(self, run):
+        loop = asyncio.get_running_loop()
+        try:
+            run.windows, report = await loop.run_in_executor(
+                self.run_executor, opportuneIQ.run_treasury_forecast, run.db_config, run.horizon, self.algorithm_executor
+            )
+            run.report = report.to_dict()
+            run.status = 'succeeded'
+        except Exception as e:
+            logging.error(f'Run {run.run_id} failed: {e}')
+            run.status = 'failed'
+            run.error = str(e)
+        finally:
+            run.finished = datetime.now()
+            self.in_flight.pop(run.key, None)
+            run.done.set()
+
+    def _forget_finished(self):
+        """Keep at most SERVICE_HISTORY runs, dropping the oldest finished ones"""
+        for run_id in [run_id for run_id, run in self.runs.items() if run.finished]:
+            if len(self.runs) <= self.history:
+                break
+            del self.runs[run_id]
+
+    async def wait(self, run, timeout):
+        """Wait up to timeout seconds for the run to finish"""
+        try:
+            await asyncio.wait_for(asyncio.shield(run.done.wait()), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def route(self, method, path, query, body):
+        """
+        Answer one request:
+            GET  /health               liveness and the runs in flight
+            POST /runs                 trigger a run ({"database": ...} optional), 202 with its status
+            GET  /runs                 status of the recent runs
+            GET  /runs/<id>            status of one run
+            GET  /runs/<id>/result     its windows (?wait=<seconds> waits for the run to finish)
+        Returns:
+            tuple: (HTTP status, JSON-serializable body)
+        """
+        parts = [part for part in path.split('/') if part]
+        if method == 'GET' and parts == ['health']:
+            return 200, {'status': 'ok', 'in_flight': len(self.in_flight)}
+        if parts[:1] != ['runs']:
+            return 404, {'error': f'Unknown path {path}'}
+        if len(parts) == 1:
+            if method == 'POST':
+                options = json.loads(body) if body else {}
+                if not isinstance(options, dict):
+                    raise ValueError('The body must be a JSON object')
+                database = options.get('database')
+                run, started = self.trigger({'database': database} if database else None)
+                return 202, dict(run.to_dict(), coalesced=not started)
+            return 200, [run.to_dict() for run in self.runs.values()]
+        run = self.runs.get(parts[1])
+        if run is None:
+            return 404, {'error': f'Unknown run {parts[1]}'}
+        if len(parts) == 2:
+            return 200, run.to_dict()
+        if parts[2:] != ['result']:
+            return 404, {'error': f'Unknown path {path}'}
+        if 'wait' in query:
+            await self.wait(run, float(query['wait'][0]))
+        if run.status == 'running':
+            return 409, run.to_dict()
+        if run.status == 'failed':
+            return 500, run.to_dict()
+        return 200, dict(run.to_dict(), windows=json.loads(run.windows.to_json(orient='records', date_format='iso')))
+
+    async def handle(self, reader, writer):
+        """Minimal HTTP/1.1 handler: one JSON request and response per connection"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = headers.get('content-length', '0')
+            if len(request_line) < 2:
+                status, payload = 400, {'error': 'Bad request'}
+            elif not (length.isascii() and length.isdigit()):
+                status, payload = 400, {'error': f'Bad Content-Length {length!r}'}
+            else:
+                body = await reader.readexactly(int(length))
+                url = urlsplit(request_line[1])
+                try:
+                    status, payload = await self.route(request_line[0].upper(), url.path, parse_qs(url.query), body)
+                except ValueError as e:
+                    status, payload = 400, {'error': str(e)}
+                except Exception as e:
+                    logging.exception(f'Request {request_line[1]} failed')
+                    status, payload = 500, {'error': str(e)}
+            content = json.dumps(payload, default=str).encode('utf-8')
+            writer.write(f'HTTP/1.1 {status} {_REASONS.get(status, "")}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(content)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.debug(f'Connection dropped: {e}')
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None):
+        """Warm up and answer requests until cancelled"""
+        config = get_config()
+        await self.warm_up()
+        server = await asyncio.start_server(self.handle, host or config['service_host'],
+                                            config['service_port'] if port is None else port)
+        logging.info(f"Treasury service listening on {', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.run_executor.shutdown(wait=False)
+        if self.algorithm_executor is not None:
+            self.algorithm_executor.shutdown(wait=False)
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 409: 'Conflict', 500: 'Internal Server Error'}
+
+if __name__ == "__main__":
+    # Local service: python service.py, then POST /runs and GET /runs/<id>/result?wait=60
+    logging.basicConfig(level=logging.INFO)
+    service = TreasuryService()
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,140 @@
+import os
+import time
+import hashlib
+import logging
+from pathlib import Path
+from shared.config import get_config
+
+# Source tables whose row count and MAX(LastEdited) fingerprint a table (or view). Tables without
+# sources are not cached: a bare row count misses in-place edits (e.g. a forecast Amount). Views
+# are fingerprinted through every table they are computed from, so the view never runs; add the
+# view's other sources with the QUERY_CACHE_SOURCES setting.
+FINGERPRINT_SOURCES = {
+    'AssetClass': ['AssetClass'],
+    'RunningBalanceDayView': ['{transaction_table}', 'AssetClass'],
+    '{transaction_table}': ['{transaction_table}'],
+}
+FINGERPRINT_SQL = "SELECT COUNT(*), MAX(`LastEdited`) FROM `{table}`"
+
+# Tables already logged as uncacheable (logged once per process, not on every fetch)
+_uncacheable = set()
+
+class QueryCache:
+    """
+    Local cache of query results as Arrow IPC (Feather) files, which keep the column types and
+    are memory-mapped when read back.
+    Entries are keyed by the query and a fingerprint of the data it reads (e.g. row count and
+    max(LastEdited)); a changed fingerprint is a cache miss. Entries expire after ttl seconds,
+    and the least recently used ones are evicted when the directory grows beyond max_bytes.
+    """
+    def __init__(self, directory, ttl=86400, max_bytes=1 << 30):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def path(self, query, fingerprint):
+        """File of a query result with the given fingerprint"""
+        key = hashlib.sha256(query.encode('utf-8')).hexdigest()[:32]
+        version = hashlib.sha256(repr(fingerprint).encode('utf-8')).hexdigest()[:16]
+        return self.directory / f'{key}_{version}.arrow'
+
+    def get(self, query, fingerprint):
+        """Cached result of the query, or None on a miss (unknown, changed or expired)"""
+        path = self.path(query, fingerprint)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            # pyarrow loads with the first cache read or write, not with the module
+            from pyarrow import feather
+            df = feather.read_table(path, memory_map=True).to_pandas()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache file {path.name}: {e}")
+            return None
+        # Touch the file so eviction drops the least recently used entries first
+        os.utime(path)
+        return df
+
+    def put(self, query, fingerprint, df):
+        """Store a query result, replacing older versions of the same query"""
+        path = self.path(query, fingerprint)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for stale in self.directory.glob(path.name.split('_')[0] + '_*.arrow'):
+            stale.unlink(missing_ok=True)
+        temporary = path.with_suffix('.tmp')
+        try:
+            from pyarrow import feather
+            feather.write_feather(df.reset_index(drop=True), temporary)
+            temporary.replace(path)
+        except Exception as e:
+            temporary.unlink(missing_ok=True)
+            logging.warning(f"Query result not cached: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete expired entries, then the least recently used ones beyond max_bytes"""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob('*.arrow'):
+            stat = path.stat()
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        """Delete every cached result"""
+        for path in self.directory.glob('*.arrow'):
+            path.unlink(missing_ok=True)
+
+def get_query_cache():
+    """The query cache of the configuration, or None when it is bypassed"""
+    config = get_config()
+    if config['query_cache_bypass']:
+        return None
+    return QueryCache(config['query_cache_dir'], ttl=config['query_cache_ttl'],
+                      max_bytes=config['query_cache_max_bytes'])
+
+def fingerprint_sources(table_name, transaction_table='Transaction'):
+    """
+    The source tables fingerprinting table_name: FINGERPRINT_SOURCES, overridden per table by the
+    QUERY_CACHE_SOURCES setting ('View:TableA,TableB;Other:TableC'). Empty for an uncacheable table.
+    """
+    sources = {name.format(transaction_table=transaction_table): tables for name, tables in FINGERPRINT_SOURCES.items()}
+    sources.update(get_config()['query_cache_sources'])
+    return [table.format(transaction_table=transaction_table) for table in sources.get(table_name, [])]
+
+def query_fingerprint(cursor, table_name, transaction_table='Transaction'):
+    """
+    Run the fingerprint queries of the table's sources. Returns None for a table without sources or
+    when a query fails (e.g. a source has no LastEdited column), which makes the result uncacheable
+    rather than wrong.
+    """
+    sources = fingerprint_sources(table_name, transaction_table)
+    if not sources:
+        _log_uncacheable(table_name, 'it has no change fingerprint')
+        return None
+    fingerprint = ()
+    try:
+        for table in sources:
+            cursor.execute(FINGERPRINT_SQL.format(table=table))
+            fingerprint += tuple(str(value) for value in cursor.fetchall()[0])
+    except Exception as e:
+        _log_uncacheable(table_name, f'no fingerprint of {table}: {e}')
+        return None
+    return fingerprint
+
+def _log_uncacheable(table_name, reason):
+    """Log that a table's results are not cached, at warning level only the first time"""
+    level = logging.DEBUG if table_name in _uncacheable else logging.WARNING
+    _uncacheable.add(table_name)
+    logging.log(level, f"Not caching {table_name}: {reason}")
@@ -1,37 +1,318 @@
-import pandas as pd
-import numpy as np
 import os
-import mysql.connector
-from mysql.connector import Error
-from dotenv import load_dotenv
+import time
+import logging
+import threading
+import functools
+import itertools
+import contextvars
+from contextlib import contextmanager
+# mysql.connector and dotenv are imported on first use: importing the settings stays cheap for
+# health checks and the stages that never touch the database
+
+# Connection pools by connection params, created once per process, least recently used first
+_pools = {}
+_pools_lock = threading.Lock()
+# Numbers of the pool names (unique for the life of the process)
+_pool_numbers = itertools.count()
+# Connections opened and checked out by the process since the last reset_connection_stats(), and
+# by the run counting in this context (see count_connections); both updated under _stats_lock
+_connection_stats = {'opened': 0, 'checkouts': 0}
+_run_connection_stats = contextvars.ContextVar('connection_stats', default=None)
+_stats_lock = threading.Lock()
 
 def get_config():
     """Get configuration from environment variables"""
     return {
         # Any configuration values you need
+        # Worker processes for the per-asset-class algorithm (1 = serial)
+        "algorithm_workers": int(os.getenv("ALGORITHM_WORKERS", 1)),
+        # Connections kept open per database by the connection pool
+        "db_pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        # Connections per pool of a db_config override (batch portfolios, service tenants), the
+        # pools kept at most (the least recently used one is closed beyond it) and the seconds a
+        # session waits for a free connection of an exhausted pool
+        "db_override_pool_size": int(os.getenv("DB_OVERRIDE_POOL_SIZE", 2)),
+        "db_max_pools": int(os.getenv("DB_MAX_POOLS", 8)),
+        "db_pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        # Rows per executemany batch of the InvestmentWindow writer
+        "db_write_batch_size": int(os.getenv("DB_WRITE_BATCH_SIZE", 1000)),
+        # How new windows replace the InvestmentWindow table: swap, transaction, diff or truncate
+        "publish_mode": os.getenv("INVESTMENT_WINDOW_PUBLISH_MODE", "swap"),
+        # Where the running balances come from: the RunningBalanceDayView SQL view ('view') or
+        # the raw transaction rows folded in by balance_processor ('transactions')
+        "running_balance_source": os.getenv("RUNNING_BALANCE_SOURCE", "view"),
+        # Table (or view) with one row per transaction: TransactionDate, TransactionClass, Amount
+        "transaction_table": os.getenv("TRANSACTION_TABLE", "Transaction"),
+        # Directory of the running balance checkpoints
+        "balance_checkpoint_dir": os.getenv("BALANCE_CHECKPOINT_DIR", ".cache"),
+        # Share the Cash/Sweep balance between the asset classes' windows before they are written
+        # (see allocation.py); off publishes each class's LowPointBalance as it is
+        "allocate_windows": os.getenv("ALLOCATE_WINDOWS", "true").lower() in ("1", "true", "yes"),
+        # Directory of the persisted low point state of each asset class (incremental windows)
+        "low_point_state_dir": os.getenv("LOW_POINT_STATE_DIR", ".cache/low_points"),
+        # Run horizon: windows are searched in (HORIZON_START, HORIZON_END]. Either bound defaults to
+        # HORIZON_DAYS from the other one; without both the horizon rolls from today
+        "horizon_start": os.getenv("HORIZON_START") or None,
+        "horizon_end": os.getenv("HORIZON_END") or None,
+        "horizon_days": int(os.getenv("HORIZON_DAYS", 160)),
+        # Comma-separated asset class titles to process (default: every class of the AssetClass table)
+        "asset_classes": [title.strip() for title in os.getenv("ASSET_CLASSES", "").split(",") if title.strip()] or None,
+        # Seconds the asset class reference data stays memoized in the process
+        "reference_data_ttl": int(os.getenv("REFERENCE_DATA_TTL", 3600)),
+        # Rows per fetchmany() chunk of the typed streaming fetch
+        "fetch_chunk_size": int(os.getenv("FETCH_CHUNK_SIZE", 50000)),
+        # Directory of the JSON run reports (empty: the report is only logged)
+        "run_report_dir": os.getenv("RUN_REPORT_DIR", ""),
+        # Stage to profile (e.g. algorithm or load/balances), with cProfile or pyinstrument, into PROFILE_DIR
+        "profile_stage": os.getenv("PROFILE_STAGE") or None,
+        "profiler": os.getenv("PROFILER", "cprofile"),
+        "profile_dir": os.getenv("PROFILE_DIR", ".cache/profiles"),
+        # Long-lived service (service.py): address, concurrent runs and finished runs kept for the
+        # status and result endpoints
+        "service_host": os.getenv("SERVICE_HOST", "127.0.0.1"),
+        "service_port": int(os.getenv("SERVICE_PORT", 8080)),
+        "service_runs": int(os.getenv("SERVICE_RUNS", 2)),
+        "service_history": int(os.getenv("SERVICE_HISTORY", 20)),
+        # Local cache of query results (see shared/cache.py): directory, entry lifetime (seconds),
+        # total size limit (bytes) and a switch to bypass it, e.g. when debugging the SQL
+        "query_cache_dir": os.getenv("QUERY_CACHE_DIR", ".cache/queries"),
+        "query_cache_ttl": int(os.getenv("QUERY_CACHE_TTL", 86400)),
+        "query_cache_max_bytes": int(os.getenv("QUERY_CACHE_MAX_BYTES", 1 << 30)),
+        "query_cache_bypass": os.getenv("QUERY_CACHE_BYPASS", "").lower() in ("1", "true", "yes"),
+        # Source tables fingerprinting a cached table or view, overriding the defaults of
+        # shared/cache.py: 'RunningBalanceDayView:Transaction,AssetClass,BalanceAdjustment;...'
+        "query_cache_sources": {
+            name.strip(): [table.strip() for table in tables.split(",") if table.strip()]
+            for name, _, tables in (entry.partition(":") for entry in os.getenv("QUERY_CACHE_SOURCES", "").split(";"))
+            if name.strip()
+        },
+        # Database engine of db_session(): mysql, or an embedded sqlite/duckdb file at STORAGE_PATH
+        # (e.g. a snapshot.py export) for offline runs, CI and benchmarks (see shared/storage.py)
+        "storage_backend": os.getenv("STORAGE_BACKEND", "mysql").lower(),
+        "storage_path": os.getenv("STORAGE_PATH", ".cache/treasury.sqlite"),
     }
 
-def get_db_connection():
-    """Get database connection from environment variables"""
-    try:
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """Load the .env file into the environment (once per process)"""
+    from pathlib import Path
+    from dotenv import load_dotenv
+    env_path = Path('.') / '.env'
+    load_dotenv(dotenv_path=env_path, override=True)
+
+def get_db_settings(db_config=None):
+    """
+    Get database connection params from environment variables
+    Args:
+        db_config: Optional connection params (host, user, password, database, port) that override
+            the environment, e.g. to point a batch run at another tenant's database
+    """
+    load_env()
+    # Database connection params from env variables (override .env values)
+    DB_CONFIG = {
+        "host": os.getenv("DB_HOST"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "database": os.getenv("DB_NAME"),
+        "port": os.getenv("DB_PORT", 3306)  # Default MySQL port
+    }
+    # LOAD DATA LOCAL INFILE bulk writes (the server needs local_infile enabled too)
+    if os.getenv("DB_ALLOW_LOCAL_INFILE", "").lower() in ("1", "true", "yes"):
+        DB_CONFIG["allow_local_infile"] = True
+    DB_CONFIG.update(db_config or {})
+    return DB_CONFIG
+
+def database_key(conn=None, db_config=None):
+    """
+    (host, port, database) identifying a tenant's database, for the per-database memos,
+        checkpoints and cache entries: the same schema name can exist on several servers.
+        Embedded databases (shared/storage.py) are identified by their file.
+    Args:
+        conn: Connection of the database (the environment's settings with db_config if omitted)
+        db_config: Optional connection params overriding the environment (see get_db_settings)
+    """
+    from pathlib import Path
+    if conn is None:
+        if get_config()['storage_backend'] != 'mysql':
+            settings = db_config or {}
+            path = settings.get('path') or get_config()['storage_path']
+            return (str(Path(path).resolve()), None, settings.get('database') or Path(path).stem)
+        settings = get_db_settings(db_config)
+        return (settings['host'], str(settings['port']), settings['database'])
+    if getattr(conn, 'backend', None) is not None:
+        return (str(Path(conn.path).resolve()), None, conn.database)
+    port = getattr(conn, 'server_port', None)
+    return (getattr(conn, 'server_host', None), None if port is None else str(port), getattr(conn, 'database', None))
+
+def database_slug(conn=None, db_config=None):
+    """database_key as a file name part: 'host_port_database' ('default' when none is set)"""
+    import re
+    parts = [part for part in database_key(conn, db_config) if part]
+    return re.sub(r'[^\w.-]+', '_', '_'.join(parts)) or 'default'
+
+# Pool class, built by _pool_class() on the first pool
+_CountingConnectionPool = None
+
+def _pool_class():
+    """The MySQL connection pool class that counts the physical connections it opens"""
+    global _CountingConnectionPool
+    if _CountingConnectionPool is None:
+        from mysql.connector import pooling
+
+        class CountingConnectionPool(pooling.MySQLConnectionPool):
+            # Set when the pool is evicted from _pools
+            closed = False
+
+            def add_connection(self, cnx=None):
+                if cnx is not None and self.closed:
+                    # Returned to an evicted pool: disconnect instead of keeping it idle
+                    cnx.disconnect()
+                    return
+                super().add_connection(cnx)
+                if cnx is None:
+                    _count_connections('opened')
+
+            def close(self):
+                """Disconnect the idle connections, and the checked-out ones when they are returned"""
+                self.closed = True
+                self._remove_connections()
 
-        # Load specific connection params from .env file
-        from pathlib import Path
-        env_path = Path('.') / '.env'
-        load_dotenv(dotenv_path=env_path, override=True, verbose=True)
-
-        # Database connection params from env variables (override .env values)
-        DB_CONFIG = {
-            "host": os.getenv("DB_HOST"),
-            "user": os.getenv("DB_USER"),
-            "password": os.getenv("DB_PASSWORD"),
-            "database": os.getenv("DB_NAME"),
-            "port": os.getenv("DB_PORT", 3306)  # Default MySQL port
-        }
-        print('Database URL: ' + os.environ.get('DB_HOST'))
-        print('Database name: ' + os.environ.get('DB_NAME'))
-        print('Database user: ' + os.environ.get('DB_USER'))
-        connection = mysql.connector.connect(**DB_CONFIG)
+        _CountingConnectionPool = CountingConnectionPool
+    return _CountingConnectionPool
+
+def get_db_pool(db_config=None):
+    """
+    Get the connection pool for the database, creating it on first use.
+    A pool opens all its connections up front: the environment's database gets DB_POOL_SIZE,
+        db_config overrides (one per tenant) DB_OVERRIDE_POOL_SIZE. At most DB_MAX_POOLS pools
+        are kept; beyond that the least recently used one is closed, so a batch over many tenants
+        or a long-lived service doesn't hold idle connections to every database it ever served.
+    """
+    from mysql.connector import Error
+    config = get_config()
+    DB_CONFIG = get_db_settings(db_config)
+    key = tuple(sorted((name, str(value)) for name, value in DB_CONFIG.items()))
+    evicted = []
+    with _pools_lock:
+        if key in _pools:
+            # Most recently used last
+            _pools[key] = _pools.pop(key)
+        else:
+            logging.info(f"Creating connection pool for database {DB_CONFIG['database']} on {DB_CONFIG['host']}")
+            try:
+                _pools[key] = _pool_class()(
+                    pool_name=f'treasury_{next(_pool_numbers)}',
+                    pool_size=config['db_override_pool_size'] if db_config else config['db_pool_size'],
+                    **DB_CONFIG
+                )
+            except Error as e:
+                raise Exception(f"Database connection error: {str(e)}")
+            while len(_pools) > max(config['db_max_pools'], 1):
+                evicted.append(_pools.pop(next(iter(_pools))))
+        pool = _pools[key]
+    for old in evicted:
+        logging.info(f"Closing the least recently used connection pool {old.pool_name}")
+        old.close()
+    return pool
+
+def get_db_connection(db_config=None):
+    """
+    Get a pooled database connection. Closing the connection returns it to the pool. When every
+        connection of the pool is checked out, wait up to DB_POOL_TIMEOUT seconds for one.
+    With an embedded STORAGE_BACKEND the connection is to the database file at STORAGE_PATH
+        instead (db_config may override it with 'path' and name it with 'database').
+    Args:
+        db_config: Optional connection params overriding the environment (see get_db_settings)
+    """
+    load_env()
+    config = get_config()
+    if config['storage_backend'] != 'mysql':
+        from shared.storage import open_database
+        settings = db_config or {}
+        connection = open_database(settings.get('path') or config['storage_path'], config['storage_backend'],
+                                   settings.get('database'))
+        _count_connections('opened')
+        _count_connections('checkouts')
         return connection
-    except Error as e:
-        raise Exception(f"Database connection error: {str(e)}")
\ No newline at end of file
+    from mysql.connector import Error
+    from mysql.connector.errors import PoolError
+    # An exhausted pool is waited on (DB_POOL_TIMEOUT) rather than failing the run
+    deadline = time.monotonic() + config['db_pool_timeout']
+    delay = 0.01
+    while True:
+        try:
+            connection = get_db_pool(db_config).get_connection()
+            _count_connections('checkouts')
+            return connection
+        except PoolError as e:
+            if time.monotonic() >= deadline:
+                raise Exception(f"Database connection error: {str(e)}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+        except Error as e:
+            raise Exception(f"Database connection error: {str(e)}")
+
+@contextmanager
+def db_session(db_config=None):
+    """
+    Context manager around one pooled connection, shared by every reader and writer of a run.
+    The transaction is rolled back if the block raises, and the connection always goes back to
+        the pool on exit.
+    Args:
+        db_config: Optional connection params overriding the environment (see get_db_settings)
+    """
+    conn = get_db_connection(db_config)
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def with_db_session(func):
+    """
+    Decorator for readers and writers taking a conn keyword argument: when no connection is
+        passed, the call runs in its own db_session().
+    """
+    @functools.wraps(func)
+    def wrapper(*args, conn=None, **kwargs):
+        if conn is not None:
+            return func(*args, conn=conn, **kwargs)
+        with db_session() as conn:
+            return func(*args, conn=conn, **kwargs)
+    return wrapper
+
+def _count_connections(name, count=1):
+    """Add to a connection counter of the process and of the run counting in this context"""
+    with _stats_lock:
+        _connection_stats[name] += count
+        counters = _run_connection_stats.get()
+        if counters is not None:
+            counters[name] += count
+
+@contextmanager
+def count_connections():
+    """
+    Count the connections opened and checked out inside the block into counters of its own.
+    The counters belong to the context (thread or task) of the block: runs in concurrent threads,
+        like the loaders of a batch or the requests of a service, don't see each other's connections.
+    """
+    counters = {'opened': 0, 'checkouts': 0}
+    token = _run_connection_stats.set(counters)
+    try:
+        yield counters
+    finally:
+        _run_connection_stats.reset(token)
+
+def connection_stats():
+    """Connections opened and checked out by the run counting in this context, else by the process since the last reset"""
+    counters = _run_connection_stats.get()
+    with _stats_lock:
+        return dict(_connection_stats if counters is None else counters)
+
+def reset_connection_stats():
+    """Reset the process-wide connection counters"""
+    with _stats_lock:
+        for name in _connection_stats:
+            _connection_stats[name] = 0
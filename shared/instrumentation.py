@@ -0,0 +1,194 @@
+import io
+import sys
+import json
+import time
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from shared.config import get_config, connection_stats, count_connections
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Report of the run in progress and the path of the stage being timed
+_current_report = contextvars.ContextVar('run_report', default=None)
+_current_stage = contextvars.ContextVar('run_stage', default=())
+
+def peak_rss_mib():
+    """Peak resident set size of the process in MiB (None where the resource module is missing)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+class RunReport:
+    """
+    Structured timings of one pipeline run: one record per stage and sub-stage with its wall time,
+        CPU time, rows in and out, peak RSS and the database connections it used.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now()
+        self.stages = []
+        # Connections of this run only (see shared.config.count_connections)
+        self.connections = {}
+        self.status = 'Success'
+        self._start = time.perf_counter()
+        self._cpu = time.process_time()
+        self.wall_s = self.cpu_s = None
+
+    def finish(self, status='Success'):
+        self.status = status
+        self.wall_s = round(time.perf_counter() - self._start, 4)
+        self.cpu_s = round(time.process_time() - self._cpu, 4)
+
+    def to_dict(self):
+        return {
+            'run': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'status': self.status,
+            'wall_s': self.wall_s,
+            'cpu_s': self.cpu_s,
+            'peak_rss_mib': peak_rss_mib(),
+            'connections': dict(self.connections),
+            'stages': self.stages,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+@contextmanager
+def run_report(name):
+    """
+    Collect the stages timed inside the block into a RunReport. On exit the report is logged as
+        JSON and, with RUN_REPORT_DIR set, written to <RUN_REPORT_DIR>/<name>-<timestamp>.json.
+    The connections are counted per run, concurrent runs in other threads are not included.
+    """
+    report = RunReport(name)
+    token = _current_report.set(report)
+    try:
+        with count_connections() as report.connections:
+            yield report
+    except Exception:
+        report.finish('Failure')
+        raise
+    else:
+        report.finish()
+    finally:
+        _current_report.reset(token)
+        logging.info(f"Run report: {report.to_json()}")
+        report_dir = get_config()['run_report_dir']
+        if report_dir:
+            path = Path(report_dir) / f"{name}-{report.started:%Y%m%d-%H%M%S}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report.to_dict(), default=str, indent=2), encoding='utf-8')
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Time a stage of the run. Stages nest: a stage opened inside another one is recorded as
+        'outer/inner'. The yielded dict is the stage's record, set record['rows_out'] in the block.
+    The stage named by PROFILE_STAGE is also profiled (see _profiled).
+    Args:
+        name: Stage name
+        rows_in: Number of input rows
+    """
+    path = _current_stage.get() + (name,)
+    token = _current_stage.set(path)
+    record = {'stage': '/'.join(path), 'rows_in': rows_in, 'rows_out': None}
+    connections = connection_stats()
+    start, cpu = time.perf_counter(), time.process_time()
+    try:
+        with _profiled(record):
+            yield record
+    finally:
+        record['wall_s'] = round(time.perf_counter() - start, 4)
+        # Process CPU time: includes other threads of the process, not worker processes
+        record['cpu_s'] = round(time.process_time() - cpu, 4)
+        record['peak_rss_mib'] = peak_rss_mib()
+        after = connection_stats()
+        record['connections'] = {key: after[key] - connections.get(key, 0) for key in after}
+        _current_stage.reset(token)
+        report = _current_report.get()
+        if report is not None:
+            report.stages.append(record)
+        logging.debug(f"Stage {record['stage']}: {record['wall_s']} s")
+
+def instrumented(name, rows_in=None, rows_out=None):
+    """
+    Decorator running a function as a stage.
+    Args:
+        name: Stage name
+        rows_in: Optional function of the call's arguments returning the input rows
+        rows_out: Optional function of the result returning the output rows (defaults to count_rows)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows_in(*args, **kwargs) if rows_in else None) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = (rows_out or count_rows)(result)
+                return result
+        return wrapper
+    return decorator
+
+def count_rows(result):
+    """Rows of a DataFrame, BalanceMatrix (dates × classes cells) or the first item of a tuple"""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    shape = getattr(result, 'shape', None)
+    if shape is not None and len(shape) == 2 and not hasattr(result, 'columns'):
+        return int(shape[0] * shape[1])
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+@contextmanager
+def _profiled(record):
+    """
+    Profile the stage if its name (or path) is the PROFILE_STAGE setting. The profile is written
+        to PROFILE_DIR: <stage>.prof (cProfile, open with pstats or snakeviz) or <stage>.html
+        (PROFILER=pyinstrument).
+    """
+    config = get_config()
+    if config['profile_stage'] not in (record['stage'], record['stage'].rsplit('/', 1)[-1]):
+        yield
+        return
+    directory = Path(config['profile_dir'])
+    directory.mkdir(parents=True, exist_ok=True)
+    name = record['stage'].replace('/', '.')
+    if config['profiler'] == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logging.warning('pyinstrument is not installed, profiling with cProfile')
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                record['profile'] = str(directory / f'{name}.html')
+                Path(record['profile']).write_text(profiler.output_html(), encoding='utf-8')
+            return
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        record['profile'] = str(directory / f'{name}.prof')
+        profiler.dump_stats(record['profile'])
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(20)
+        logging.info(f"Profile of stage {record['stage']}:\n{summary.getvalue()}")
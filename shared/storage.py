@@ -0,0 +1,416 @@
+"""
+Storage backends behind the readers and writers.
+The pipeline talks to its database through DB-API connections (cursor(), execute() with %s
+    placeholders, commit()). MySQL is the production backend. SQLite (standard library) and DuckDB
+    are embedded backends on a local database file, e.g. a snapshot of a production database
+    (see snapshot.py), for offline runs, CI and benchmarks without a database server.
+EmbeddedConnection gives the embedded engines the mysql.connector API the readers and writers use,
+    and each backend provides the few statements whose SQL differs between the engines.
+    STORAGE_BACKEND selects the backend of db_session(), STORAGE_PATH the embedded database file.
+"""
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+# Engines of the embedded database files, by file suffix (anything else is SQLite)
+ENGINES_BY_SUFFIX = {'.duckdb': 'duckdb'}
+
+class MySQLBackend:
+    """MySQL through mysql.connector (the pooled connections of shared/config.py)"""
+    name = 'mysql'
+    # A local database file: no query cache and no LOAD DATA
+    embedded = False
+
+    @staticmethod
+    def errors():
+        """Exception class of the engine's driver"""
+        from mysql.connector import Error
+        return Error
+
+    def create_like(self, cursor, table, template):
+        """Create an empty table with the columns, keys and defaults of template"""
+        cursor.execute(f"CREATE TABLE {table} LIKE {template}")
+
+    def rename_tables(self, cursor, renames):
+        """Rename [(old, new), ...] in one atomic operation (readers see all renames or none)"""
+        cursor.execute('RENAME TABLE ' + ', '.join(f'{old} TO {new}' for old, new in renames))
+
+    def truncate(self, cursor, table):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+
+    def fetch_frame(self, cursor, dtypes):
+        """The executed query's rows as a typed DataFrame in one columnar fetch, None if the engine has none"""
+        return None
+
+    def write_frame(self, conn, table, df, columns=None, auto_id=None):
+        """
+        Replace the rows of an existing table with the rows of a DataFrame, in one transaction
+        Args:
+            conn: Connection of the database
+            table: Table name
+            df: Rows to write (their columns must exist in the table)
+            columns, auto_id: Schema used by the embedded backends to create the table (see create_table)
+        """
+        cursor = conn.cursor()
+        try:
+            conn.commit()
+            conn.start_transaction()
+            cursor.execute(f"DELETE FROM `{table}`")
+            names = ', '.join(f'`{column}`' for column in df.columns)
+            placeholders = ', '.join(['%s'] * len(df.columns))
+            cursor.executemany(f"INSERT INTO `{table}` ({names}) VALUES ({placeholders})", _python_rows(df))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+class SQLiteBackend(MySQLBackend):
+    """Embedded SQLite database file (Python's sqlite3); dates are stored as ISO text"""
+    name = 'sqlite'
+    embedded = True
+    # Column types by kind (see column_kinds)
+    types = {'int': 'INTEGER', 'float': 'REAL', 'text': 'TEXT', 'date': 'TEXT', 'datetime': 'TEXT'}
+
+    @staticmethod
+    def errors():
+        import sqlite3
+        return sqlite3.Error
+
+    def connect(self, path):
+        import sqlite3
+        # Autocommit at the driver level: EmbeddedConnection opens and ends the transactions
+        return sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+    def raw_cursor(self, raw):
+        return raw.cursor()
+
+    def translate(self, sql):
+        """MySQL placeholders and identifier quotes to the engine's"""
+        return sql.replace('%s', '?').replace('`', '"')
+
+    def adapt(self, value):
+        """A parameter value as the driver takes it"""
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        return value.item() if hasattr(value, 'item') else value
+
+    def table_sql(self, cursor, table):
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+        return cursor.fetchall()[0][0]
+
+    def create_like(self, cursor, table, template):
+        ddl = self.table_sql(cursor, template)
+        cursor.execute(re.sub(r'^CREATE TABLE\s+("[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)', f'CREATE TABLE "{table}"', ddl, flags=re.I))
+
+    def rename_tables(self, cursor, renames):
+        # DDL is transactional in the embedded engines: the renames commit together
+        cursor.connection.atomic([f'ALTER TABLE "{old}" RENAME TO "{new}"' for old, new in renames])
+
+    def truncate(self, cursor, table):
+        cursor.execute(f'DELETE FROM "{table}"')
+
+    def id_column(self, table, column, start):
+        return f'"{column}" INTEGER PRIMARY KEY'
+
+    def create_table(self, conn, table, columns, auto_id=None, start=1):
+        """
+        Create a table (replacing it)
+        Args:
+            conn: EmbeddedConnection
+            table: Table name
+            columns: Dict of column kind ('int', 'float', 'text', 'date' or 'datetime') by name
+            auto_id: Name of an auto-increment ID column to add first (the ID of tables the app inserts into)
+            start: First ID given by the auto-increment column
+        """
+        definitions = [self.id_column(table, auto_id, start)] if auto_id else []
+        definitions += [f'"{name}" {self.types[kind]}' for name, kind in columns.items() if name != auto_id]
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'DROP TABLE IF EXISTS "{table}"')
+            cursor.execute(f'CREATE TABLE "{table}" ({", ".join(definitions)})')
+        finally:
+            cursor.close()
+
+    def write_frame(self, conn, table, df, columns=None, auto_id=None):
+        """Create the table (with the given or the DataFrame's column kinds) and insert the rows, in one transaction"""
+        columns = columns or column_kinds(df)
+        start = int(df[auto_id].max()) + 1 if auto_id in df and len(df) else 1
+        self.create_table(conn, table, columns, auto_id, start)
+        cursor = conn.cursor()
+        try:
+            self.insert_frame(cursor, table, df)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def insert_frame(self, cursor, table, df):
+        """Insert the rows of a DataFrame"""
+        if len(df):
+            names = ', '.join(f'"{column}"' for column in df.columns)
+            placeholders = ', '.join(['%s'] * len(df.columns))
+            cursor.executemany(f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})', _python_rows(df))
+
+class DuckDBBackend(SQLiteBackend):
+    """
+    Embedded DuckDB database file. Reads are columnar: query results come back as DataFrames in one
+        vectorized fetch, and DataFrames are inserted with one INSERT ... SELECT over the frame.
+    """
+    name = 'duckdb'
+    types = {'int': 'BIGINT', 'float': 'DOUBLE', 'text': 'VARCHAR', 'date': 'DATE', 'datetime': 'TIMESTAMP'}
+
+    @staticmethod
+    def errors():
+        import duckdb
+        return duckdb.Error
+
+    def connect(self, path):
+        import duckdb
+        return duckdb.connect(path)
+
+    def raw_cursor(self, raw):
+        # duckdb's cursor() is a new connection with its own transactions: use the connection itself
+        return raw
+
+    def translate(self, sql):
+        sql = super().translate(sql)
+        # MySQL's always-true WHERE 1 (DuckDB wants a boolean)
+        return re.sub(r'\bWHERE\s+1\s*$', 'WHERE TRUE', sql, flags=re.I)
+
+    def adapt(self, value):
+        if isinstance(value, Decimal):
+            return float(value)
+        return value.item() if hasattr(value, 'item') else value
+
+    def table_sql(self, cursor, table):
+        cursor.execute("SELECT sql FROM duckdb_tables() WHERE table_name = %s", [table])
+        return cursor.fetchall()[0][0]
+
+    def id_column(self, table, column, start):
+        # A sequence default stands in for AUTO_INCREMENT (copied by create_like with the DDL)
+        return f'"{column}" BIGINT DEFAULT nextval(\'{table}_{column}\')'
+
+    def create_table(self, conn, table, columns, auto_id=None, start=1):
+        if auto_id:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f'DROP TABLE IF EXISTS "{table}"')
+                cursor.execute(f'CREATE OR REPLACE SEQUENCE "{table}_{auto_id}" START WITH {start}')
+            finally:
+                cursor.close()
+        super().create_table(conn, table, columns, auto_id, start)
+
+    def fetch_frame(self, cursor, dtypes):
+        import pandas as pd
+        df = cursor.fetch_df()
+        for column, kind in dtypes.items():
+            if column not in df:
+                continue
+            if kind.startswith('datetime64'):
+                df[column] = pd.to_datetime(df[column]).astype('datetime64[ns]')
+            elif kind != 'object':
+                df[column] = df[column].astype(kind)
+        return df
+
+    def insert_frame(self, cursor, table, df):
+        if not len(df):
+            return
+        names = ', '.join(f'"{column}"' for column in df.columns)
+        cursor.connection.begin_write()
+        raw = cursor.connection.raw
+        raw.register('_insert_frame', df.infer_objects())
+        try:
+            raw.execute(f'INSERT INTO "{table}" ({names}) SELECT * FROM _insert_frame')
+        finally:
+            raw.unregister('_insert_frame')
+
+BACKENDS = {backend.name: backend for backend in (MySQLBackend(), SQLiteBackend(), DuckDBBackend())}
+
+def get_backend(conn=None):
+    """The backend of a connection (embedded connections carry theirs, others are MySQL), or of STORAGE_BACKEND"""
+    if conn is not None:
+        return getattr(conn, 'backend', BACKENDS['mysql'])
+    from shared.config import get_config
+    engine = get_config()['storage_backend']
+    if engine not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {engine} (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[engine]
+
+def open_database(path, engine=None, database=None):
+    """
+    Connect to an embedded database file (created if missing)
+    Args:
+        path: Database file
+        engine: 'sqlite' or 'duckdb' (defaults to the file suffix: .duckdb is DuckDB, anything else SQLite)
+        database: Name of the database for the reference data memo and the logs (defaults to the file name)
+    Returns:
+        EmbeddedConnection
+    """
+    engine = engine or ENGINES_BY_SUFFIX.get(Path(path).suffix.lower(), 'sqlite')
+    if engine not in BACKENDS or not BACKENDS[engine].embedded:
+        raise ValueError(f"{engine} is not an embedded storage backend")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return EmbeddedConnection(BACKENDS[engine], path, database)
+
+class EmbeddedConnection:
+    """
+    Connection to an embedded database file with the mysql.connector API of the readers and writers.
+    Transactions follow MySQL with autocommit off: INSERT, UPDATE and DELETE open a transaction
+        that lasts until commit() or rollback(), DDL commits an open transaction first, and
+        closing the connection rolls back what wasn't committed.
+    Attributes:
+        backend: The engine's backend (SQLiteBackend or DuckDBBackend)
+        database: Name of the database
+        raw: The driver's connection
+        in_transaction: Whether a transaction is open
+    """
+    def __init__(self, backend, path, database=None):
+        self.backend = backend
+        self.path = str(path)
+        self.database = database or Path(path).stem
+        self.raw = backend.connect(self.path)
+        self.in_transaction = False
+
+    def cursor(self, **kwargs):
+        # buffered/dictionary cursors are mysql.connector options: embedded results are local
+        return EmbeddedCursor(self)
+
+    def is_connected(self):
+        return self.raw is not None
+
+    def ping(self, reconnect=False):
+        self.raw.execute('SELECT 1')
+
+    def start_transaction(self):
+        if self.in_transaction:
+            raise self.backend.errors()('Transaction already in progress')
+        self.raw.execute('BEGIN TRANSACTION')
+        self.in_transaction = True
+
+    def begin_write(self):
+        """Open a transaction for a write unless one is open"""
+        if not self.in_transaction:
+            self.start_transaction()
+
+    def commit(self):
+        if self.in_transaction:
+            self.raw.execute('COMMIT')
+            self.in_transaction = False
+
+    def rollback(self):
+        if self.in_transaction:
+            self.raw.execute('ROLLBACK')
+            self.in_transaction = False
+
+    def atomic(self, statements):
+        """Run statements (in the engine's SQL) in one transaction of their own"""
+        self.commit()
+        self.start_transaction()
+        try:
+            for statement in statements:
+                self.raw.execute(statement)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+    def close(self):
+        if self.raw is not None:
+            try:
+                self.rollback()
+            finally:
+                self.raw.close()
+                self.raw = None
+
+    def _prepare(self, query):
+        """Translate a MySQL statement and apply the transaction rules before it runs"""
+        sql = self.backend.translate(query)
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if verb in ('CREATE', 'DROP', 'ALTER', 'TRUNCATE', 'RENAME'):
+            self.commit()
+        elif verb in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            self.begin_write()
+        return sql
+
+class EmbeddedCursor:
+    """Cursor of an EmbeddedConnection: MySQL statements and parameters are translated for the engine"""
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.backend.raw_cursor(connection.raw)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=None):
+        sql = self.connection._prepare(query)
+        adapt = self.connection.backend.adapt
+        self._cursor.execute(sql, [adapt(value) for value in params] if params else [])
+
+    def executemany(self, query, rows):
+        sql = self.connection._prepare(query)
+        adapt = self.connection.backend.adapt
+        rows = [[adapt(value) for value in row] for row in rows]
+        if rows:
+            self._cursor.executemany(sql, rows)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetch_df(self):
+        """The rest of the result as a DataFrame (DuckDB)"""
+        return self._cursor.fetchdf()
+
+    def close(self):
+        if self._cursor is not self.connection.raw:
+            self._cursor.close()
+
+def column_kinds(df):
+    """Column kind ('int', 'float', 'text', 'date' or 'datetime') of each column of a DataFrame"""
+    import pandas as pd
+    kinds = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+            kinds[column] = 'int'
+        elif pd.api.types.is_float_dtype(values):
+            kinds[column] = 'float'
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            dates = values.dropna()
+            kinds[column] = 'date' if (dates == dates.dt.normalize()).all() else 'datetime'
+        else:
+            kinds[column] = 'text'
+    return kinds
+
+def _python_rows(df):
+    """Rows of a DataFrame as tuples of Python values (NaN/NaT as None, dates as date objects)"""
+    import pandas as pd
+    columns = []
+    for column, kind in column_kinds(df).items():
+        values = df[column]
+        if kind == 'date':
+            values = values.dt.date
+        elif kind == 'datetime':
+            values = values.dt.to_pydatetime()
+        values = pd.Series(values, dtype=object)
+        columns.append(values.where(values.notna(), None).tolist())
+    return list(zip(*columns))
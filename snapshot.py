@@ -0,0 +1,159 @@
+"""
+Snapshots of the pipeline's tables in an embedded database file.
+export_snapshot copies AssetClass, RunningBalanceDayView (the view's rows) and InvestmentWindow
+    from the run's database into a SQLite file (DuckDB for *.duckdb paths). With
+    STORAGE_BACKEND=sqlite (or duckdb) and STORAGE_PATH pointing at the file, the pipeline runs
+    offline against the copy and publishes its windows into it. import_snapshot copies the tables
+    of a snapshot into a database, e.g. to seed a test database or another snapshot.
+    python snapshot.py export|import <path> [HORIZON_START HORIZON_END]
+"""
+import re
+import sys
+import logging
+from datetime import date
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from data_processor import fetch_data
+from shared.config import with_db_session
+from shared.storage import get_backend, open_database, column_kinds
+
+SNAPSHOT_TABLES = ('AssetClass', 'RunningBalanceDayView', 'InvestmentWindow')
+# Views of the MySQL database: their rows are exported, but can only be imported into a snapshot
+VIEWS = ('RunningBalanceDayView',)
+# Auto-increment ID column of the tables the pipeline inserts into
+AUTO_ID = {'InvestmentWindow': 'ID'}
+# Column kinds of the tables a snapshot always has (InvestmentWindow is created empty if missing)
+SCHEMAS = {
+    'InvestmentWindow': {'ID': 'int', 'ClassName': 'text', 'LastEdited': 'datetime', 'Created': 'datetime',
+                         'FromDate': 'date', 'EndDate': 'date', 'Available': 'float', 'Days': 'int',
+                         'AssetClassID': 'int'},
+    'RunningBalanceDayView': {'TransactionDate': 'date', 'TransactionClass': 'text', 'RunningTotal': 'float'},
+}
+# Dates and timestamps stored as ISO text (SQLite)
+ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}:\d{2}(\.\d+)?)?$')
+
+@with_db_session
+def read_tables(conn=None, tables=SNAPSHOT_TABLES, horizon=None):
+    """
+    Read whole tables as DataFrames with portable column types (Decimals as float64, dates as datetime64)
+    Args:
+        conn: Database connection (a new session is opened if omitted)
+        tables: Table names
+        horizon: Optional (after, until) dates; only the RunningBalanceDayView days in (after, until] are read
+    Returns:
+        dict: DataFrame by table name
+    """
+    frames = {}
+    for table in tables:
+        condition, params = '1', None
+        if table == 'RunningBalanceDayView' and horizon is not None:
+            condition = '`TransactionDate` > %s AND `TransactionDate` <= %s'
+            params = [pd.Timestamp(horizon[0]).date(), pd.Timestamp(horizon[1]).date()]
+        df = fetch_data(table, condition=condition, params=params, conn=conn, use_cache=False)
+        if df is None:
+            raise RuntimeError(f'Could not read {table}')
+        frames[table] = _portable(df)
+    return frames
+
+@with_db_session
+def write_tables(frames, conn=None):
+    """
+    Replace the rows of tables with DataFrames (an embedded database gets the tables recreated)
+    Args:
+        frames: DataFrame by table name
+        conn: Database connection (a new session is opened if omitted)
+    """
+    backend = get_backend(conn)
+    for table, df in frames.items():
+        if table in VIEWS and not backend.embedded:
+            logging.warning(f'Skipping {table}: it is a view of the {backend.name} database')
+            continue
+        schema = SCHEMAS.get(table, {})
+        columns = {**schema, **{column: kind for column, kind in column_kinds(df).items() if column not in schema}}
+        backend.write_frame(conn, table, df, columns, AUTO_ID.get(table))
+        logging.info(f'Wrote {len(df)} rows of {table} ({backend.name})')
+
+def write_snapshot(path, frames, engine=None):
+    """
+    Write DataFrames into the tables of an embedded database file, e.g. generated data for CI and
+        benchmarks. A missing InvestmentWindow table is created empty.
+    Args:
+        path: Database file (created if missing)
+        frames: DataFrame by table name (RunningBalanceDayView, AssetClass with its ID, Title, Group,
+            Issuer, PercentMax and AssetClassParentID columns, ...)
+        engine: 'sqlite' or 'duckdb' (defaults to the file suffix, see shared.storage.open_database)
+    """
+    frames = {'InvestmentWindow': pd.DataFrame(columns=list(SCHEMAS['InvestmentWindow'])), **frames}
+    target = open_database(path, engine)
+    try:
+        write_tables(frames, conn=target)
+    finally:
+        target.close()
+
+@with_db_session
+def export_snapshot(path, conn=None, horizon=None, tables=SNAPSHOT_TABLES, engine=None):
+    """
+    Copy tables of the run's database into an embedded database file
+    Args:
+        path: Snapshot file (created if missing, the tables are replaced)
+        conn: Database connection (a new session is opened if omitted)
+        horizon: Optional (after, until) dates of the running balances to keep
+        tables: Tables to copy
+        engine: 'sqlite' or 'duckdb' (defaults to the file suffix)
+    Returns:
+        dict: Rows copied by table name
+    """
+    frames = read_tables(conn=conn, tables=tables, horizon=horizon)
+    write_snapshot(path, frames, engine)
+    logging.info(f'Exported {", ".join(f"{len(df)} {table}" for table, df in frames.items())} rows to {path}')
+    return {table: len(df) for table, df in frames.items()}
+
+@with_db_session
+def import_snapshot(path, conn=None, tables=SNAPSHOT_TABLES, engine=None):
+    """
+    Copy the tables of a snapshot into the connection's database, replacing their rows (views of a
+        MySQL database are skipped)
+    Args:
+        path: Snapshot file
+        conn: Database connection (a new session is opened if omitted)
+        tables: Tables to copy
+        engine: 'sqlite' or 'duckdb' of the snapshot (defaults to the file suffix)
+    Returns:
+        dict: Rows copied by table name
+    """
+    source = open_database(path, engine)
+    try:
+        frames = read_tables(conn=source, tables=tables)
+    finally:
+        source.close()
+    write_tables(frames, conn=conn)
+    logging.info(f'Imported {", ".join(f"{len(df)} {table}" for table, df in frames.items())} rows from {path}')
+    return {table: len(df) for table, df in frames.items()}
+
+def _portable(df):
+    """Decimal columns as float64, date and ISO text date columns as datetime64"""
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if not (values.dtype == object or isinstance(values.dtype, pd.StringDtype)) or values.isna().all():
+            continue
+        present = values.dropna()
+        if present.map(lambda value: isinstance(value, Decimal)).all():
+            df[column] = pd.to_numeric(values).astype(np.float64)
+        elif present.map(lambda value: isinstance(value, date)).all():
+            df[column] = pd.to_datetime(values)
+        elif present.map(lambda value: isinstance(value, str) and ISO_DATE.match(value) is not None).all():
+            df[column] = pd.to_datetime(values, format='ISO8601')
+    return df
+
+if __name__ == "__main__":
+    # Snapshot of the .env database for offline runs: python snapshot.py export .cache/treasury.sqlite
+    logging.basicConfig(level=logging.INFO)
+    command, path, *horizon = sys.argv[1:]
+    if command == 'export':
+        export_snapshot(path, horizon=horizon or None)
+    elif command == 'import':
+        import_snapshot(path)
+    else:
+        sys.exit(f'Unknown command {command} (expected export or import)')
@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import pytest
+from reference_data import invalidate_reference_data
+
+@pytest.fixture(autouse=True)
+def no_query_cache(monkeypatch):
+    """Every test reads from its stand-in connection: no query cache, no reference data memoized by an earlier test"""
+    monkeypatch.setenv('QUERY_CACHE_BYPASS', '1')
+    invalidate_reference_data()
+
+@pytest.fixture
+def view_classes():
+    """The TransactionClass values of the rows fixture"""
+    return ['Portfolio', 'Cash/Sweep', 'Certificate of Deposit', 'Mutual Fund', 'Commercial Paper',
+            'Money Market', 'US Treasuries', 'US Agencies']
+
+@pytest.fixture
+def rows(view_classes):
+    """Half a year of RunningBalanceDayView rows; Commercial Paper has gaps and starts late."""
+    rng = np.random.default_rng(3)
+    rows = []
+    for day in range(200):
+        for transaction_class in view_classes:
+            if transaction_class == 'Commercial Paper' and (day < 30 or day % 7 == 3):
+                continue
+            scale = 5e7 if transaction_class == 'Portfolio' else 1e6
+            rows.append((date(2025, 1, 1) + timedelta(days=day), transaction_class,
+                         Decimal(f'{rng.uniform(0, scale):.2f}')))
+    return rows
@@ -0,0 +1,171 @@
+import copy
+import csv
+import re
+from decimal import Decimal
+
+class FakeMySQL:
+    """
+    Local MySQL stand-in for the writer tests. It understands the handful of statements the
+    writers send (CREATE TABLE ... LIKE, RENAME TABLE, DROP, TRUNCATE, DELETE, INSERT, UPDATE by
+    ID, SELECT of columns, LOAD DATA LOCAL INFILE) and keeps MySQL's visibility rules: DML is
+    only seen by other sessions after commit, DDL commits implicitly.
+    Tables are lists of row dicts, each with an auto-increment ID.
+    """
+    def __init__(self, tables=None, fail_on_id=None):
+        self.committed = copy.deepcopy(tables or {'InvestmentWindow': []})
+        self.working = copy.deepcopy(self.committed)
+        self.next_id = 1 + max((row['ID'] for rows in self.committed.values() for row in rows), default=0)
+        self.fail_on_id = fail_on_id
+        self.statements = []
+        self.commits = 0
+        self.in_transaction = False
+
+    # Connection API
+    def is_connected(self):
+        return True
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        if self.in_transaction:
+            raise RuntimeError('Transaction already in progress')
+        self.in_transaction = True
+
+    def commit(self):
+        self.committed = copy.deepcopy(self.working)
+        self.in_transaction = False
+        self.commits += 1
+
+    def rollback(self):
+        self.working = copy.deepcopy(self.committed)
+        self.in_transaction = False
+
+    def close(self):
+        pass
+
+    # What another session would read
+    def visible(self, table='InvestmentWindow'):
+        return self.committed.get(table)
+
+    def _insert(self, table, columns, values):
+        row = dict(zip(columns, values))
+        if row.get('AssetClassID') == self.fail_on_id:
+            raise RuntimeError('deadlock')
+        row['ID'] = self.next_id
+        self.next_id += 1
+        self.working[table].append(row)
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.description = None
+        self.rows = []
+
+    def execute(self, query, params=None):
+        db = self.db
+        sql = ' '.join(query.split())
+        db.statements.append(sql)
+        if match := re.match(r'DROP TABLE IF EXISTS (\w+)', sql):
+            db.commit()
+            db.working.pop(match[1], None)
+            db.commit()
+        elif match := re.match(r'CREATE TABLE (\w+) LIKE (\w+)', sql):
+            db.commit()
+            if match[1] in db.working:
+                raise RuntimeError(f'Table {match[1]} already exists')
+            db.working[match[1]] = []
+            db.commit()
+        elif match := re.match(r'RENAME TABLE (.*)', sql):
+            db.commit()
+            tables = dict(db.working)
+            for pair in match[1].split(','):
+                source, target = pair.split(' TO ')
+                tables[target.strip()] = tables.pop(source.strip())
+            db.working = tables
+            db.commit()
+        elif match := re.match(r'TRUNCATE TABLE (\w+)', sql):
+            db.commit()
+            db.working[match[1]] = []
+            db.commit()
+        elif match := re.match(r'DELETE FROM (\w+) WHERE ID IN \((.*)\)', sql):
+            ids = set(params)
+            db.working[match[1]] = [row for row in db.working[match[1]] if row['ID'] not in ids]
+        elif match := re.match(r'DELETE FROM (\w+)', sql):
+            db.working[match[1]] = []
+        elif match := re.match(r'SELECT (.*) FROM (\w+)', sql):
+            columns = [column.strip(' `') for column in match[1].split(',')]
+            self.description = [(column,) for column in columns]
+            self.rows = [tuple(row.get(column) for column in columns) for row in db.working[match[2]]]
+        elif match := re.match(r"LOAD DATA LOCAL INFILE '(.+?)' INTO TABLE (\w+) .* \((.*)\)$", sql):
+            columns = [column.strip() for column in match[3].split(',')]
+            with open(match[1], newline='', encoding='utf-8') as csv_file:
+                for values in csv.reader(csv_file):
+                    db._insert(match[2], columns, values)
+        else:
+            raise NotImplementedError(sql)
+
+    def executemany(self, query, rows):
+        sql = ' '.join(query.split())
+        self.db.statements.append(sql)
+        if match := re.match(r'INSERT INTO (\w+) \((.*?)\) VALUES', sql):
+            columns = [column.strip() for column in match[2].split(',')]
+            working = copy.deepcopy(self.db.working[match[1]])
+            try:
+                for values in rows:
+                    self.db._insert(match[1], columns, values)
+            except Exception:
+                # A failed statement leaves none of its rows behind
+                self.db.working[match[1]] = working
+                raise
+        elif match := re.match(r'UPDATE (\w+) SET (.*) WHERE ID = %s', sql):
+            columns = [assignment.split('=')[0].strip() for assignment in match[2].split(',')]
+            by_id = {row['ID']: row for row in self.db.working[match[1]]}
+            for values in rows:
+                by_id[values[-1]].update(zip(columns, values[:-1]))
+        else:
+            raise NotImplementedError(sql)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class StreamingConnection:
+    """Reader stand-in serving running balance rows (for RunningBalanceDayView) and two asset classes."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetchmany_sizes = []
+        self.queries = []
+
+    def cursor(self, buffered=True):
+        return StreamingCursor(self)
+
+class StreamingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.pending = []
+
+    def execute(self, query, params=None):
+        self.conn.queries.append((' '.join(query.split()), params))
+        if 'AssetClass' in query:
+            self.description = [(column,) for column in ('ID', 'Title', 'Group', 'Issuer', 'PercentMax', 'AssetClassCombined')]
+            self.pending = [(1, 'Money Market', 'Cash', None, Decimal('0.25'), 'Money Market'),
+                            (2, 'US Treasuries', 'Bonds', None, Decimal('0.50'), 'US Treasuries')]
+        else:
+            self.description = [('TransactionDate',), ('TransactionClass',), ('RunningTotal',)]
+            self.pending = list(self.conn.rows)
+
+    def fetchall(self):
+        rows, self.pending = self.pending, []
+        return rows
+
+    def fetchmany(self, size):
+        self.conn.fetchmany_sizes.append(size)
+        rows, self.pending = self.pending[:size], self.pending[size:]
+        return rows
+
+    def close(self):
+        pass
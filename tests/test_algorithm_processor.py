@@ -0,0 +1,83 @@
+import pytest
+import pandas as pd
+import numpy as np
+from algorithm_processor import process_investment_algorithm, identify_low_points, get_horizon, asset_universe
+
+ASSETS = ['Certificate of Deposit', 'Mutual Fund', 'Commercial Paper', 'Money Market', 'US Treasuries', 'US Agencies']
+
+@pytest.fixture(autouse=True)
+def horizon(monkeypatch):
+    """The horizon the reference loop had hard-coded."""
+    monkeypatch.setenv('HORIZON_START', '2025-01-21')
+    monkeypatch.setenv('HORIZON_END', '2025-06-30')
+
+@pytest.fixture
+def running_balances():
+    """Daily Available balances for the six asset classes plus the Portfolio and Cash/Sweep rows."""
+    rng = np.random.default_rng(5)
+    dates = pd.date_range('2025-01-01', '2025-07-31')
+    frames = []
+    for transaction_class in ASSETS + ['Portfolio', 'Cash/Sweep']:
+        frames.append(pd.DataFrame({
+            'TransactionDate': dates,
+            'TransactionClass': transaction_class,
+            'Available': np.round(rng.normal(0, 1e5, len(dates)).cumsum() + 5e6, -3),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def reference_process_investment_algorithm(running_balances):
+    """The original per-class filter-and-concat loop."""
+    windows = pd.DataFrame()
+    for asset_class in ASSETS:
+        df = running_balances[
+            (running_balances['TransactionClass'] == asset_class) &
+            (running_balances['TransactionDate'] <= '2025-06-30') &
+            (running_balances['TransactionDate'] > '2025-01-21')
+        ][['TransactionDate', 'Available']].rename(columns={'TransactionDate': 'Date', 'Available': 'Balance'})
+        result = identify_low_points(df)
+        result['Asset Class'] = asset_class
+        windows = pd.concat([windows, result], ignore_index=True)
+    return windows
+
+def test_serial_matches_reference(running_balances):
+    """Grouping once gives the same windows as filtering the frame per class."""
+    expected = reference_process_investment_algorithm(running_balances)
+    pd.testing.assert_frame_equal(process_investment_algorithm(running_balances, workers=1), expected)
+
+def test_process_pool_matches_serial(running_balances):
+    """Fanning the classes out to worker processes doesn't change the result or its order."""
+    serial = process_investment_algorithm(running_balances, workers=1)
+    pd.testing.assert_frame_equal(process_investment_algorithm(running_balances, workers=3), serial)
+
+def test_workers_from_config(running_balances, monkeypatch):
+    """The worker count defaults to the ALGORITHM_WORKERS setting."""
+    monkeypatch.setenv('ALGORITHM_WORKERS', '2')
+    serial = process_investment_algorithm(running_balances, workers=1)
+    pd.testing.assert_frame_equal(process_investment_algorithm(running_balances), serial)
+
+def test_horizon_and_asset_classes_arguments(running_balances):
+    """Only the requested classes and dates are processed; classes without balances are skipped."""
+    windows = process_investment_algorithm(running_balances, workers=1, asset_classes=['Money Market', 'Repo', 'Portfolio'],
+                                           horizon=('2025-03-01', '2025-04-30'))
+    assert set(windows['Asset Class']) == {'Money Market'}
+    assert windows['StartDate'].min() > pd.Timestamp('2025-03-01')
+    assert (windows['EndDate'] == pd.Timestamp('2025-04-30')).all()
+    empty = process_investment_algorithm(running_balances, workers=1, horizon=('2030-01-01', '2030-06-30'))
+    assert empty.empty and 'Asset Class' in empty.columns
+
+def test_get_horizon(monkeypatch):
+    assert get_horizon() == (pd.Timestamp('2025-01-21'), pd.Timestamp('2025-06-30'))
+    monkeypatch.delenv('HORIZON_END')
+    monkeypatch.setenv('HORIZON_DAYS', '30')
+    assert get_horizon() == (pd.Timestamp('2025-01-21'), pd.Timestamp('2025-02-20'))
+    monkeypatch.delenv('HORIZON_START')
+    # Rolling from today
+    assert get_horizon(today='2026-10-18 14:30') == (pd.Timestamp('2026-10-18'), pd.Timestamp('2026-11-17'))
+    assert get_horizon(end='2026-01-31', days=31) == (pd.Timestamp('2025-12-31'), pd.Timestamp('2026-01-31'))
+
+def test_asset_universe(monkeypatch):
+    asset_classes = pd.DataFrame({'AssetClassTitle': ['Cash/Sweep', 'Money Market', 'US Treasuries', 'US Agencies']})
+    assert asset_universe(asset_classes) == ['Money Market', 'US Treasuries', 'US Agencies']
+    assert asset_universe(asset_classes, only=['US Agencies', 'Gold']) == ['US Agencies']
+    monkeypatch.setenv('ASSET_CLASSES', 'US Treasuries, Money Market')
+    assert asset_universe(asset_classes) == ['Money Market', 'US Treasuries']
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+import data_processor
+from algorithm_processor import process_investment_algorithm
+from allocation import allocate_investment_windows, allocate
+from balance_matrix import BalanceMatrix
+from database_writer import prepare_investment_window_rows
+from fake_mysql import StreamingConnection
+
+HORIZON = ('2025-01-21', '2025-06-30')
+
+def two_classes(cash, first, second):
+    """A BalanceMatrix with the given daily Cash/Sweep and Available of two classes (from 2025-01-01)"""
+    dates = pd.date_range('2025-01-01', periods=len(cash))
+    matrix = BalanceMatrix(dates, ['Portfolio', 'Cash/Sweep', 'A', 'B'],
+                           np.column_stack([np.full(len(cash), 1e9), cash, np.zeros(len(cash)), np.zeros(len(cash))]))
+    matrix.compute()
+    matrix.available[:, 2], matrix.available[:, 3] = first, second
+    return matrix
+
+def check_allocation(windows, allocated, cash):
+    """
+    Feasible and optimal: on every start date each class within the LowPointBalance of its latest
+        window (and of its later ones), all classes within the cash ahead and, together, at
+        min(cash ahead, sum of the caps)
+    """
+    cash = cash.dropna()
+    for title, group in allocated.groupby('Asset Class'):
+        assert (np.diff(group.sort_values('StartDate')['Allocated'].to_numpy()) >= -1e-6).all()
+    for start in allocated['StartDate'].unique():
+        held = caps = 0.0
+        for title, group in windows[windows['StartDate'] <= start].groupby('Asset Class'):
+            later = windows[(windows['Asset Class'] == title) & (windows['StartDate'] >= group['StartDate'].max())]
+            cap = max(later['LowPointBalance'].fillna(0).min(), 0)
+            rows = allocated[(allocated['Asset Class'] == title) & (allocated['StartDate'] <= start)]
+            amount = rows.loc[rows['StartDate'].idxmax(), 'Allocated']
+            assert amount <= cap + 1e-6
+            held += amount
+            caps += cap
+        # No cash known ahead is no cash
+        cash_ahead = max(cash[cash.index >= start].min(), 0) if (cash.index >= start).any() else 0.0
+        assert held <= cash_ahead + 1e-6
+        assert held == pytest.approx(min(cash_ahead, caps), abs=1e-6)
+
+def test_classes_share_the_cash():
+    """Two classes that each see the whole cash get it between them, not twice."""
+    cash = np.array([100., 100, 100, 100, 100, 100])
+    matrix = two_classes(cash, [50., 60, 80, 80, 80, 80], [30., 90, 100, 100, 100, 100])
+    windows = process_investment_algorithm(matrix, workers=1, horizon=('2024-12-31', '2025-01-06'))
+    allocated = allocate_investment_windows(windows, matrix, ('2024-12-31', '2025-01-06'))
+    assert windows.groupby('Asset Class')['LowPointBalance'].max().sum() == 180
+    first_day = allocated[allocated['StartDate'] == pd.Timestamp('2025-01-01')]
+    assert first_day.set_index('Asset Class')['Allocated'].to_dict() == {'A': 50.0, 'B': 30.0}
+    last = allocated.sort_values('StartDate').groupby('Asset Class')['Allocated'].last()
+    assert last.sum() == pytest.approx(100)
+    check_allocation(windows, allocated, pd.Series(cash, index=matrix.dates))
+
+def test_class_grows_on_another_class_date():
+    """A grows when cash frees up on B's next low point, in a window added for it."""
+    cash = np.array([5., 13, 30, 30, 30, 30])
+    matrix = two_classes(cash, [5., 9, 9, 9, 9, 9], [5., 8, 21, 25, 25, 25])
+    windows = process_investment_algorithm(matrix, workers=1, horizon=('2024-12-31', '2025-01-06'))
+    allocated = allocate_investment_windows(windows, matrix, ('2024-12-31', '2025-01-06'))
+    assert len(allocated) == len(windows) + 1
+    a = allocated[allocated['Asset Class'] == 'A'].set_index('StartDate')
+    # The last 4 of cash is shared on the 5th, where both have headroom 4
+    assert a['Allocated'].to_dict() == {pd.Timestamp('2025-01-05'): 7.0, pd.Timestamp('2025-01-02'): 5.0,
+                                        pd.Timestamp('2025-01-01'): 2.5}
+    added = a.loc[pd.Timestamp('2025-01-02')]
+    assert (added['LowPointDate'], added['LowPointBalance'], added['TimeSpanDays']) == (pd.Timestamp('2025-01-01'), 5.0, 5)
+    assert allocated[allocated['Asset Class'] == 'B']['Allocated'].tolist() == [23.0, 21.0, 8.0, 2.5]
+    check_allocation(windows, allocated, pd.Series(cash, index=matrix.dates))
+
+def test_ample_cash_keeps_the_windows():
+    cash = np.full(6, 1e6)
+    matrix = two_classes(cash, [50., 60, 80, 80, 80, 80], [30., 90, 100, 100, 100, 100])
+    windows = process_investment_algorithm(matrix, workers=1, horizon=('2024-12-31', '2025-01-06'))
+    allocated = allocate_investment_windows(windows, matrix, ('2024-12-31', '2025-01-06'))
+    np.testing.assert_array_equal(allocated['Allocated'], windows['LowPointBalance'])
+
+@pytest.mark.parametrize('seed', range(30))
+def test_random_allocations_are_feasible_and_optimal(seed):
+    rng = np.random.default_rng(seed)
+    days = int(rng.integers(2, 40))
+    cash = rng.uniform(0, 100, days).round()
+    cash[rng.random(days) < 0.1] = np.nan
+    available = [np.minimum(np.nan_to_num(cash), rng.uniform(0, 80, days).round()) for _ in range(2)]
+    matrix = two_classes(cash, *available)
+    horizon = ('2024-12-31', f'{matrix.dates[-1]:%Y-%m-%d}')
+    windows = process_investment_algorithm(matrix, workers=1, horizon=horizon)
+    allocated = allocate_investment_windows(windows, matrix, horizon)
+    check_allocation(windows, allocated, pd.Series(np.maximum(cash, 0), index=matrix.dates))
+
+def test_sweep_splits_by_headroom():
+    caps = [[10., 10, 0], [10, 30, 20], [40, 30, 20]]
+    amounts = allocate(caps, [15., 35, 90])
+    np.testing.assert_allclose(amounts.sum(axis=1), [15, 35, 90])
+    np.testing.assert_allclose(amounts[0], [7.5, 7.5, 0])
+    # 20 more shared over headroom 2.5, 22.5 and 20
+    np.testing.assert_allclose(amounts[1], [7.5 + 20 * 2.5 / 45, 7.5 + 20 * 22.5 / 45, 20 * 20 / 45])
+    np.testing.assert_allclose(amounts[2], [40, 30, 20])
+    assert (np.diff(amounts, axis=0) >= 0).all()
+
+def test_long_frame_and_writer(rows):
+    """The long frame allocates like the matrix, and the writer publishes the allocated amounts."""
+    matrix = data_processor.load_balance_matrix(conn=StreamingConnection(rows))
+    long = data_processor.load_and_process_data(conn=StreamingConnection(rows))
+    windows = process_investment_algorithm(matrix, workers=1, horizon=HORIZON)
+    allocated = allocate_investment_windows(windows, matrix, HORIZON)
+    np.testing.assert_allclose(allocate_investment_windows(windows, long, HORIZON)['Allocated'], allocated['Allocated'])
+    cash = pd.Series(matrix.column('Cash/Sweep', 'running_total'), index=matrix.dates)
+    check_allocation(windows, allocated, cash[(cash.index > pd.Timestamp(HORIZON[0])) & (cash.index <= pd.Timestamp(HORIZON[1]))])
+    asset_classes = pd.DataFrame({'AssetClassID': range(1, 4), 'AssetClassTitle': ['Mutual Fund', 'Commercial Paper', 'US Treasuries']})
+    rows = prepare_investment_window_rows(allocated, asset_classes)
+    np.testing.assert_allclose(rows['Available'].astype(float), allocated['Allocated'][allocated['Asset Class'].isin(asset_classes['AssetClassTitle'])])
+    with pytest.raises(ValueError):
+        allocate_investment_windows(windows, matrix, ('2026-01-01', '2026-02-01'))
+
+def test_no_windows():
+    windows = pd.DataFrame(columns=['LowPointDate', 'LowPointBalance', 'StartDate', 'EndDate', 'TimeSpanDays', 'Asset Class'])
+    assert allocate_investment_windows(windows, None, HORIZON).columns[-1] == 'Allocated'
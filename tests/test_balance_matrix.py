@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import data_processor
+from algorithm_processor import process_investment_algorithm
+from balance_matrix import BalanceMatrix
+from fake_mysql import StreamingConnection
+
+def test_matrix_matches_long_transform(rows, view_classes):
+    """The broadcast PolicyMax/Investable/Available equal the filter-and-merge long frame."""
+    long = data_processor.load_and_process_data(conn=StreamingConnection(rows))
+    matrix = data_processor.load_balance_matrix(conn=StreamingConnection(rows))
+    assert matrix.shape == (200, len(view_classes))
+    assert matrix.available.flags.f_contiguous
+    wide = matrix.to_long()
+    assert len(wide) == len(long)
+    key = ['TransactionDate', 'TransactionClass']
+    for frame in (long, wide):
+        frame['TransactionClass'] = frame['TransactionClass'].astype(str)
+    pd.testing.assert_frame_equal(
+        wide.sort_values(key, ignore_index=True),
+        long[wide.columns].sort_values(key, ignore_index=True),
+        check_dtype=False,
+    )
+
+def test_column_is_a_view(rows):
+    matrix = data_processor.load_balance_matrix(conn=StreamingConnection(rows))
+    column = matrix.column('Money Market')
+    assert np.shares_memory(column, matrix.available) and column.flags.c_contiguous
+    assert matrix.column('Repurchase Agreement') is None
+
+def test_algorithm_on_matrix_matches_long(rows, view_classes):
+    """The algorithm finds the same windows from column slices as from the long frame."""
+    long = data_processor.load_and_process_data(conn=StreamingConnection(rows))
+    matrix = data_processor.load_balance_matrix(conn=StreamingConnection(rows))
+    horizon = ('2025-01-21', '2025-06-30')
+    windows = process_investment_algorithm(matrix, workers=1, horizon=horizon)
+    assert set(windows['Asset Class']) == set(view_classes[2:])
+    pd.testing.assert_frame_equal(windows, process_investment_algorithm(long, workers=1, horizon=horizon))
+
+def test_from_long_round_trip():
+    long = pd.DataFrame({
+        'TransactionDate': pd.to_datetime(['2025-01-02', '2025-01-01', '2025-01-01', '2025-01-02']),
+        'TransactionClass': ['Cash/Sweep', 'Cash/Sweep', 'Portfolio', None],
+        'RunningTotal': [2.0, 1.0, 10.0, 99.0],
+    })
+    matrix = BalanceMatrix.from_long(long)
+    assert list(matrix.dates) == list(pd.to_datetime(['2025-01-01', '2025-01-02']))
+    np.testing.assert_array_equal(matrix.running_total, [[1.0, 10.0], [2.0, np.nan]])
+    result = matrix.to_long()
+    assert result['TransactionClass'].tolist() == ['Cash/Sweep', 'Portfolio', 'Cash/Sweep']
+    assert result['RunningTotal'].tolist() == [1.0, 10.0, 2.0]
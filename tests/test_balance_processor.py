@@ -0,0 +1,119 @@
+import pytest
+import pandas as pd
+import numpy as np
+import balance_processor
+from balance_processor import build_running_balances, refresh_running_balances, load_checkpoint
+
+@pytest.fixture
+def transactions():
+    """A few months of random transactions for three classes, several per day on some days."""
+    rng = np.random.default_rng(1)
+    n = 400
+    return pd.DataFrame({
+        'TransactionDate': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D'),
+        'TransactionClass': rng.choice(['Cash/Sweep', 'Portfolio', 'Money Market'], n),
+        'Amount': np.round(rng.normal(0, 1e4, n), 2),
+    })
+
+def reference_running_balances(transactions, start, end):
+    """Running total per class and calendar day, computed the slow way."""
+    rows = []
+    for day in pd.date_range(start, end):
+        for transaction_class in sorted(transactions['TransactionClass'].unique()):
+            in_class = transactions[(transactions['TransactionClass'] == transaction_class) &
+                                    (transactions['TransactionDate'] <= day)]
+            rows.append((day, transaction_class, in_class['Amount'].sum()))
+    return pd.DataFrame(rows, columns=['TransactionDate', 'TransactionClass', 'RunningTotal'])
+
+def test_build_running_balances(transactions):
+    """Every class gets a row per calendar day holding the cumulative sum of its amounts."""
+    result = build_running_balances(transactions)
+    expected = reference_running_balances(transactions, '2025-01-01', transactions['TransactionDate'].max())
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=False)
+
+def test_opening_balances_and_calendar(transactions):
+    """Opening balances are carried forward, including classes without new transactions."""
+    result = build_running_balances(transactions[transactions['TransactionClass'] != 'Portfolio'],
+                                    opening_balances={'Portfolio': 5e6}, start_date='2025-01-01', end_date='2025-05-31')
+    portfolio = result[result['TransactionClass'] == 'Portfolio']
+    assert len(portfolio) == 151 and (portfolio['RunningTotal'] == 5e6).all()
+
+@pytest.fixture
+def database(transactions, monkeypatch, tmp_path):
+    """Serves the transactions through a fetch_data stand-in that applies the watermark and end conditions."""
+    queries = []
+
+    def fetch_data(table_name, column_names='*', condition='1', sql=False, conn=None, params=None):
+        queries.append((condition, params))
+        rows = transactions
+        for clause, value in zip(condition.split(' AND '), params or []):
+            if '>' in clause:
+                rows = rows[rows['TransactionDate'] > pd.Timestamp(value)]
+            else:
+                rows = rows[rows['TransactionDate'] <= pd.Timestamp(value)]
+        return rows.copy()
+
+    monkeypatch.setattr(balance_processor, 'fetch_data', fetch_data)
+    return queries
+
+def test_incremental_refresh_matches_full_rebuild(transactions, database, tmp_path):
+    """Folding the transactions after the checkpoint into its balances equals a full rebuild."""
+    checkpoint = tmp_path / 'checkpoint.json'
+    first = refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-02-15')
+    assert load_checkpoint(checkpoint)['watermark'] == '2025-02-15'
+    second = refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-03-10',
+                                      start_date='2025-02-16')
+    assert database == [('1', None), ('`TransactionDate` > %s', [pd.Timestamp('2025-02-15').date()])]
+    assert second['TransactionDate'].min() == pd.Timestamp('2025-02-16')
+    full = build_running_balances(transactions)
+    tail = full[full['TransactionDate'] > '2025-02-15'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(second, tail, check_exact=False)
+    assert load_checkpoint(checkpoint)['watermark'] == '2025-03-10'
+    assert len(first) == len(full)
+
+def test_whole_series_without_start_date(transactions, database, tmp_path):
+    """Without a start_date the whole series is returned, as the view does, and the checkpoint still moves."""
+    checkpoint = tmp_path / 'checkpoint.json'
+    refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-02-15')
+    result = refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-03-10')
+    assert database[-1] == ('1', None)
+    pd.testing.assert_frame_equal(result, build_running_balances(transactions), check_exact=False)
+    assert load_checkpoint(checkpoint)['watermark'] == '2025-03-10'
+
+def test_range_is_carried_forward(transactions, database, tmp_path):
+    """Without new transactions the checkpoint balances still cover the whole requested range."""
+    checkpoint = tmp_path / 'checkpoint.json'
+    refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-05-10')
+    result = refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-05-10',
+                                      start_date='2025-05-20', end_date='2025-08-31')
+    full = build_running_balances(transactions, end_date='2025-08-31')
+    expected = full[full['TransactionDate'] >= '2025-05-20'].reset_index(drop=True)
+    assert result['TransactionDate'].max() == pd.Timestamp('2025-08-31')
+    pd.testing.assert_frame_equal(result, expected, check_exact=False)
+    assert database[-1] == ('`TransactionDate` > %s AND `TransactionDate` <= %s',
+                            [pd.Timestamp('2025-05-10').date(), pd.Timestamp('2025-08-31').date()])
+
+def test_range_before_the_watermark_is_rebuilt(transactions, database, tmp_path):
+    """A backtest starting before the watermark gets the full history, and the checkpoint stays put."""
+    checkpoint = tmp_path / 'checkpoint.json'
+    refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-03-10')
+    result = refresh_running_balances(conn=object(), checkpoint_path=checkpoint, settle_date='2025-03-10',
+                                      start_date='2025-02-01', end_date='2025-02-28')
+    assert database[-1] == ('`TransactionDate` <= %s', [pd.Timestamp('2025-02-28').date()])
+    full = build_running_balances(transactions)
+    expected = full[full['TransactionDate'].between('2025-02-01', '2025-02-28')].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False)
+    assert load_checkpoint(checkpoint)['watermark'] == '2025-03-10'
+
+def test_checkpoint_per_host(database, tmp_path, monkeypatch):
+    """Same-named databases on different servers keep separate checkpoints."""
+    monkeypatch.setenv('BALANCE_CHECKPOINT_DIR', str(tmp_path))
+
+    class Connection:
+        def __init__(self, host):
+            self.server_host, self.server_port, self.database = host, 3306, 'treasury'
+
+    for host in ('db1.example.com', 'db2.example.com'):
+        refresh_running_balances(conn=Connection(host), settle_date='2025-02-15')
+    assert sorted(path.name for path in tmp_path.glob('*.json')) == [
+        'running_balances_db1.example.com_3306_treasury.json', 'running_balances_db2.example.com_3306_treasury.json']
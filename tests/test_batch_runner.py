@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+import pytest
+import pandas as pd
+import opportuneIQ
+import algorithm_processor
+import data_processor
+import database_writer
+import reference_data
+from reference_data import ReferenceData
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Replaces the database stages with in-memory fakes that record what ran."""
+    calls = []
+    lock = threading.Lock()
+
+    def record(*event):
+        with lock:
+            calls.append(event)
+
+    @contextmanager
+    def db_session(db_config=None):
+        # The fake connection is just the name of the database it points at
+        yield db_config['database']
+
+    def load_balance_matrix(conn=None, horizon=None, asset_classes=None, reference=None):
+        record('load-start', conn)
+        time.sleep(0.05)
+        if conn == 'broken':
+            raise RuntimeError('connection refused')
+        record('load-end', conn)
+        return pd.DataFrame({'TransactionClass': ['Portfolio'], 'Database': [conn]})
+
+    def get_reference_data(conn=None):
+        return ReferenceData(pd.DataFrame({'AssetClassTitle': ['Money Market'], 'AssetClassID': [1], 'AssetClassPercentMax': [0.5]}))
+
+    def process_investment_algorithm(running_balances, asset_classes=None, horizon=None, executor=None):
+        database = running_balances['Database'].iloc[0]
+        record('algorithm-start', database)
+        time.sleep(0.05)
+        if database == 'bad-data':
+            raise ValueError('no balances')
+        return pd.DataFrame({'Asset Class': ['Money Market'] * 3})
+
+    def publish_investment_windows(windows_df, asset_classes_df, conn=None):
+        record('write', conn)
+        return True
+
+    monkeypatch.setattr(opportuneIQ, 'db_session', db_session)
+    # The fake windows have no balances to allocate
+    monkeypatch.setenv('ALLOCATE_WINDOWS', 'false')
+    # The stages import these from their modules when they run
+    monkeypatch.setattr(data_processor, 'load_balance_matrix', load_balance_matrix)
+    monkeypatch.setattr(reference_data, 'get_reference_data', get_reference_data)
+    monkeypatch.setattr(algorithm_processor, 'process_investment_algorithm', process_investment_algorithm)
+    monkeypatch.setattr(database_writer, 'publish_investment_windows', publish_investment_windows)
+    return calls
+
+def portfolios(*databases):
+    return [{'name': database, 'db_config': {'database': database}} for database in databases]
+
+def test_batch_runs_every_portfolio(stages):
+    """Every portfolio is loaded, processed and written, with a report in input order."""
+    reports = opportuneIQ.ProcessTreasuryForecastingBatch(portfolios('a', 'b', 'c'))
+    assert [report['name'] for report in reports] == ['a', 'b', 'c']
+    assert all(report['status'] == 'Success' and report['windows'] == 3 for report in reports)
+    assert all(set(report['timings']) == {'load', 'algorithm', 'write'} for report in reports)
+    assert [event[1] for event in stages if event[0] == 'write'] == ['a', 'b', 'c']
+
+def test_batch_overlaps_loading_with_compute(stages):
+    """The next portfolio's load starts before the current portfolio's algorithm runs."""
+    opportuneIQ.ProcessTreasuryForecastingBatch(portfolios('a', 'b'), max_workers=2)
+    assert stages.index(('load-start', 'b')) < stages.index(('algorithm-start', 'a'))
+
+def test_batch_bounds_concurrent_loads(stages):
+    """With one worker, a load only starts once the previous portfolio's load has finished."""
+    opportuneIQ.ProcessTreasuryForecastingBatch(portfolios('a', 'b', 'c'), max_workers=1)
+    assert stages.index(('load-end', 'a')) < stages.index(('load-start', 'b'))
+
+def test_batch_reports_failures_without_aborting(stages):
+    """Load and algorithm failures are reported per portfolio and the batch carries on."""
+    reports = opportuneIQ.ProcessTreasuryForecastingBatch(portfolios('a', 'broken', 'bad-data', 'd'))
+    assert [report['status'] for report in reports] == ['Success', 'Failure', 'Failure', 'Success']
+    assert reports[1]['error'] == 'load: connection refused'
+    assert reports[2]['error'] == 'algorithm: no balances'
+    assert [event[1] for event in stages if event[0] == 'write'] == ['a', 'd']
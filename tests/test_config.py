@@ -0,0 +1,116 @@
+import pytest
+from mysql.connector.errors import PoolError
+import shared.config as config
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rolled_back = False
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.pool.returned.append(self)
+
+class FakePool:
+    """Stands in for the MySQL pool: opens pool_size connections up front, like the real one."""
+    created = []
+    # get_connection() calls that find the pool exhausted
+    exhausted = 0
+
+    def __init__(self, pool_name, pool_size, **settings):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.settings = settings
+        self.returned = []
+        self.closed = False
+        config._count_connections('opened', pool_size)
+        FakePool.created.append(self)
+
+    def get_connection(self):
+        if FakePool.exhausted:
+            FakePool.exhausted -= 1
+            raise PoolError('Failed getting connection; pool exhausted')
+        return FakeConnection(self)
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture(autouse=True)
+def fake_pool(monkeypatch):
+    FakePool.created = []
+    FakePool.exhausted = 0
+    monkeypatch.setattr(config, '_CountingConnectionPool', FakePool)
+    monkeypatch.setattr(config, '_pools', {})
+    monkeypatch.setenv('DB_HOST', 'localhost')
+    monkeypatch.setenv('DB_NAME', 'treasury')
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    config.reset_connection_stats()
+
+def test_pool_is_created_once_per_database():
+    """Repeated sessions reuse the process-wide pool; another database gets its own, smaller pool."""
+    for _ in range(4):
+        with config.db_session():
+            pass
+    with config.db_session({'database': 'tenant_b'}):
+        pass
+    assert [pool.settings['database'] for pool in FakePool.created] == ['treasury', 'tenant_b']
+    assert [pool.pool_size for pool in FakePool.created] == [3, 2]
+    assert config.connection_stats() == {'opened': 5, 'checkouts': 5}
+
+def test_least_recently_used_pools_are_closed(monkeypatch):
+    """Beyond DB_MAX_POOLS the pool used longest ago is closed; using a pool makes it recent."""
+    monkeypatch.setenv('DB_MAX_POOLS', '2')
+    for tenant in ('a', 'b', 'a', 'c'):
+        with config.db_session({'database': tenant}):
+            pass
+    pools = {pool.settings['database']: pool for pool in FakePool.created}
+    assert (pools['a'].closed, pools['b'].closed, pools['c'].closed) == (False, True, False)
+    assert sorted(dict(key)['database'] for key in config._pools) == ['a', 'c']
+
+def test_exhausted_pool_is_waited_on(monkeypatch):
+    """A session waits for a free connection instead of failing, up to DB_POOL_TIMEOUT."""
+    FakePool.exhausted = 3
+    with config.db_session() as conn:
+        pass
+    assert conn in FakePool.created[0].returned
+    monkeypatch.setenv('DB_POOL_TIMEOUT', '0.05')
+    FakePool.exhausted = 10 ** 6
+    with pytest.raises(Exception, match='pool exhausted'):
+        config.get_db_connection()
+
+def test_evicted_pool_disconnects_returned_connections(monkeypatch):
+    monkeypatch.setattr(config, '_CountingConnectionPool', None)
+    pool = config._pool_class()(pool_name='evicted', pool_size=1)
+    pool.close()
+
+    class Connection:
+        disconnected = False
+
+        def disconnect(self):
+            self.disconnected = True
+
+    returned = Connection()
+    pool.add_connection(returned)
+    assert returned.disconnected and pool._cnx_queue.empty()
+
+def test_session_returns_connection_and_rolls_back_on_error():
+    """The connection goes back to the pool, and a failing block rolls the transaction back."""
+    with pytest.raises(ValueError):
+        with config.db_session() as conn:
+            raise ValueError('write failed')
+    assert conn.rolled_back
+    assert FakePool.created[0].returned == [conn]
+
+def test_with_db_session_shares_a_passed_connection():
+    """Decorated readers use the caller's connection, or open their own session without one."""
+    @config.with_db_session
+    def reader(conn=None):
+        return conn
+
+    with config.db_session() as conn:
+        assert reader(conn=conn) is conn
+    own = reader()
+    assert own is not conn and FakePool.created[0].returned == [conn, own]
+    assert config.connection_stats()['checkouts'] == 2
@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import data_processor
+from data_processor import stream_frame
+from fake_mysql import StreamingConnection
+
+DTYPES = {'TransactionDate': 'datetime64[ns]', 'TransactionClass': 'category', 'RunningTotal': 'float64'}
+CLASSES = ['Portfolio', 'Cash/Sweep', 'Money Market', 'US Treasuries']
+
+def running_balance_rows(days=40, seed=0):
+    """RunningBalanceDayView rows as the connector returns them (dates and Decimals)."""
+    rng = np.random.default_rng(seed)
+    return [
+        (date(2025, 1, 1) + timedelta(days=day), transaction_class, Decimal(f'{rng.uniform(0, 1e6):.2f}'))
+        for day in range(days) for transaction_class in CLASSES
+    ]
+
+def test_stream_frame_matches_converted_fetchall():
+    """The chunked typed frame equals fetchall() followed by the old to_numeric/to_datetime fix-ups."""
+    rows = running_balance_rows() + [(date(2025, 3, 1), None, None)]
+    conn = StreamingConnection(rows)
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM RunningBalanceDayView')
+    result = stream_frame(cursor, DTYPES, chunk_size=7)
+    assert len(conn.fetchmany_sizes) == -(-len(rows) // 7) + 1
+    expected = pd.DataFrame(rows, columns=list(DTYPES))
+    expected['TransactionDate'] = pd.to_datetime(expected['TransactionDate']).astype('datetime64[ns]')
+    expected['RunningTotal'] = pd.to_numeric(expected['RunningTotal']).astype(float)
+    assert result['TransactionDate'].dtype == 'datetime64[ns]'
+    assert result['RunningTotal'].dtype == np.float64
+    assert isinstance(result['TransactionClass'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(result[['TransactionDate', 'RunningTotal']], expected[['TransactionDate', 'RunningTotal']])
+    classes = result['TransactionClass']
+    assert classes.astype(object).where(classes.notna(), None).tolist() == [row[1] for row in rows]
+
+def test_stream_frame_empty_result():
+    conn = StreamingConnection([])
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM RunningBalanceDayView')
+    result = stream_frame(cursor, DTYPES)
+    assert result.empty and list(result.columns) == list(DTYPES)
+    assert result['RunningTotal'].dtype == np.float64
+
+def test_load_and_process_data_streams_typed_columns(monkeypatch):
+    """The pipeline input is typed and holds the same values as the untyped fetch."""
+    rows = running_balance_rows()
+    streamed = data_processor.load_and_process_data(conn=StreamingConnection(rows))
+    monkeypatch.setattr(data_processor, 'stream_frame', lambda cursor, dtypes, chunk_size: pd.DataFrame(
+        cursor.fetchall(), columns=[col[0] for col in cursor.description]))
+    untyped = data_processor.load_and_process_data(conn=StreamingConnection(rows))
+    assert streamed['RunningTotal'].dtype == np.float64
+    assert isinstance(streamed['TransactionClass'].dtype, pd.CategoricalDtype)
+    for frame in (streamed, untyped):
+        frame['TransactionClass'] = frame['TransactionClass'].astype(object)
+    pd.testing.assert_frame_equal(streamed, untyped, check_dtype=False)
+
+def test_fetch_running_balances_pushes_filters_into_sql():
+    """Horizon and asset classes become WHERE conditions; Portfolio and Cash/Sweep are always loaded."""
+    conn = StreamingConnection(running_balance_rows())
+    data_processor.fetch_running_balances(conn=conn, horizon=('2025-01-10', '2025-01-20'), asset_classes=['Money Market'])
+    query, params = conn.queries[-1]
+    assert query == ('SELECT * FROM RunningBalanceDayView WHERE `TransactionDate` > %s AND `TransactionDate` <= %s '
+                     'AND `TransactionClass` IN (%s, %s, %s)')
+    assert params == [date(2025, 1, 10), date(2025, 1, 20), 'Portfolio', 'Cash/Sweep', 'Money Market']
+    data_processor.fetch_running_balances(conn=conn)
+    assert conn.queries[-1] == ('SELECT * FROM RunningBalanceDayView WHERE 1', None)
+
+def reference_compute_available(running_balances, percent_max):
+    """The notebook's transform: merges, repeated string masks and np.where, floored at zero."""
+    running_balances = running_balances.copy()
+    running_balances['RunningTotal'] = pd.to_numeric(running_balances['RunningTotal'])
+    for title, column in (('Portfolio', 'Portfolio'), ('Cash/Sweep', 'CashSweep')):
+        daily = running_balances[running_balances['TransactionClass'] == title][['TransactionDate', 'RunningTotal']]
+        running_balances = running_balances.merge(daily.rename(columns={'RunningTotal': column}), on='TransactionDate', how='left')
+    running_balances['PercentMax'] = running_balances['TransactionClass'].map(percent_max).astype(float).fillna(1.0)
+    running_balances['PolicyMax'] = running_balances['Portfolio'] * running_balances['PercentMax']
+    is_asset = (running_balances['TransactionClass'] != 'Portfolio') & (running_balances['TransactionClass'] != 'Cash/Sweep')
+    running_balances['Investable'] = np.where(is_asset, np.maximum(0, running_balances['PolicyMax'] - running_balances['RunningTotal']),
+                                              np.maximum(0, running_balances['RunningTotal']))
+    running_balances['Available'] = np.where(is_asset, np.maximum(0, np.minimum(running_balances['CashSweep'], running_balances['Investable'])),
+                                             np.maximum(0, running_balances['RunningTotal']))
+    return running_balances
+
+def test_compute_available_matches_notebook():
+    """Negative balances, a day without Cash/Sweep, a class without a policy and a NULL class."""
+    rng = np.random.default_rng(4)
+    rows = [row for row in running_balance_rows(days=20, seed=4) if not (row[0] == date(2025, 1, 5) and row[1] == 'Cash/Sweep')]
+    frame = pd.DataFrame(rows + [(date(2025, 1, 3), 'Repo', Decimal('-5.00')), (date(2025, 1, 4), None, Decimal('7.00'))],
+                         columns=list(DTYPES))
+    frame['RunningTotal'] = [value - Decimal(int(rng.integers(0, 2)) * 600000) for value in frame['RunningTotal']]
+    frame['TransactionDate'] = pd.to_datetime(frame['TransactionDate'])
+    percent_max = {'Money Market': 0.25, 'US Treasuries': np.nan}
+    expected = reference_compute_available(frame, percent_max)
+    result = data_processor.compute_available(frame.copy(), percent_max)
+    assert isinstance(result['TransactionClass'].dtype, pd.CategoricalDtype)
+    assert (result['Available'].dropna() >= 0).all() and (result['Investable'] >= 0).all()
+    assert result['Available'].isna().sum() == 2
+    result['TransactionClass'] = result['TransactionClass'].astype(object)
+    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+
+def test_compute_available_in_place_columns():
+    """The computed columns are float64 arrays and RunningTotal is converted once."""
+    frame = pd.DataFrame({
+        'TransactionDate': pd.to_datetime(['2025-01-01'] * 3),
+        'TransactionClass': pd.Categorical(['Portfolio', 'Cash/Sweep', 'Money Market']),
+        'RunningTotal': [Decimal('100'), Decimal('-10'), Decimal('20')],
+    })
+    result = data_processor.compute_available(frame, {'Money Market': 0.5})
+    assert all(result[column].dtype == np.float64 for column in ('RunningTotal', 'PolicyMax', 'Investable', 'Available'))
+    assert result['Investable'].tolist() == [100.0, 0.0, 30.0]
+    assert result['Available'].tolist() == [100.0, 0.0, 0.0]
@@ -0,0 +1,159 @@
+import pytest
+import pandas as pd
+from database_writer import write_results_to_database, prepare_investment_window_rows
+from database_writer import publish_investment_windows, rollback_investment_windows, write_investment_window_changes
+from fake_mysql import FakeMySQL
+
+@pytest.fixture
+def asset_classes():
+    return pd.DataFrame({'AssetClassTitle': ['Money Market', 'US Treasuries'], 'AssetClassID': [3, 7]})
+
+@pytest.fixture
+def windows():
+    return pd.DataFrame({
+        'LowPointDate': pd.to_datetime(['2025-02-01', '2025-03-01', '2025-02-10', '2025-04-01', '2025-05-01']),
+        'LowPointBalance': [1000.5, 2000, 3000, 4000, 5000],
+        'StartDate': pd.to_datetime(['2025-02-01', '2025-03-01', '2025-02-10', '2025-04-01', '2025-05-01']),
+        'EndDate': pd.to_datetime(['2025-06-30'] * 5),
+        'TimeSpanDays': [150, 122, 141, 91, 61],
+        'Asset Class': ['Money Market', 'Money Market', 'US Treasuries', 'Commercial Paper', 'Commercial Paper'],
+    })
+
+def test_prepare_rows(windows, asset_classes, caplog):
+    """Rows are formatted in one pass and unmapped asset classes are reported once, in aggregate."""
+    rows = prepare_investment_window_rows(windows, asset_classes, current_datetime='2025-06-01 00:00:00')
+    assert list(rows.itertuples(index=False, name=None))[0] == (
+        'App\\Model\\InvestmentWindow', '2025-06-01 00:00:00', '2025-06-01 00:00:00',
+        '2025-02-01', '2025-06-30', 1000.5, 150, 3)
+    assert rows['AssetClassID'].tolist() == [3, 3, 7]
+    assert type(rows['Days'][0]) is int and type(rows['Available'][1]) is float
+    warnings = [record for record in caplog.records if record.levelname == 'WARNING']
+    assert len(warnings) == 1 and "{'Commercial Paper': 2}" in warnings[0].getMessage()
+
+def test_write_in_batches(windows, asset_classes, capsys):
+    """Rows are inserted with executemany in batches of batch_size and committed once; unmapped classes are skipped, not failed."""
+    conn = FakeMySQL()
+    assert write_results_to_database(windows, asset_classes, conn=conn, batch_size=2) is True
+    assert '3 rows inserted successfully, 0 rows failed, 2 rows skipped' in capsys.readouterr().out
+    assert [statement.startswith('INSERT INTO InvestmentWindow') for statement in conn.statements] == [True, True]
+    assert len(conn.visible()) == 3
+    assert conn.commits == 1
+
+def test_failed_batch_doesnt_stop_the_write(windows, asset_classes, capsys):
+    """A failing batch is counted as failed and the next batches are still written."""
+    conn = FakeMySQL(fail_on_id=3)
+    write_results_to_database(windows, asset_classes, conn=conn, batch_size=2)
+    assert [row['AssetClassID'] for row in conn.visible()] == [7]
+    assert '1 rows inserted successfully, 2 rows failed, 2 rows skipped' in capsys.readouterr().out
+
+def test_load_data_infile(windows, asset_classes):
+    """LOAD DATA mode sends one CSV with a row per mapped window."""
+    conn = FakeMySQL()
+    write_results_to_database(windows, asset_classes, conn=conn, load_data=True)
+    assert len(conn.statements) == 1 and conn.statements[0].startswith('LOAD DATA LOCAL INFILE')
+    rows = conn.visible()
+    assert len(rows) == 3
+    assert rows[0]['ClassName'] == 'App\\Model\\InvestmentWindow'
+    assert [rows[0][column] for column in ('FromDate', 'EndDate', 'Available', 'Days', 'AssetClassID')] == [
+        '2025-02-01', '2025-06-30', '1000.5', '150', '3']
+
+def existing_windows():
+    """The InvestmentWindow table as published by the previous run."""
+    return {'InvestmentWindow': [{'ID': 1, 'ClassName': 'App\\Model\\InvestmentWindow', 'FromDate': '2025-01-01',
+                                  'EndDate': '2025-06-30', 'Available': 10.0, 'Days': 181, 'AssetClassID': 3}]}
+
+@pytest.mark.parametrize("mode", ['swap', 'transaction', 'diff'])
+def test_publish_replaces_table(windows, asset_classes, mode):
+    """The atomic modes replace the live rows with the new windows."""
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    conn = FakeMySQL(existing_windows())
+    assert publish_investment_windows(mapped, asset_classes, conn=conn, mode=mode)
+    assert [row['FromDate'] for row in conn.visible()] == ['2025-02-01', '2025-03-01', '2025-02-10']
+
+def test_swap_is_one_rename(windows, asset_classes):
+    """The new rows go to a staging table, which replaces the live one in a single RENAME."""
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    conn = FakeMySQL(existing_windows())
+    publish_investment_windows(mapped, asset_classes, conn=conn, mode='swap')
+    assert not any(statement.startswith(('INSERT INTO InvestmentWindow ', 'TRUNCATE', 'DELETE')) for statement in conn.statements)
+    assert conn.statements[-1] == ('RENAME TABLE InvestmentWindow TO InvestmentWindow_previous, '
+                                   'InvestmentWindow_staging TO InvestmentWindow')
+    assert conn.visible('InvestmentWindow_previous')[0]['Available'] == 10.0
+
+@pytest.mark.parametrize("mode", ['swap', 'transaction'])
+def test_unmapped_classes_dont_stop_the_publish(windows, asset_classes, mode):
+    """Windows of classes without an AssetClassID are skipped, as before; the mapped ones are published."""
+    conn = FakeMySQL(existing_windows())
+    assert publish_investment_windows(windows, asset_classes, conn=conn, mode=mode)
+    assert [row['AssetClassID'] for row in conn.visible()] == [3, 3, 7]
+
+@pytest.mark.parametrize("mode", ['swap', 'transaction'])
+def test_failed_publish_keeps_live_table(windows, asset_classes, mode):
+    """When a row fails to load nothing is published, and swap drops its staging table."""
+    conn = FakeMySQL(existing_windows(), fail_on_id=7)
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    assert not publish_investment_windows(mapped, asset_classes, conn=conn, mode=mode)
+    assert conn.visible() == existing_windows()['InvestmentWindow']
+    assert conn.visible('InvestmentWindow_staging') is None
+
+def test_transaction_hides_rows_until_commit(windows, asset_classes, monkeypatch):
+    """Other sessions keep reading the old rows while the transaction mode inserts."""
+    conn = FakeMySQL(existing_windows())
+    seen = []
+    import database_writer
+    original = database_writer._load_data_infile
+
+    def spy(cursor, rows, table='InvestmentWindow'):
+        original(cursor, rows, table)
+        seen.append(conn.visible())
+
+    monkeypatch.setattr(database_writer, '_load_data_infile', spy)
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    assert publish_investment_windows(mapped, asset_classes, conn=conn, mode='transaction', load_data=True)
+    assert seen == [existing_windows()['InvestmentWindow']]
+    assert len(conn.visible()) == 3
+
+def test_rollback_restores_previous_windows(windows, asset_classes):
+    """rollback_investment_windows swaps the previous publish back in."""
+    conn = FakeMySQL(existing_windows())
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    publish_investment_windows(mapped, asset_classes, conn=conn, mode='swap')
+    rollback_investment_windows(conn=conn)
+    assert conn.visible() == existing_windows()['InvestmentWindow']
+    assert len(conn.visible('InvestmentWindow_previous')) == 3
+
+def published_rows(conn):
+    return sorted((row['AssetClassID'], row['FromDate'], row['EndDate'], float(row['Available']), int(row['Days']))
+                  for row in conn.visible())
+
+def test_diff_writes_only_changes(windows, asset_classes):
+    """Only new, changed and removed windows are written; unchanged rows keep their timestamps."""
+    conn = FakeMySQL()
+    mapped = windows[windows['Asset Class'] != 'Commercial Paper']
+    write_results_to_database(mapped, asset_classes, conn=conn)
+    for row in conn.committed['InvestmentWindow']:
+        row['Created'] = row['LastEdited'] = '2025-01-01 00:00:00'
+    conn.working = conn.committed
+    changed = mapped.copy()
+    changed.loc[1, 'LowPointBalance'] = 2500                 # update
+    changed = changed.drop(index=2)                          # delete
+    changed.loc[9] = [pd.Timestamp('2025-05-05'), 600, pd.Timestamp('2025-05-05'),
+                      pd.Timestamp('2025-06-30'), 57, 'US Treasuries']  # insert
+    conn.statements = []
+    counts = write_investment_window_changes(changed, asset_classes, conn=conn)
+    assert counts == {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1}
+    assert [statement.split()[0] for statement in conn.statements] == ['SELECT', 'DELETE', 'UPDATE', 'INSERT']
+    unchanged = [row for row in conn.visible() if row['FromDate'] == '2025-02-01'][0]
+    assert unchanged['Created'] == unchanged['LastEdited'] == '2025-01-01 00:00:00'
+    assert published_rows(conn) == [(3, '2025-02-01', '2025-06-30', 1000.5, 150), (3, '2025-03-01', '2025-06-30', 2500.0, 122),
+                                     (7, '2025-05-05', '2025-06-30', 600.0, 57)]
+
+def test_diff_matches_database_types(asset_classes, windows):
+    """Dates and Decimals as returned by MySQL match the new rows, so an identical run writes nothing."""
+    from datetime import date
+    from decimal import Decimal
+    conn = FakeMySQL({'InvestmentWindow': [
+        {'ID': 4, 'AssetClassID': 3, 'FromDate': date(2025, 2, 1), 'EndDate': date(2025, 6, 30),
+         'Available': Decimal('1000.50'), 'Days': 150}]})
+    counts = write_investment_window_changes(windows.iloc[:1], asset_classes, conn=conn)
+    assert counts == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 1}
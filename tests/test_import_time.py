@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ['pandas', 'numpy', 'mysql.connector', 'dotenv', 'pyarrow']
+
+def loaded_after(code):
+    """The heavy modules loaded by running code in a fresh interpreter"""
+    script = f"import sys, json\n{code}\nprint(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))"
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+@pytest.mark.parametrize('code', [
+    'import opportuneIQ',
+    'import shared.config, shared.instrumentation',
+    'import opportuneIQ; opportuneIQ.HealthCheck()',
+])
+def test_lean_paths_skip_heavy_imports(code):
+    """Importing the entry point and a health check load none of the heavy dependencies."""
+    assert loaded_after(code) == []
+
+def test_stages_still_load_them():
+    assert 'pandas' in loaded_after('import opportuneIQ; from algorithm_processor import get_horizon')
+
+def test_health_check_reports_database_errors(monkeypatch):
+    import opportuneIQ
+
+    def db_session(db_config=None):
+        raise Exception('Database connection error: refused')
+
+    monkeypatch.setattr(opportuneIQ, 'db_session', db_session)
+    monkeypatch.setenv('DB_NAME', 'treasury')
+    assert opportuneIQ.HealthCheck() == {'status': 'Healthy', 'database': None, 'error': None}
+    assert opportuneIQ.HealthCheck(check_database=True) == {
+        'status': 'Unhealthy', 'database': 'treasury', 'error': 'Database connection error: refused'}
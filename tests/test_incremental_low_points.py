@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+import pytest
+import pandas as pd
+import numpy as np
+from algorithm_processor import (identify_low_points, identify_low_points_incremental, LowPointState,
+                                 process_investment_algorithm, update_investment_windows)
+
+def random_series(rng, start, days):
+    """Balances drawn from a few values so ties and repeated lows are common, with some NaN."""
+    balances = rng.integers(0, 8, days).astype(float) * 100
+    balances[rng.random(days) < 0.05] = np.nan
+    return pd.DataFrame({'Date': pd.date_range(start, periods=days), 'Balance': balances})
+
+def edit(rng, df):
+    """A random next run: leading days dropped, recent days edited, days appended."""
+    dropped = int(rng.integers(0, 3)) if len(df) > 3 else 0
+    df = df.iloc[dropped:].reset_index(drop=True)
+    changed = int(rng.integers(0, len(df) + 1))
+    edited = df.copy()
+    tail = random_series(rng, df['Date'].iloc[0], len(df))['Balance'].to_numpy()
+    edited.loc[changed:, 'Balance'] = tail[changed:]
+    appended = random_series(rng, df['Date'].iloc[-1] + pd.Timedelta(days=1), int(rng.integers(0, 4)))
+    edited = pd.concat([edited, appended], ignore_index=True)
+    changed_from = edited['Date'].iloc[changed] if changed < len(edited) else edited['Date'].iloc[-1]
+    return edited, changed_from
+
+@pytest.mark.parametrize('seed', range(100))
+def test_incremental_matches_full_recompute(seed):
+    """Any sequence of tail edits, appended days and dropped leading days gives the full result."""
+    rng = np.random.default_rng(seed)
+    df = random_series(rng, '2025-01-01', int(rng.integers(1, 40)))
+    result, state = identify_low_points_incremental(df.copy())
+    pd.testing.assert_frame_equal(result, identify_low_points(df.copy()))
+    for _ in range(5):
+        df, changed_from = edit(rng, df)
+        # Half of the runs detect the changes by comparing with the state
+        result, state = identify_low_points_incremental(df.copy(), state, changed_from if rng.random() < 0.5 else None)
+        pd.testing.assert_frame_equal(result, identify_low_points(df.copy()))
+        full = LowPointState.build(df['Date'], df['Balance'])
+        np.testing.assert_array_equal(state.body_min, full.body_min)
+        np.testing.assert_array_equal(state.candidates, full.candidates)
+
+def test_unchanged_prefix_is_reused():
+    """Lowering a late balance only rewrites the suffix minima above it."""
+    df = pd.DataFrame({'Date': pd.date_range('2025-01-01', periods=6), 'Balance': [10., 30, 20, 50, 40, 60]})
+    _, state = identify_low_points_incremental(df.copy())
+    df.loc[4, 'Balance'] = 25.
+    result, updated = identify_low_points_incremental(df.copy(), state, '2025-01-05')
+    np.testing.assert_array_equal(updated.body_min, [10, 20, 20, 25, 25])
+    pd.testing.assert_frame_equal(result, identify_low_points(df.copy()))
+
+def test_state_round_trip(tmp_path):
+    df = pd.DataFrame({'Date': pd.date_range('2025-01-01', periods=4), 'Balance': [3., np.nan, 1, 2]})
+    _, state = identify_low_points_incremental(df.copy())
+    state.save(tmp_path / 'state.npz')
+    loaded = LowPointState.load(tmp_path / 'state.npz')
+    for name in ('dates', 'balances', 'body_min', 'candidates'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(state, name))
+    assert LowPointState.load(tmp_path / 'missing.npz') is None
+
+def generated_balances(seed, classes=('Money Market', 'US Treasuries', 'Portfolio')):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2025-01-01', '2025-07-31')
+    return pd.concat([pd.DataFrame({
+        'TransactionDate': dates, 'TransactionClass': transaction_class,
+        'Available': np.round(rng.normal(0, 1e5, len(dates)).cumsum() + 5e6, -3),
+    }) for transaction_class in classes], ignore_index=True)
+
+def test_update_investment_windows(tmp_path):
+    """Windows from the persisted states equal a full run after the forecast tail changes."""
+    running_balances = generated_balances(3)
+    horizon = ('2025-01-21', '2025-06-30')
+    first = update_investment_windows(running_balances, horizon=horizon, state_dir=tmp_path)
+    pd.testing.assert_frame_equal(first, process_investment_algorithm(running_balances, workers=1, horizon=horizon))
+    assert sorted(path.name for path in tmp_path.glob('*/*')) == ['Money%20Market.npz', 'US%20Treasuries.npz']
+    edited = running_balances['TransactionDate'] >= '2025-06-01'
+    running_balances.loc[edited, 'Available'] -= 3e5
+    horizon = ('2025-01-25', '2025-07-04')
+    second = update_investment_windows(running_balances, changed_dates=['2025-06-15', '2025-06-01'],
+                                       horizon=horizon, state_dir=tmp_path)
+    pd.testing.assert_frame_equal(second, process_investment_algorithm(running_balances, workers=1, horizon=horizon))
+
+def test_states_are_kept_per_database(tmp_path):
+    """Tenants with the same class titles sharing a state_dir don't read each other's states."""
+    tenants = {database: (SimpleNamespace(server_host='db1', server_port=3306, database=database), generated_balances(seed))
+               for database, seed in (('a', 5), ('b', 6))}
+    horizon = ('2025-01-21', '2025-06-30')
+    for conn, balances in tenants.values():
+        update_investment_windows(balances, horizon=horizon, state_dir=tmp_path, conn=conn)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['db1_3306_a', 'db1_3306_b']
+    for conn, balances in tenants.values():
+        balances.loc[balances['TransactionDate'] >= '2025-06-01', 'Available'] += 2e5
+        updated = update_investment_windows(balances, changed_from='2025-06-01', horizon=horizon,
+                                            state_dir=tmp_path, conn=conn)
+        pd.testing.assert_frame_equal(updated, process_investment_algorithm(balances, workers=1, horizon=horizon))
@@ -0,0 +1,98 @@
+import json
+import pstats
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import pytest
+import opportuneIQ
+import database_writer
+from fake_mysql import StreamingConnection
+from shared import config
+from shared.instrumentation import run_report, stage, instrumented, count_rows
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch, tmp_path):
+    monkeypatch.setenv('RUN_REPORT_DIR', str(tmp_path / 'reports'))
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.delenv('PROFILE_STAGE', raising=False)
+
+def written_report(tmp_path):
+    [path] = (tmp_path / 'reports').glob('*.json')
+    return json.loads(path.read_text())
+
+def test_nested_stages_are_recorded(tmp_path):
+    @instrumented('double', rows_in=lambda values: len(values))
+    def double(values):
+        return values * 2
+
+    with run_report('test') as report:
+        with stage('outer', rows_in=3) as record:
+            double([1, 2, 3])
+            config._count_connections('checkouts')
+            record['rows_out'] = 6
+    stages = {record['stage']: record for record in written_report(tmp_path)['stages']}
+    assert list(stages) == ['outer/double', 'outer']
+    assert (stages['outer/double']['rows_in'], stages['outer/double']['rows_out']) == (3, 6)
+    assert stages['outer']['connections']['checkouts'] == 1
+    assert report.status == 'Success' and report.wall_s >= stages['outer']['wall_s'] >= 0
+    assert all(key in stages['outer'] for key in ('cpu_s', 'peak_rss_mib'))
+
+def test_concurrent_runs_count_their_own_connections():
+    """Runs in concurrent threads (batch loaders, service requests) don't mix their connection counts."""
+    # Both runs are in progress between the two barrier waits
+    barrier = threading.Barrier(2)
+
+    def run(checkouts):
+        with run_report(f'run-{checkouts}') as report, stage('load') as record:
+            barrier.wait(5)
+            for _ in range(checkouts):
+                config._count_connections('checkouts')
+            barrier.wait(5)
+        return report.connections['checkouts'], record['connections']['checkouts']
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        runs = [executor.submit(run, checkouts) for checkouts in (2, 3)]
+        assert [future.result(10) for future in runs] == [(2, 2), (3, 3)]
+
+def test_failed_run_is_reported(tmp_path):
+    with pytest.raises(ValueError):
+        with run_report('test'), stage('load'):
+            raise ValueError('no data')
+    report = written_report(tmp_path)
+    assert report['status'] == 'Failure' and report['stages'][0]['stage'] == 'load'
+
+def test_stages_outside_a_run_are_not_collected():
+    with stage('alone') as record:
+        pass
+    assert record['wall_s'] >= 0
+
+def test_profile_stage(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILE_STAGE', 'inner')
+    with run_report('test'), stage('outer'), stage('inner') as record:
+        sorted(range(1000), reverse=True)
+    assert record['profile'].endswith('outer.inner.prof')
+    assert pstats.Stats(record['profile']).total_calls > 0
+
+def test_count_rows():
+    assert count_rows([1, 2]) == 2
+    assert count_rows(([1, 2, 3], 'reference')) == 3
+    assert count_rows(None) is None
+
+def test_pipeline_run_report(tmp_path, monkeypatch, rows):
+    """A pipeline run reports every stage and sub-stage with its rows."""
+    monkeypatch.setenv('HORIZON_START', '2025-01-21')
+    monkeypatch.setenv('HORIZON_END', '2025-06-30')
+
+    @contextmanager
+    def db_session(db_config=None):
+        yield StreamingConnection(rows)
+
+    monkeypatch.setattr(opportuneIQ, 'db_session', db_session)
+    monkeypatch.setattr(database_writer, 'publish_investment_windows', lambda windows, reference, conn=None: True)
+    assert opportuneIQ.ProcessTreasuryForecastingData() == 'Success'
+    stages = {record['stage']: record for record in written_report(tmp_path)['stages']}
+    assert list(stages) == ['load/reference/fetch', 'load/reference', 'load/fetch', 'load/transform', 'load',
+                            'algorithm/low_points', 'algorithm/allocate', 'algorithm', 'write']
+    assert stages['load/fetch']['rows_out'] == stages['load/transform']['rows_in'] == len(rows)
+    assert stages['algorithm/allocate']['rows_in'] == stages['algorithm/low_points']['rows_out']
+    assert stages['algorithm']['rows_out'] == stages['algorithm/allocate']['rows_out'] == stages['write']['rows_in']
@@ -2,7 +2,7 @@ import pytest
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from test_investment_windows import find_investment_windows
+from investment_windows import find_investment_windows, iter_investment_windows, optimize_non_overlapping_windows, RangeMinimum
 
 @pytest.fixture
 def base_date():
@@ -18,7 +18,7 @@ def test_basic_stable_balance(base_date):
     windows = find_investment_windows(df, min_days=3)
 
     # Check that we have the expected number of windows (with min_days=3, we should have windows of lengths 3,4,5,6,7,8,9,10)
-    expected_windows = sum(range(3, 11))  # Sum of 3 to 10
+    expected_windows = sum(range(1, 9))  # 8 windows of length 3, 7 of length 4, ..., 1 of length 10
     assert len(windows) == expected_windows
 
     # Check that the top window covers the entire period
@@ -172,7 +172,7 @@ def test_sorting_by_score(base_date):
 @pytest.mark.parametrize("min_days,expected_count", [
     (2, 45),  # 9+8+7+6+5+4+3+2+1 = 45
     (5, 21),  # 6+5+4+3+2+1 = 21
-    (8, 3),   # 3+2+1 = 6 - 3 = 3
+    (8, 6),   # 3+2+1 = 6
     (10, 1),  # 1
     (11, 0)   # No windows this long
 ])
@@ -200,4 +200,119 @@ def test_balance_patterns(base_date, balance_pattern, expected_min):
     windows = find_investment_windows(df, min_days=len(balance_pattern))
 
     assert len(windows) == 1  # Only one window of full length
-    assert windows[0]['amount'] == expected_min
\ No newline at end of file
+    assert windows[0]['amount'] == expected_min
+def reference_find_investment_windows(df, date_column='date', balance_column='balance', min_days=2):
+    """The original slice-per-window implementation from algo.ipynb, kept as the parity reference."""
+    df = df.sort_values(by=date_column).reset_index(drop=True)
+    investment_windows = []
+    for start_idx in range(len(df) - min_days + 1):
+        for end_idx in range(start_idx + min_days - 1, len(df)):
+            min_balance = df.iloc[start_idx:end_idx + 1][balance_column].min()
+            if min_balance > 0:
+                days = (df.iloc[end_idx][date_column] - df.iloc[start_idx][date_column]).days + 1
+                investment_windows.append({
+                    'start_date': df.iloc[start_idx][date_column],
+                    'end_date': df.iloc[end_idx][date_column],
+                    'amount': min_balance,
+                    'days': days,
+                    'score': min_balance * days
+                })
+    investment_windows.sort(key=lambda x: x['score'], reverse=True)
+    return investment_windows
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parity_with_reference(base_date, seed):
+    """The range-minimum engine returns the same windows, in the same order, as the original loop."""
+    rng = np.random.default_rng(seed)
+    balances = np.round(rng.normal(200, 400, 40).cumsum() + 1000, -2)
+    df = pd.DataFrame({'date': pd.date_range(start=base_date, periods=40), 'balance': balances})
+    assert find_investment_windows(df, min_days=3) == reference_find_investment_windows(df, min_days=3)
+
+@pytest.mark.parametrize("top_k", [1, 7, 50, 1000])
+def test_top_k_matches_full_list(base_date, top_k):
+    """The top-K mode returns the head of the full sorted list, ties included."""
+    dates = pd.date_range(start=base_date, periods=30)
+    balances = [1000, 1500, 800, 1200, 900, 1100, 750, 1300, 950, 1000] * 3
+    df = pd.DataFrame({'date': dates, 'balance': balances})
+    windows = find_investment_windows(df, min_days=3)
+    assert find_investment_windows(df, min_days=3, top_k=top_k) == windows[:top_k]
+
+def test_range_minimum_query():
+    """Sparse table minimums match direct slices, and NaN-only ranges return NaN."""
+    rng = np.random.default_rng(11)
+    balances = rng.normal(0, 1, 37)
+    balances[[5, 6]] = np.nan
+    starts = np.array([0, 3, 5, 5, 10, 36])
+    ends = np.array([36, 9, 5, 6, 20, 36])
+    result = RangeMinimum(balances).query(starts, ends)
+    expected = [np.nanmin(balances[s:e + 1]) if not np.isnan(balances[s:e + 1]).all() else np.nan
+                for s, e in zip(starts, ends)]
+    np.testing.assert_array_equal(result, expected)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_iter_windows_matches_full_list(base_date, seed):
+    """The streaming generator yields every window of the full list, in the same order."""
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 60))
+    balances = np.round(rng.normal(0, 300, n).cumsum() + 500, -2)
+    df = pd.DataFrame({'date': pd.date_range(start=base_date, periods=n), 'balance': balances})
+    min_days = int(rng.integers(1, 6))
+    assert list(iter_investment_windows(df, min_days=min_days)) == find_investment_windows(df, min_days=min_days)
+
+def test_iter_windows_skips_missing_balances(base_date):
+    """NaN balances are skipped like pandas' min() and never produce a window of their own."""
+    dates = pd.date_range(start=base_date, periods=8)
+    balances = [1000, np.nan, np.nan, 1200, 900, np.nan, 750, 1300]
+    df = pd.DataFrame({'date': dates, 'balance': balances})
+    assert list(iter_investment_windows(df, min_days=2)) == reference_find_investment_windows(df, min_days=2)
+
+def test_iter_windows_is_lazy(base_date):
+    """Taking the first windows of a long horizon doesn't enumerate the rest."""
+    dates = pd.date_range(start=base_date, periods=5000)
+    balances = np.random.default_rng(3).normal(1e6, 1e5, 5000)
+    df = pd.DataFrame({'date': dates, 'balance': balances})
+    first = next(iter_investment_windows(df, date_column='date', balance_column='balance', min_days=30))
+    assert first == find_investment_windows(df, min_days=30, top_k=1)[0]
+
+def test_top_k_with_repeated_dates(base_date):
+    """Repeated dates fall back to the batched top-K reduction and keep the full-list order."""
+    dates = list(pd.date_range(start=base_date, periods=10)) * 2
+    balances = [1000, 1500, 800, 1200, 900, 1100, 750, 1300, 950, 1000] * 2
+    df = pd.DataFrame({'date': dates, 'balance': balances})
+    windows = find_investment_windows(df, min_days=3)
+    assert find_investment_windows(df, min_days=3, top_k=25) == windows[:25]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_optimize_non_overlapping_windows(base_date, seed):
+    """The chosen windows don't overlap and reach the best total of an exhaustive search."""
+    rng = np.random.default_rng(seed)
+    windows = []
+    for _ in range(int(rng.integers(0, 12))):
+        start = base_date + pd.Timedelta(days=int(rng.integers(0, 30)))
+        days = int(rng.integers(1, 10))
+        amount = int(rng.integers(1, 5)) * 100
+        windows.append({'start_date': start, 'end_date': start + pd.Timedelta(days=days - 1),
+                        'amount': amount, 'days': days, 'score': amount * days})
+    chosen, total = optimize_non_overlapping_windows(windows)
+
+    def overlaps(a, b):
+        return not (a['end_date'] < b['start_date'] or b['end_date'] < a['start_date'])
+
+    best = 0
+    for mask in range(1 << len(windows)):
+        subset = [w for i, w in enumerate(windows) if mask >> i & 1]
+        if all(not overlaps(a, b) for i, a in enumerate(subset) for b in subset[i + 1:]):
+            best = max(best, sum(w['score'] for w in subset))
+    assert total == best
+    assert total == sum(w['score'] for w in chosen)
+    for previous, window in zip(chosen, chosen[1:]):
+        assert previous['end_date'] < window['start_date']
+
+def test_optimize_non_overlapping_windows_top_n(base_date):
+    """top_n limits the candidates to the head of the score-sorted list."""
+    dates = pd.date_range(start=base_date, periods=10)
+    balances = [1000, 1500, 800, 1200, 900, 1100, 750, 1300, 950, 1000]
+    windows = find_investment_windows(pd.DataFrame({'date': dates, 'balance': balances}), min_days=3)
+    chosen, total = optimize_non_overlapping_windows(windows, top_n=1)
+    assert chosen == windows[:1] and total == windows[0]['score']
+    assert optimize_non_overlapping_windows([]) == ([], 0)
@@ -0,0 +1,126 @@
+import pytest
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from algorithm_processor import identify_low_points, find_low_points
+
+def reference_identify_low_points(df, min_days=2):
+    """The original O(n²) nested-loop implementation, kept as the parity reference."""
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'])
+    df = df.sort_values('Date')
+    max_date = df['Date'].max()
+    min_date = df['Date'].min()
+    dates = df['Date'].tolist()
+    balances = df['Balance'].tolist()
+    local_minima = []
+    seen_balances = set()
+    for i in range(len(df) - 1, -1, -1):
+        current_date = dates[i]
+        current_balance = balances[i]
+        if current_date == max_date:
+            continue
+        is_local_min = True
+        for j in range(i + 1, len(df)):
+            if balances[j] < current_balance:
+                is_local_min = False
+                break
+        if is_local_min and current_balance not in seen_balances:
+            local_minima.append((current_date, current_balance))
+            seen_balances.add(current_balance)
+    local_minima.sort(key=lambda x: x[0], reverse=True)
+    absolute_min_idx = df['Balance'].idxmin()
+    absolute_min_date = df.loc[absolute_min_idx, 'Date']
+    absolute_min_balance = df.loc[absolute_min_idx, 'Balance']
+    results = []
+    for low_date, low_balance in local_minima:
+        time_span = (max_date - low_date).days + 1
+        if time_span >= min_days:
+            results.append({
+                'LowPointDate': low_date,
+                'LowPointBalance': low_balance,
+                'StartDate': low_date,
+                'EndDate': max_date,
+                'TimeSpanDays': time_span
+            })
+    if absolute_min_balance not in [res['LowPointBalance'] for res in results]:
+        results.append({
+            'LowPointDate': absolute_min_date,
+            'LowPointBalance': absolute_min_balance,
+            'StartDate': min_date,
+            'EndDate': max_date,
+            'TimeSpanDays': (max_date - min_date).days + 1
+        })
+    return pd.DataFrame(results).sort_values('TimeSpanDays')
+
+@pytest.fixture
+def base_date():
+    """Create a base date for our tests."""
+    return datetime(2025, 1, 22)
+
+def make_df(base_date, balances):
+    dates = pd.date_range(start=base_date, periods=len(balances))
+    return pd.DataFrame({'Date': dates, 'Balance': balances})
+
+def assert_parity(df, min_days=2):
+    expected = reference_identify_low_points(df.copy(), min_days=min_days)
+    result = identify_low_points(df.copy(), min_days=min_days)
+    pd.testing.assert_frame_equal(result, expected)
+
+@pytest.mark.parametrize("balances", [
+    [1000] * 10,                                            # Flat - only the full span
+    list(range(1000, 2000, 100)),                           # Increasing - every point is a low point
+    list(range(2000, 1000, -100)),                          # Decreasing - only the full span
+    [1000, 1500, 800, 1200, 900, 1100, 750, 1300, 950, 1000],
+    [1000, 1500, -200, 1200, 900, -100, 750, 1300, 950, 1000],
+    [500, 500, 700, 500, 900, 900, 600, 600, 1000, 800],    # Repeated low balances
+    [3000, 1000, 2000, 1000, 2000, 1000, 2000],             # Same low hit several times
+    [100, 200, 300, 100],                                   # Last point equals an earlier low
+    [100.5, 99.25, 101.0, 99.25, 150.75],                   # Float balances
+    [42],                                                   # Single day
+])
+def test_parity_patterns(base_date, balances):
+    """The suffix-minimum engine matches the nested-loop reference on hand-picked shapes."""
+    assert_parity(make_df(base_date, balances))
+
+@pytest.mark.parametrize("min_days", [1, 2, 5, 30, 400])
+def test_parity_min_days(base_date, min_days):
+    """The minimum span filter and the absolute-minimum row interact the same way."""
+    rng = np.random.default_rng(7)
+    balances = np.round(rng.normal(1e6, 2e5, 120).cumsum(), -3)
+    assert_parity(make_df(base_date, balances), min_days=min_days)
+
+@pytest.mark.parametrize("seed", range(25))
+def test_parity_random(base_date, seed):
+    """Random walks with frequent ties (coarse rounding) match the reference exactly."""
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 250))
+    balances = np.round(rng.normal(0, 5e4, n).cumsum() + 1e6, -4)
+    assert_parity(make_df(base_date, balances), min_days=int(rng.integers(1, 10)))
+
+def test_parity_integer_balances(base_date):
+    """Integer balances keep their integer dtype."""
+    assert_parity(make_df(base_date, [7, 3, 9, 3, 8, 5, 6]))
+
+def test_parity_unsorted_and_string_dates(base_date):
+    """Input order and string dates are normalized before the scan."""
+    df = make_df(base_date, [1000, 1500, 800, 1200, 900, 1100, 750, 1300, 950, 1000])
+    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+    assert_parity(df.sample(frac=1, random_state=3))
+
+def test_parity_nan_balances(base_date):
+    """Missing balances never disqualify a point, and are flagged themselves, as before."""
+    assert_parity(make_df(base_date, [1000, np.nan, 800, 1200, np.nan, 900, 1000]))
+
+def test_find_low_points_mask():
+    """Low points are <= everything after and strictly below later non-skipped points."""
+    balances = np.array([5.0, 3.0, 4.0, 3.0, 6.0, 3.0])
+    skip = np.array([False, False, False, False, False, True])
+    mask, suffix_min = find_low_points(balances, skip)
+    assert mask.tolist() == [False, False, False, True, False, False]
+    assert suffix_min.tolist() == [3.0, 3.0, 3.0, 3.0, 3.0, 3.0]
+
+def test_find_low_points_empty():
+    """An empty series yields an empty mask."""
+    mask, suffix_min = find_low_points(np.array([], dtype=float), np.array([], dtype=bool))
+    assert len(mask) == 0 and len(suffix_min) == 0
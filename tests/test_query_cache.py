@@ -0,0 +1,172 @@
+import os
+import time
+import logging
+from datetime import date
+from decimal import Decimal
+import pandas as pd
+import pytest
+import data_processor
+import shared.cache as query_cache
+from shared.cache import QueryCache
+
+class CountingConnection:
+    """Connection stand-in answering fingerprint queries and counting the data queries."""
+    def __init__(self, rows, database='tenant', host='db1'):
+        self.rows = rows
+        self.database = database
+        self.server_host = host
+        self.last_edited = '2025-01-01 00:00:00'
+        # MAX(LastEdited) of the tables edited since
+        self.edited = {}
+        self.queries = 0
+        self.fingerprints = []
+
+    def cursor(self, buffered=True):
+        return CountingCursor(self)
+
+class CountingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.result = []
+
+    def execute(self, query):
+        if query.startswith('SELECT COUNT(*)'):
+            self.conn.fingerprints.append(query)
+            table = query.rsplit('`', 2)[1]
+            if table == 'Missing':
+                raise RuntimeError(f"Table '{table}' doesn't exist")
+            self.result = [(len(self.conn.rows), self.conn.edited.get(table, self.conn.last_edited))]
+        else:
+            self.conn.queries += 1
+            self.description = [('TransactionDate',), ('TransactionClass',), ('RunningTotal',)]
+            self.result = list(self.conn.rows)
+
+    def fetchall(self):
+        return self.result
+
+    def fetchmany(self, size):
+        rows, self.result = self.result[:size], self.result[size:]
+        return rows
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('QUERY_CACHE_DIR', str(tmp_path))
+    monkeypatch.delenv('QUERY_CACHE_BYPASS', raising=False)
+    monkeypatch.delenv('QUERY_CACHE_SOURCES', raising=False)
+    monkeypatch.setattr(query_cache, '_uncacheable', set())
+    return tmp_path
+
+@pytest.fixture
+def conn():
+    return CountingConnection([
+        (date(2025, 2, 1), 'Cash/Sweep', Decimal('100.50')),
+        (date(2025, 2, 2), 'Cash/Sweep', Decimal('80.25')),
+    ])
+
+def test_second_fetch_is_served_from_the_cache(cache_dir, conn):
+    first = data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    second = data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    assert conn.queries == 1
+    pd.testing.assert_frame_equal(first, second)
+    # Column types survive the round trip
+    assert second['RunningTotal'].tolist() == [Decimal('100.50'), Decimal('80.25')]
+    assert second['TransactionDate'].tolist() == [date(2025, 2, 1), date(2025, 2, 2)]
+
+def test_changed_fingerprint_refetches(cache_dir, conn):
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    conn.last_edited = '2025-01-02 00:00:00'
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    conn.rows.append((date(2025, 2, 3), 'Cash/Sweep', Decimal('10')))
+    df = data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    assert conn.queries == 3
+    assert len(df) == 3
+    # Older versions of the query are replaced, not accumulated
+    assert len(list(cache_dir.glob('*.arrow'))) == 1
+
+def test_databases_do_not_share_entries(cache_dir, conn):
+    other = CountingConnection(conn.rows, database='other')
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    data_processor.fetch_data('RunningBalanceDayView', conn=other)
+    assert (conn.queries, other.queries) == (1, 1)
+
+def test_servers_and_types_do_not_share_entries(cache_dir, conn):
+    """The same schema name on another server, or a typed read of the same query, is another entry."""
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    data_processor.fetch_data('RunningBalanceDayView', conn=CountingConnection(conn.rows, host='db2'))
+    typed = data_processor.fetch_data('RunningBalanceDayView', conn=conn, dtypes={'RunningTotal': 'float64'})
+    assert conn.queries == 2
+    assert typed['RunningTotal'].dtype == 'float64'
+    assert data_processor.fetch_data('RunningBalanceDayView', conn=conn)['RunningTotal'].dtype == object
+
+def test_transaction_table_edits_are_seen(cache_dir, conn):
+    """The raw transaction table is fingerprinted by MAX(LastEdited): an in-place edit is a miss."""
+    data_processor.fetch_data('Transaction', conn=conn)
+    conn.last_edited = '2025-01-02 00:00:00'
+    data_processor.fetch_data('Transaction', conn=conn)
+    assert conn.queries == 2
+    assert conn.fingerprints[0] == 'SELECT COUNT(*), MAX(`LastEdited`) FROM `Transaction`'
+
+def test_view_is_fingerprinted_by_every_source(cache_dir, conn, monkeypatch):
+    """An edit of any source table of the view is a miss; QUERY_CACHE_SOURCES adds the view's other sources."""
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    conn.edited['AssetClass'] = '2025-01-02 00:00:00'
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    assert conn.queries == 2
+    monkeypatch.setenv('QUERY_CACHE_SOURCES', 'RunningBalanceDayView:Transaction,AssetClass,BalanceAdjustment')
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    conn.edited['BalanceAdjustment'] = '2025-01-03 00:00:00'
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    assert conn.queries == 4
+    assert conn.fingerprints[-1] == 'SELECT COUNT(*), MAX(`LastEdited`) FROM `BalanceAdjustment`'
+
+def test_tables_without_fingerprint_are_not_cached(cache_dir, conn, monkeypatch, caplog):
+    """Uncacheable tables are always queried, and logged as such once rather than on every fetch."""
+    monkeypatch.setenv('QUERY_CACHE_SOURCES', 'RunningBalanceDayView:Missing')
+    with caplog.at_level(logging.WARNING):
+        for table_name in ('InvestmentWindow', 'InvestmentWindow', 'RunningBalanceDayView', 'RunningBalanceDayView'):
+            data_processor.fetch_data(table_name, conn=conn)
+    assert conn.queries == 4
+    assert conn.fingerprints == ['SELECT COUNT(*), MAX(`LastEdited`) FROM `Missing`'] * 2
+    assert not list(cache_dir.glob('*.arrow'))
+    assert [record.getMessage() for record in caplog.records if 'Not caching' in record.getMessage()] == [
+        'Not caching InvestmentWindow: it has no change fingerprint',
+        "Not caching RunningBalanceDayView: no fingerprint of Missing: Table 'Missing' doesn't exist",
+    ]
+
+def test_bypass(cache_dir, conn, monkeypatch):
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn, use_cache=False)
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn, use_cache=False)
+    monkeypatch.setenv('QUERY_CACHE_BYPASS', '1')
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    data_processor.fetch_data('RunningBalanceDayView', conn=conn)
+    assert conn.queries == 4
+    assert not list(cache_dir.glob('*.arrow'))
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = QueryCache(tmp_path, ttl=60)
+    cache.put('query', ('1',), pd.DataFrame({'a': [1]}))
+    assert cache.get('query', ('1',)) is not None
+    path = cache.path('query', ('1',))
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert cache.get('query', ('1',)) is None
+    assert not path.exists()
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    frame = pd.DataFrame({'a': range(1000)})
+    cache = QueryCache(tmp_path)
+    cache.put('first', ('1',), frame)
+    size = cache.path('first', ('1',)).stat().st_size
+    cache.max_bytes = 2 * size
+    cache.put('second', ('1',), frame)
+    # Read 'first' so 'second' becomes the least recently used entry
+    os.utime(cache.path('second', ('1',)), (time.time() - 10, time.time() - 10))
+    cache.get('first', ('1',))
+    cache.put('third', ('1',), frame)
+    assert cache.get('first', ('1',)) is not None
+    assert cache.get('second', ('1',)) is None
+    assert cache.get('third', ('1',)) is not None
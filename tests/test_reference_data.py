@@ -0,0 +1,94 @@
+import threading
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import pytest
+import data_processor
+from database_writer import prepare_investment_window_rows
+from fake_mysql import StreamingConnection
+from reference_data import ReferenceData, get_reference_data, invalidate_reference_data
+
+@pytest.fixture(autouse=True)
+def fresh_memo(monkeypatch):
+    monkeypatch.setenv('QUERY_CACHE_BYPASS', '1')
+    invalidate_reference_data()
+    yield
+    invalidate_reference_data()
+
+def connection(database, host='db1', port=3306):
+    conn = StreamingConnection([])
+    conn.database, conn.server_host, conn.server_port = database, host, port
+    return conn
+
+def asset_class_queries(conn):
+    return sum('AssetClass' in query for query, _ in conn.queries)
+
+def test_loaded_once_per_database():
+    conn = connection('tenant')
+    reference = get_reference_data(conn=conn)
+    assert get_reference_data(conn=conn) is reference
+    assert asset_class_queries(conn) == 1
+    assert reference.title_to_id == {'Money Market': 1, 'US Treasuries': 2}
+    other = connection('other')
+    assert get_reference_data(conn=other) is not reference
+    assert asset_class_queries(other) == 1
+
+def test_same_name_on_another_host():
+    """A schema name repeated on another server is another database."""
+    reference = get_reference_data(conn=connection('tenant'))
+    assert get_reference_data(conn=connection('tenant', host='db2')) is not reference
+    assert get_reference_data(conn=connection('tenant', port=3307)) is not reference
+    assert get_reference_data(conn=connection('tenant')) is reference
+
+def test_cold_load_blocks_only_its_database(monkeypatch):
+    """While one database loads, the memo of the others stays available."""
+    warm = get_reference_data(conn=connection('warm'))
+    started, release = threading.Event(), threading.Event()
+    load_asset_classes = data_processor.load_asset_classes
+
+    def slow_load(conn=None):
+        started.set()
+        release.wait(5)
+        return load_asset_classes(conn=conn)
+
+    monkeypatch.setattr(data_processor, 'load_asset_classes', slow_load)
+    cold = threading.Thread(target=get_reference_data, kwargs={'conn': connection('cold')})
+    cold.start()
+    assert started.wait(5)
+    assert get_reference_data(conn=connection('warm')) is warm
+    release.set()
+    cold.join(5)
+    assert not cold.is_alive()
+
+def test_invalidation_and_ttl(monkeypatch):
+    conn = connection('tenant')
+    reference = get_reference_data(conn=conn)
+    invalidate_reference_data('other')
+    assert get_reference_data(conn=conn) is reference
+    invalidate_reference_data('tenant')
+    reloaded = get_reference_data(conn=conn)
+    assert reloaded is not reference
+    assert get_reference_data(conn=conn, refresh=True) is not reloaded
+    monkeypatch.setenv('REFERENCE_DATA_TTL', '0')
+    reloaded.loaded_at -= 1
+    get_reference_data(conn=conn)
+    assert asset_class_queries(conn) == 4
+
+def test_percent_max_is_float():
+    """PercentMax is float64, not Decimal objects; a NULL policy maps to 1.0."""
+    reference = get_reference_data(conn=connection('tenant'))
+    assert reference.asset_classes['AssetClassPercentMax'].dtype == np.float64
+    assert reference.title_to_percent_max == {'Money Market': 0.25, 'US Treasuries': 0.5}
+    without_policy = ReferenceData(pd.DataFrame({'AssetClassTitle': ['Repo'], 'AssetClassID': [7],
+                                                 'AssetClassPercentMax': [np.nan]}))
+    assert without_policy.title_to_percent_max == {'Repo': 1.0}
+
+def test_writer_uses_prebuilt_ids():
+    reference = get_reference_data(conn=connection('tenant'))
+    windows = pd.DataFrame({
+        'Asset Class': ['US Treasuries'], 'LowPointBalance': [Decimal('10.5')], 'StartDate': [pd.Timestamp('2025-02-01')],
+        'EndDate': [pd.Timestamp('2025-03-01')], 'TimeSpanDays': [29],
+    })
+    rows = prepare_investment_window_rows(windows, reference, '2025-01-01 00:00:00')
+    assert rows['AssetClassID'].tolist() == [2]
+    pd.testing.assert_frame_equal(rows, prepare_investment_window_rows(windows, reference.asset_classes, '2025-01-01 00:00:00'))
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+import data_processor
+from algorithm_processor import identify_low_points, process_investment_algorithm
+from fake_mysql import StreamingConnection
+from scenarios import (evaluate_scenarios, run_scenarios, horizon_cash_flows, scale_inflows, shift_flows,
+                       delay_payroll, random_scenarios)
+
+HORIZON = ('2025-01-21', '2025-06-30')
+
+@pytest.mark.parametrize('seed', range(20))
+def test_each_scenario_matches_identify_low_points(seed):
+    """Ties, NaN balances and short series: every scenario's rows are identify_low_points' windows."""
+    rng = np.random.default_rng(seed)
+    days = int(rng.integers(1, 30))
+    dates = pd.date_range('2025-01-01', periods=days)
+    balances = rng.integers(0, 6, (25, days)).astype(float) * 100
+    balances[rng.random(balances.shape) < 0.03] = np.nan
+    balances[:, 0] = np.where(np.isnan(balances[:, 0]), 0, balances[:, 0])
+    result = evaluate_scenarios(dates, balances)
+    for scenario, row in enumerate(balances):
+        expected = identify_low_points(pd.DataFrame({'Date': dates, 'Balance': row}))
+        windows = result.windows[result.windows['Scenario'] == scenario].drop(columns='Scenario')
+        pd.testing.assert_frame_equal(windows.reset_index(drop=True), expected.reset_index(drop=True))
+    assert result.summary['Windows'].sum() == len(result.windows)
+    np.testing.assert_array_equal(result.summary['MinimumBalance'], np.nanmin(balances, axis=1))
+
+def test_distribution():
+    dates = pd.date_range('2025-01-01', periods=4)
+    result = evaluate_scenarios(dates, [[5., 3, 4, 6], [1., 2, 3, 0], [4., 4, 4, 4]], names=['a', 'b', 'c'])
+    assert result.distribution['TimeSpanDays'].tolist() == [2, 3, 4]
+    # Suffix minima by start date: a 3 3 4, b 0 0 0, c 4 4 4
+    assert result.distribution['p50'].tolist() == [4.0, 3.0, 3.0]
+    assert result.summary.set_index('Scenario')['MinimumDate']['b'] == pd.Timestamp('2025-01-04')
+
+def test_zero_offset_is_the_pipeline(rows):
+    """Without a perturbation run_scenarios finds process_investment_algorithm's windows."""
+    matrix = data_processor.load_balance_matrix(conn=StreamingConnection(rows))
+    dates, flows = horizon_cash_flows(matrix, HORIZON)
+    offsets = np.vstack([np.zeros(len(dates)), scale_inflows(flows, [-20]), random_scenarios(flows, dates, 50)])
+    result = run_scenarios(matrix, offsets, horizon=HORIZON)
+    expected = process_investment_algorithm(matrix, workers=1, horizon=HORIZON)
+    base = result.windows[result.windows['Scenario'] == 0].drop(columns='Scenario')
+    pd.testing.assert_frame_equal(base[expected.columns].reset_index(drop=True), expected)
+    assert set(result.summary['Scenario']) == set(range(52))
+    # Less cash is never more available
+    stressed = result.summary[result.summary['Scenario'] == 1]['MinimumBalance'].to_numpy()
+    assert (stressed <= result.summary[result.summary['Scenario'] == 0]['MinimumBalance'].to_numpy()).all()
+    with pytest.raises(ValueError):
+        run_scenarios(matrix, offsets[:, 1:], horizon=HORIZON)
+
+def test_perturbation_builders():
+    flows = np.array([100., -50, 0, 30, -80])
+    np.testing.assert_array_equal(scale_inflows(flows, [10, -50]), [[10, 10, 10, 13, 13], [-50, -50, -50, -65, -65]])
+    # Receipts two days later; a day earlier the first one stays on the first day
+    np.testing.assert_array_equal(shift_flows(flows, [2, -1], flows > 0), [[-100, -100, 0, -30, -30], [0, 0, 30, 0, 0]])
+    np.testing.assert_array_equal(shift_flows(flows, [0]), [[0, 0, 0, 0, 0]])
+    dates = pd.to_datetime(['2025-01-14', '2025-01-15', '2025-01-16', '2025-01-17', '2025-02-01'])
+    # The payroll of the 15th paid on the 17th, the one of Feb 1st after the horizon
+    np.testing.assert_array_equal(delay_payroll(flows, dates, [2]), [[0, 50, 50, 0, 80]])
+    np.testing.assert_array_equal(random_scenarios(flows, dates, 3, seed=1), random_scenarios(flows, dates, 3, seed=1))
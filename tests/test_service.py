@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+import pytest
+import pandas as pd
+import opportuneIQ
+from service import TreasuryService
+
+class FakeReport:
+    def to_dict(self):
+        return {'run': 'treasury-forecast', 'status': 'Success'}
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """A run_treasury_forecast stand-in that blocks until released and records its calls."""
+    monkeypatch.setenv('HORIZON_START', '2025-01-21')
+    monkeypatch.setenv('HORIZON_END', '2025-06-30')
+    monkeypatch.setenv('DB_NAME', 'treasury')
+    release = threading.Event()
+    calls = []
+
+    def run_treasury_forecast(db_config=None, horizon=None, executor=None):
+        calls.append((db_config, horizon))
+        release.wait(5)
+        if db_config and db_config['database'] == 'broken':
+            raise RuntimeError('connection refused')
+        windows = pd.DataFrame({'Asset Class': ['Money Market'], 'StartDate': [pd.Timestamp('2025-02-01')]})
+        return windows, FakeReport()
+
+    monkeypatch.setattr(opportuneIQ, 'run_treasury_forecast', run_treasury_forecast)
+    return release, calls
+
+def test_duplicate_triggers_share_one_run(pipeline):
+    release, calls = pipeline
+
+    async def scenario():
+        service = TreasuryService(runs=2, algorithm_workers=1)
+        first, started = service.trigger()
+        second, started_again = service.trigger()
+        other, other_started = service.trigger({'database': 'tenant'})
+        assert started and not started_again and other_started
+        assert second is first and first.triggers == 2 and other is not first
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first.done.wait(), other.done.wait()), 5)
+        assert first.status == 'succeeded' and len(first.windows) == 1
+        # A finished run isn't joined: the next trigger starts a new one
+        third, started = service.trigger()
+        await asyncio.wait_for(third.done.wait(), 5)
+        service.close()
+        return started
+
+    assert asyncio.run(scenario())
+    assert [db_config for db_config, _ in calls] == [None, {'database': 'tenant'}, None]
+
+def test_databases_on_other_ports_are_other_runs(pipeline):
+    """The trigger key is the database's host, port and name: another port is another tenant's run."""
+    release, calls = pipeline
+    release.set()
+
+    async def scenario():
+        service = TreasuryService(runs=2, algorithm_workers=1)
+        runs = [service.trigger({'host': 'db1', 'port': port, 'database': 'tenant'}) for port in (3306, 3307, 3306)]
+        await asyncio.wait_for(asyncio.gather(*(run.done.wait() for run, _ in runs)), 5)
+        service.close()
+        return runs
+
+    (first, started), (other, other_started), (joined, joined_started) = asyncio.run(scenario())
+    assert started and other_started and not joined_started
+    assert other is not first and joined is first
+    assert [db_config['port'] for db_config, _ in calls] == [3306, 3307]
+
+def test_history_is_bounded(pipeline):
+    release, _ = pipeline
+    release.set()
+
+    async def scenario():
+        service = TreasuryService(runs=1, history=2, algorithm_workers=1)
+        for database in ('a', 'b', 'c', 'd'):
+            run, _ = service.trigger({'database': database})
+            await asyncio.wait_for(run.done.wait(), 5)
+        service.trigger({'database': 'e'})
+        return service
+
+    service = asyncio.run(scenario())
+    assert [run.key[2] for run in service.runs.values()] == ['d', 'e']
+    service.close()
+
+async def request(port, method, path, body=None, content_length=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    content = json.dumps(body).encode() if body is not None else b''
+    content_length = len(content) if content_length is None else content_length
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {content_length}\r\n\r\n'.encode() + content)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+def test_http_endpoints(pipeline):
+    """Status is served while the run is in progress; the result once it is finished."""
+    release, calls = pipeline
+
+    async def scenario():
+        service = TreasuryService(runs=2, algorithm_workers=1)
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        status, run = await request(port, 'POST', '/runs')
+        assert status == 202 and run['status'] == 'running' and not run['coalesced']
+        status, joined = await request(port, 'POST', '/runs', {})
+        assert joined['run_id'] == run['run_id'] and joined['coalesced'] and joined['triggers'] == 2
+        assert await request(port, 'GET', '/health') == (200, {'status': 'ok', 'in_flight': 1})
+        status, pending = await request(port, 'GET', f"/runs/{run['run_id']}/result")
+        assert status == 409 and pending['status'] == 'running'
+        release.set()
+        status, result = await request(port, 'GET', f"/runs/{run['run_id']}/result?wait=5")
+        assert status == 200 and result['status'] == 'succeeded'
+        assert result['windows'] == [{'Asset Class': 'Money Market', 'StartDate': '2025-02-01T00:00:00.000'}]
+        assert result['report'] == {'run': 'treasury-forecast', 'status': 'Success'}
+        status, broken = await request(port, 'POST', '/runs', {'database': 'broken'})
+        status, failed = await request(port, 'GET', f"/runs/{broken['run_id']}/result?wait=5")
+        assert status == 500 and failed['error'] == 'connection refused'
+        status, runs = await request(port, 'GET', '/runs')
+        assert [item['status'] for item in runs] == ['succeeded', 'failed']
+        assert (await request(port, 'GET', '/runs/unknown'))[0] == 404
+        assert (await request(port, 'POST', '/runs', 'not an object'))[0] == 400
+        for content_length in ('abc', '-1', ''):
+            assert await request(port, 'POST', '/runs', {}, content_length) == (400, {'error': f'Bad Content-Length {content_length!r}'})
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
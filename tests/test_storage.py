@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+import opportuneIQ
+from database_writer import publish_investment_windows, rollback_investment_windows
+from shared.storage import open_database, get_backend, EmbeddedCursor
+from snapshot import write_snapshot, export_snapshot, import_snapshot, read_tables
+
+HORIZON = ('2025-01-21', '2025-06-30')
+
+@pytest.fixture(params=['sqlite', 'duckdb'])
+def engine(request):
+    if request.param == 'duckdb':
+        pytest.importorskip('duckdb')
+    return request.param
+
+@pytest.fixture
+def snapshot(tmp_path, engine, rows, monkeypatch):
+    """A snapshot of the view rows and three asset classes, the default database of db_session()"""
+    path = tmp_path / f'treasury.{engine}'
+    write_snapshot(path, {
+        'RunningBalanceDayView': pd.DataFrame(rows, columns=['TransactionDate', 'TransactionClass', 'RunningTotal']),
+        'AssetClass': pd.DataFrame({
+            'ID': [1, 2, 3, 4], 'Title': ['Money Market', 'US Treasuries', 'Commercial Paper', 'Not Assigned'],
+            'Group': ['Cash', 'Bonds', 'Fixed Income', None], 'Issuer': None,
+            'PercentMax': [0.25, 0.5, None, None], 'AssetClassParentID': 0,
+        }),
+    }, engine)
+    monkeypatch.setenv('STORAGE_BACKEND', engine)
+    monkeypatch.setenv('STORAGE_PATH', str(path))
+    monkeypatch.setenv('HORIZON_START', HORIZON[0])
+    monkeypatch.setenv('HORIZON_END', HORIZON[1])
+    return path
+
+def published(path):
+    conn = open_database(path)
+    try:
+        return read_tables(conn=conn, tables=['InvestmentWindow'])['InvestmentWindow']
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize('mode', ['swap', 'transaction', 'diff', 'truncate'])
+def test_offline_pipeline_run(snapshot, monkeypatch, mode):
+    """The pipeline runs against the snapshot file and publishes its windows into it, in every mode."""
+    monkeypatch.setenv('INVESTMENT_WINDOW_PUBLISH_MODE', mode)
+    windows, report = opportuneIQ.run_treasury_forecast()
+    rows = published(snapshot)
+    assert report.status == 'Success' and len(rows) == len(windows) > 0
+    assert set(rows['ClassName']) == {'App\\Model\\InvestmentWindow'}
+    assert rows['ID'].is_unique and set(rows['AssetClassID']) <= {1, 2, 3}
+    assert rows['FromDate'].dtype.kind == 'M' and rows['Available'].dtype == np.float64
+    # A second run replaces the rows
+    opportuneIQ.run_treasury_forecast()
+    assert len(published(snapshot)) == len(windows)
+
+def test_swap_and_rollback(snapshot, monkeypatch):
+    """The swap mode keeps the previous windows, and rollback swaps them back."""
+    windows, _ = opportuneIQ.run_treasury_forecast()
+    conn = open_database(snapshot)
+    reference = pd.DataFrame({'AssetClassTitle': ['Money Market'], 'AssetClassID': [1]})
+    money_market = windows[windows['Asset Class'] == 'Money Market']
+    assert publish_investment_windows(money_market, reference, conn=conn, mode='swap')
+    assert set(published(snapshot)['AssetClassID']) == {1}
+    rollback_investment_windows(conn=conn)
+    assert len(published(snapshot)) == len(windows)
+    # A failed insert leaves the live table as it was
+    def failing_insert(cursor, query, rows):
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(EmbeddedCursor, 'executemany', failing_insert)
+    assert not publish_investment_windows(money_market, reference, conn=conn, mode='swap')
+    assert len(published(snapshot)) == len(windows)
+    conn.close()
+
+def test_transactions_follow_mysql(snapshot):
+    """Writes stay invisible to other connections until committed, and DDL commits them first."""
+    conn, other = open_database(snapshot), open_database(snapshot)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM `AssetClass` WHERE `ID` = %s", [4])
+    assert conn.in_transaction
+    conn.rollback()
+    cursor.execute("DELETE FROM `AssetClass` WHERE `ID` = %s", [4])
+    cursor.execute("CREATE TABLE Scratch (ID INTEGER)")
+    assert not conn.in_transaction
+    assert len(read_tables(conn=other, tables=['AssetClass'])['AssetClass']) == 3
+    cursor.execute("DELETE FROM `AssetClass`")
+    conn.close()
+    assert len(read_tables(conn=other, tables=['AssetClass'])['AssetClass']) == 3
+    other.close()
+
+def test_snapshot_round_trip(snapshot, tmp_path, engine):
+    """Exported and imported tables keep their rows and types, and the export can be cut to a horizon."""
+    opportuneIQ.run_treasury_forecast()
+    source = open_database(snapshot)
+    tables = read_tables(conn=source)
+    counts = export_snapshot(tmp_path / 'export.sqlite', conn=source, horizon=('2025-03-01', '2025-03-31'))
+    assert counts['RunningBalanceDayView'] == len(tables['RunningBalanceDayView'][
+        tables['RunningBalanceDayView']['TransactionDate'].between('2025-03-02', '2025-03-31')])
+    assert export_snapshot(tmp_path / f'full.{engine}', conn=source) == {table: len(df) for table, df in tables.items()}
+    target = open_database(tmp_path / 'imported.sqlite')
+    import_snapshot(tmp_path / f'full.{engine}', conn=target)
+    for table, df in read_tables(conn=target).items():
+        pd.testing.assert_frame_equal(df, tables[table], check_dtype=False)
+    assert read_tables(conn=target)['RunningBalanceDayView']['TransactionDate'].dtype.kind == 'M'
+    source.close()
+    target.close()
+
+def test_health_check_and_backend(snapshot, engine):
+    assert opportuneIQ.HealthCheck(check_database=True) == {'status': 'Healthy', 'database': 'treasury', 'error': None}
+    assert get_backend().name == engine and get_backend(object()).name == 'mysql'